@@ -0,0 +1,9 @@
+#!/bin/sh
+# Production entrypoint: apply migrations, then hand the process over to gunicorn.
+set -e
+
+export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-stackoverflow.settings_production}"
+
+python3 manage.py migrate --noinput
+
+exec gunicorn -c gunicorn.conf.py
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+import shutil
+
+
+# SERVER_MODE picks the worker model, see stackoverflow/settings_production.py
+#   asgi  uvicorn workers, cores + 1 of them. posts/urls.py routes the feed, detail, answers
+#         and tags endpoints to the async views.
+#   wsgi  gthread workers, 2 * cores + 1 of them with WEB_THREADS threads each, serving the
+#         sync versions of those views.
+# The worker counts are starting points, not measured ones. Size WEB_CONCURRENCY and
+# WEB_THREADS for the host with locust_compare.py before relying on either mode.
+server_mode = os.getenv('SERVER_MODE', 'asgi')
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+
+if server_mode == 'asgi':
+    wsgi_app = 'stackoverflow.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    workers = int(os.getenv('WEB_CONCURRENCY', cores + 1))
+else:
+    wsgi_app = 'stackoverflow.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.getenv('WEB_CONCURRENCY', cores * 2 + 1))
+    threads = int(os.getenv('WEB_THREADS', '4'))
+
+# recycle workers now and then so a slow leak can't grow forever, jittered so they don't restart together
+max_requests = int(os.getenv('MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-' if os.getenv('ACCESS_LOG', 'false') == 'true' else None
+errorlog = '-'
+
+
+# Every worker has its own prometheus registry. With PROMETHEUS_MULTIPROC_DIR set the workers
+# write their metrics to files there and /metrics on any worker reports the sum of all of them.
+def on_starting(server):
+    multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        # files of a previous run would be added to the new counters
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
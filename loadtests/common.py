@@ -0,0 +1,139 @@
+import bisect
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from locust import HttpUser, events
+
+
+# written by `python manage.py seed_load_test`
+SEED_FILE = os.getenv('LOCUST_SEED_FILE', 'locust_seed.json')
+# simplejwt hands out 5 minute access tokens, renew them a little earlier
+TOKEN_TTL = int(os.getenv('LOCUST_TOKEN_TTL', '240'))
+# how skewed question popularity is, ~1 is what Q&A sites see
+ZIPF_S = float(os.getenv('LOCUST_ZIPF_S', '1.1'))
+
+with open(SEED_FILE) as seed_file:
+    SEED = json.load(seed_file)
+
+
+class Zipf:
+    """Pick items by rank, the item of rank k with a probability proportional to 1 / k ** s."""
+
+    def __init__(self, items, s=ZIPF_S):
+        self.items = items
+        self.cumulative = list(itertools.accumulate(1 / rank ** s for rank in range(1, len(items) + 1)))
+
+    def pick(self):
+        return self.items[bisect.bisect(self.cumulative, random.random() * self.cumulative[-1])]
+
+
+questions = Zipf(SEED['question_ids'])
+answers = Zipf(SEED['answer_ids'])
+tags = Zipf(SEED['tags'])
+search_words = Zipf(SEED['search_words'])
+
+
+class TokenCache:
+    """
+    JWTs per account, shared by every simulated user of the process. Logging in hashes the
+    password on the server, so an account logs in once and then only refreshes its token.
+    """
+
+    def __init__(self):
+        self.tokens = {}
+        self.locks = defaultdict(threading.Lock)
+
+    def access_token(self, client, email, force=False):
+        with self.locks[email]:
+            token = self.tokens.get(email)
+            if token and not force and time.monotonic() - token['obtained'] < TOKEN_TTL:
+                return token['access']
+
+            if token:
+                response = client.post('/login/token/refresh/', json={'refresh':token['refresh']}, name='/login/token/refresh/')
+                if response.status_code == 200:
+                    token.update(access=response.json()['access'], obtained=time.monotonic())
+                    return token['access']
+
+            response = client.post('/login/token/', json={'email':email, 'password':SEED['password']}, name='/login/token/')
+            response.raise_for_status()
+            self.tokens[email] = {**response.json(), 'obtained':time.monotonic()}
+            return self.tokens[email]['access']
+
+
+token_cache = TokenCache()
+_accounts = itertools.cycle(SEED['emails'])
+
+
+class AuthenticatedUser(HttpUser):
+    """A simulated user logged in as one of the seeded accounts, several users may share one."""
+
+    abstract = True
+
+    def on_start(self):
+        self.email = next(_accounts)
+
+    def auth(self, force=False):
+        return {'Authorization':f'Bearer {token_cache.access_token(self.client, self.email, force)}'}
+
+    def send(self, method, path, name, **kwargs):
+        """Request with the account's token, renewing it and retrying once if it was rejected."""
+        for attempt in range(2):
+            with self.client.request(method, path, name=name, headers=self.auth(force=attempt > 0),
+                                     catch_response=True, **kwargs) as response:
+                if attempt == 0 and response.status_code == 401 and 'token_not_valid' in response.text:
+                    response.success()
+                    continue
+                self.check(response)
+                return response
+
+    def check(self, response):
+        # voting on your own post is refused with a 401, that is the app working
+        if response.status_code < 400 or 'your own' in response.text:
+            response.success()
+        else:
+            response.failure(f'{response.status_code}: {response.text[:200]}')
+
+
+# Cache hit ratio per key family over the run, from the stackoverflow_cache_requests_total
+# counter the app exports. Set LOCUST_METRICS_URL to the app's /metrics.
+
+METRICS_URL = os.getenv('LOCUST_METRICS_URL')
+CACHE_SAMPLE = re.compile(r'^stackoverflow_cache_requests_total\{family="([^"]+)",result="([^"]+)"\} ([0-9.e+]+)$', re.M)
+_cache_counts = {}
+
+
+def cache_counts():
+    text = requests.get(METRICS_URL, timeout=5).text
+    return {(family, result): float(value) for family, result, value in CACHE_SAMPLE.findall(text)}
+
+
+@events.test_start.add_listener
+def remember_cache_counts(environment, **kwargs):
+    if METRICS_URL:
+        _cache_counts.update(cache_counts())
+
+
+@events.test_stop.add_listener
+def report_cache_hit_ratio(environment, **kwargs):
+    if not METRICS_URL:
+        return
+    after = cache_counts()
+    per_family = defaultdict(lambda: defaultdict(float))
+    for (family, result), value in after.items():
+        per_family[family][result] += value - _cache_counts.get((family, result), 0)
+
+    print(f'\n{"cache family":<24}{"lookups":>10}{"hit ratio":>11}  hit / stale / refresh / miss')
+    for family, results in sorted(per_family.items()):
+        total = sum(results.values())
+        if total:
+            served = results['hit'] + results['stale']
+            print(f'{family:<24}{total:>10.0f}{served / total:>10.1%}  '
+                  f'{results["hit"]:.0f} / {results["stale"]:.0f} / {results["refresh"]:.0f} / {results["miss"]:.0f}')
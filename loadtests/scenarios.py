@@ -0,0 +1,125 @@
+import random
+
+from locust import HttpUser, task, between
+
+from .common import AuthenticatedUser, questions, answers, tags, search_words
+
+
+# The share of each kind of visitor is its class weight. Every scenario picks questions by
+# popularity rank from a Zipf distribution, so a handful of threads take most of the traffic
+# like on the real site, and writers land on the same hot threads readers keep cached.
+
+
+class Reader(HttpUser):
+    """Anonymous browsing: the feed a few pages deep, hot threads, tag pages."""
+
+    weight = 60
+    wait_time = between(1, 5)
+
+    @task(6)
+    def question(self):
+        self.client.get(f'/api/question/{questions.pick()}/detail/', name='/api/question/[id]/detail/')
+
+    @task(3)
+    def feed(self):
+        url = '/api/questions/'
+        for _ in range(random.randint(1, 3)):
+            response = self.client.get(url, name='/api/questions/')
+            url = response.json().get('next') if response.ok else None
+            if not url:
+                break
+
+    @task(2)
+    def hot(self):
+        self.client.get('/api/questions/hot/')
+
+    @task(2)
+    def tag(self):
+        self.client.get(f'/api/tags/{tags.pick()}/questions/?sort={random.choice(("newest", "votes"))}',
+                        name='/api/tags/[tag]/questions/')
+
+    @task(1)
+    def tag_list(self):
+        self.client.get(random.choice(('/api/tags/', '/api/tags/popular/')))
+
+
+class Searcher(HttpUser):
+    """Types a query letter by letter into the typeahead, then runs the search."""
+
+    weight = 10
+    wait_time = between(2, 8)
+
+    @task
+    def search(self):
+        words = [search_words.pick() for _ in range(random.randint(1, 2))]
+        query = ' '.join(words)
+        for end in range(2, len(words[0]) + 1):
+            self.client.get(f'/api/suggest/?q={words[0][:end]}', name='/api/suggest/')
+        self.client.get(f'/api/questions/?search={query}', name='/api/questions/?search=')
+
+
+class Voter(AuthenticatedUser):
+    """Reads hot threads and votes on them, which moves counters, feeds and reputation."""
+
+    weight = 15
+    wait_time = between(2, 6)
+
+    def on_start(self):
+        super().on_start()
+        self.voted = []
+
+    @task(3)
+    def vote_question(self):
+        question_id = questions.pick()
+        self.send('GET', f'/api/question/{question_id}/answers/', '/api/question/[id]/answers/')
+        response = self.send('POST', f'/api/question/{question_id}/{random.choice(("upvote", "upvote", "downvote"))}/',
+                             '/api/question/[id]/[vote]/')
+        if response.ok:
+            self.voted.append(question_id)
+
+    @task(2)
+    def vote_answer(self):
+        if answers.items:
+            self.send('POST', f'/api/answer/{answers.pick()}/{random.choice(("upvote", "upvote", "downvote"))}/',
+                      '/api/answer/[id]/[vote]/')
+
+    @task(1)
+    def retract(self):
+        if self.voted:
+            question_id = self.voted.pop(random.randrange(len(self.voted)))
+            self.send('DELETE', f'/api/question/{question_id}/vote/delete/', '/api/question/[id]/vote/delete/')
+
+
+class Commenter(AuthenticatedUser):
+    """Comments on hot questions and answers, each comment invalidates a cached thread."""
+
+    weight = 10
+    wait_time = between(3, 10)
+
+    @task(2)
+    def comment_question(self):
+        question_id = questions.pick()
+        self.client.get(f'/api/question/{question_id}/detail/', name='/api/question/[id]/detail/')
+        self.send('POST', f'/api/comment/question/{question_id}/create/', '/api/comment/question/[id]/create/',
+                  json={'comment_description':'Could you share the full traceback?'})
+
+    @task(1)
+    def comment_answer(self):
+        if answers.items:
+            self.send('POST', f'/api/comment/answer/{answers.pick()}/create/', '/api/comment/answer/[id]/create/',
+                      json={'comment_description':'This fixed it for me, thanks.'})
+
+
+class Answerer(AuthenticatedUser):
+    """Reads a thread and its answers, then answers it."""
+
+    weight = 5
+    wait_time = between(5, 15)
+
+    @task
+    def answer(self):
+        question_id = questions.pick()
+        self.client.get(f'/api/question/{question_id}/detail/', name='/api/question/[id]/detail/')
+        self.send('GET', f'/api/question/{question_id}/answers/', '/api/question/[id]/answers/')
+        self.send('POST', f'/api/question/{question_id}/answer/create/', '/api/question/[id]/answer/create/',
+                  json={'answer_description':'You can keep the connection open and reuse it across requests.'})
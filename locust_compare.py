@@ -0,0 +1,71 @@
+"""
+Run the same headless locust load against two deployments and compare them.
+
+    docker compose up web
+    docker compose --profile production up web-production
+    python locust_compare.py --baseline http://localhost:8000 --candidate http://localhost:8001
+
+Both runs use locustfile.py with the same users, spawn rate and duration. The csv
+reports are kept in --out, the table compares the aggregated row of each endpoint.
+"""
+
+import argparse
+import csv
+import os
+import subprocess
+import sys
+
+
+COLUMNS = [
+    ('Requests/s', 'req/s'),
+    ('Median Response Time', 'p50 ms'),
+    ('95%', 'p95 ms'),
+    ('99%', 'p99 ms'),
+    ('Failure Count', 'failures'),
+]
+
+
+def run_locust(host, prefix, options):
+    subprocess.run([
+        sys.executable, '-m', 'locust', '-f', options.locustfile, '--headless',
+        '--host', host, '--users', str(options.users), '--spawn-rate', str(options.spawn_rate),
+        '--run-time', options.run_time, '--csv', prefix, '--only-summary',
+    ], check=False)
+    with open(f'{prefix}_stats.csv', newline='') as stats:
+        return {row['Name']: row for row in csv.DictReader(stats)}
+
+
+def change(before, after):
+    if not before:
+        return ''
+    return f'{(after - before) / before * 100:+.0f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', default='http://localhost:8000', help='the current setup')
+    parser.add_argument('--candidate', default='http://localhost:8001', help='the setup to compare with it')
+    parser.add_argument('--locustfile', default='locustfile.py')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--spawn-rate', type=int, default=20)
+    parser.add_argument('--run-time', default='2m')
+    parser.add_argument('--out', default='locust_results')
+    options = parser.parse_args()
+
+    os.makedirs(options.out, exist_ok=True)
+    baseline = run_locust(options.baseline, os.path.join(options.out, 'baseline'), options)
+    candidate = run_locust(options.candidate, os.path.join(options.out, 'candidate'), options)
+
+    print(f'\n{"endpoint":<40}' + ''.join(f'{label:>26}' for _, label in COLUMNS))
+    for name in baseline:
+        if name not in candidate:
+            continue
+        cells = []
+        for column, _ in COLUMNS:
+            before, after = float(baseline[name][column] or 0), float(candidate[name][column] or 0)
+            cells.append(f'{before:>8.1f} -> {after:<8.1f} {change(before, after):>5}')
+        print(f'{name[:40]:<40}' + ''.join(f'{cell:>26}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,6 @@
+# Mixed workload of loadtests/scenarios.py. Seed the accounts and the ids to pick from first:
+#       python3 manage.py seed_load_test --out locust_seed.json
+#       LOCUST_METRICS_URL=http://localhost:8000/metrics locust -f locustfile.py --host http://localhost:8000
+# LOCUST_METRICS_URL is optional, with it the cache hit ratio of the run is printed at the end.
 
-from locust import HttpUser, task, between
-
-import random
-
-class LoadTesterUser(HttpUser):
-    wait_time = between(1,5)
-
-    @task
-    def load_main_page(self):
-        self.client.get('/')
-
-    @task
-    def all_questions(self):
-        self.client.get('/api/questions/')
-
-    @task
-    def get_question(self):
-        question_id = random.randint(1, 800)
-        self.client.get(f'/api/question/{question_id}/detail/')
-
-    @task
-    def get_tags(self):
-        self.client.get('/api/tags/')
-
-    @task
-    def get_answer_for_question(self):
-        question_id = random.randint(1, 1000)
-        self.client.get(f'/question/{question_id}/answers/')
-
+from loadtests.scenarios import Reader, Searcher, Voter, Commenter, Answerer  # noqa: F401
@@ -1,10 +1,9 @@
 from django.contrib import admin
 
-from .models import Question, Tag, Answer, Comment
+from .models import Question, Tag, Answer, Comment, Vote
 
 admin.site.register(Question)
 admin.site.register(Tag)
 admin.site.register(Answer)
 admin.site.register(Comment)
-
-
+admin.site.register(Vote)
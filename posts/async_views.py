@@ -0,0 +1,254 @@
+import asyncio
+import inspect
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import aprefetch_related_objects
+from django.views.decorators.csrf import csrf_exempt
+
+from rest_framework import status
+from rest_framework.decorators import permission_classes
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Tag, Question, Answer, question_detail_prefetch
+from .serializers import TagSerializer, AllQuestionsSerializer, AllAnswerSerializer, DetailQuestionView
+from .pagination import SearchPagination, QuestionCursorPagination
+from .counters import arecord_question_view
+from .caches import feed_cache, summary_cache, detail_cache, answers_cache, tags_cache, search_cache, afeed_page_key
+from .helper import question_not_found, valid_date
+from .search import MAX_RESULT_WINDOW, search_questions, search_cache_key
+
+
+# The hottest read endpoints as native async views, routed instead of their posts.views
+# versions when the site runs under ASGI. Redis is reached with redis.asyncio and the database
+# with the async ORM, so independent lookups of one request run concurrently and a worker
+# keeps serving other requests while one waits on I/O. DRF's @api_view is sync only,
+# @async_api_view is its counterpart for coroutines.
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView with coroutine handlers, built by @async_api_view. `adispatch` is APIView.dispatch:
+    authentication, permission and throttle checks, content negotiation and the exception
+    handler run around the handler the same way.
+    """
+
+    def checks_block(self, request):
+        # authenticating a token looks the user up and throttles count requests in the cache.
+        # Without either the checks are plain python and run on the event loop.
+        return bool(self.throttle_classes) or 'HTTP_AUTHORIZATION' in request.META
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            if self.checks_block(request):
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+            else:
+                self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        return self.finalize_response(request, response, *args, **kwargs)
+
+
+def async_api_view(http_method_names):
+    """
+    @api_view for coroutines. drf_yasg lists the view class it builds, and the
+    @permission_classes / @throttle_classes of the view apply like on a sync view.
+    """
+    def decorator(func):
+        def handler(self, *args, **kwargs):
+            return func(*args, **kwargs)
+
+        view_class = type(func.__name__, (AsyncAPIView,), {
+            **{method.lower(): handler for method in http_method_names},
+            'http_method_names': [method.lower() for method in http_method_names] + ['options'],
+            'permission_classes': getattr(func, 'permission_classes', AsyncAPIView.permission_classes),
+            'throttle_classes': getattr(func, 'throttle_classes', AsyncAPIView.throttle_classes),
+            '__doc__': func.__doc__,
+            '__module__': func.__module__,
+        })
+
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            return await view_class().adispatch(request, *args, **kwargs)
+
+        view = csrf_exempt(view)
+        view.cls = view_class
+        view.initkwargs = {}
+        return view
+    return decorator
+
+
+async def question_summaries(question_ids):
+    """Async `views.question_summaries`, feed rows from cache, the missing ones from the database."""
+    keys = {question_id: summary_cache.key(question_id) for question_id in question_ids}
+    cached = await summary_cache.aget_many(list(keys.values()))
+
+    missing = [question_id for question_id, key in keys.items() if key not in cached]
+    if missing:
+        questions = [question async for question in Question.objects.for_list().filter(question_id__in=missing)]
+        rendered = {summary_cache.key(row['question_id']): row for row in AllQuestionsSerializer(questions, many=True).data}
+        await summary_cache.aset_many(rendered)
+        cached.update(rendered)
+
+    return [cached[key] for key in keys.values() if key in cached]
+
+
+@async_api_view(['GET'])
+@permission_classes([AllowAny])
+async def all_question(request):
+    search_query = request.query_params.get('search', None)
+    if search_query:
+        return await search_page(request, search_query)
+
+    paginator = QuestionCursorPagination()
+    page_key = await afeed_page_key(paginator.get_cursor(request), paginator.get_page_size(request))
+
+    async def build_page():
+        page = await paginator.apaginate_queryset(Question.objects.for_list(), request)
+        data = AllQuestionsSerializer(page, many=True).data
+        await summary_cache.aset_many({summary_cache.key(row['question_id']): row for row in data})
+        return {'ids':[row['question_id'] for row in data], 'next_cursor':paginator.next_cursor,
+                'previous_cursor':paginator.previous_cursor}
+
+    cached_page = await feed_cache.aget_or_build(page_key, build_page, cache_if=lambda page: page['next_cursor'] is not None)
+
+    paginator.request = request
+    paginator.next_cursor = cached_page['next_cursor']
+    paginator.previous_cursor = cached_page.get('previous_cursor')
+    return paginator.get_paginated_response({
+        'status':status.HTTP_200_OK,
+        'message':'All questions',
+        'data':await question_summaries(cached_page['ids'])
+    })
+
+
+async def search_page(request, search_query):
+    tags = [tag.strip() for tag in request.query_params.get('tags', '').split(',') if tag.strip()]
+    created_after = request.query_params.get('created_after') or None
+    created_before = request.query_params.get('created_before') or None
+    for value in (created_after, created_before):
+        if value and not valid_date(value):
+            return Response({
+                'status':status.HTTP_400_BAD_REQUEST,
+                'message':f'Invalid date "{value}", use YYYY-MM-DD or an ISO 8601 datetime.'
+            }, status.HTTP_400_BAD_REQUEST)
+
+    paginator = SearchPagination()
+    page, page_size = paginator.get_page(request)
+    if (page - 1) * page_size >= MAX_RESULT_WINDOW:
+        raise NotFound(f'Only the first {MAX_RESULT_WINDOW} results can be paged through, narrow the search.')
+    cache_key = search_cache.key(
+        await search_cache.ageneration(),
+        search_cache_key(search_query, tags, created_after, created_before, page, page_size)
+    )
+    # the elasticsearch client is sync, it runs in a worker thread
+    result = await search_cache.aget_or_build(cache_key, sync_to_async(lambda: search_questions(
+        search_query, tags=tags, created_after=created_after, created_before=created_before,
+        page=page, page_size=page_size
+    ), thread_sensitive=False))
+
+    return paginator.get_paginated_response({
+        'status':status.HTTP_200_OK,
+        'message':f'Search result for "{search_query}"',
+        'data':result['results']
+    }, count=result['count'])
+
+
+async def question_views(question_id):
+    """The views column of the question, None when it does not exist."""
+    return await Question.objects.filter(question_id=question_id).values_list('views', flat=True).afirst()
+
+
+@async_api_view(['GET'])
+@permission_classes([AllowAny])
+async def detail_question_view(request, question_id):
+
+    async def build_detail():
+        question = await Question.objects.aget(question_id=question_id)
+        await aprefetch_related_objects([question], *question_detail_prefetch())
+        return DetailQuestionView(question).data
+
+    try:
+        question_id = int(question_id)
+    except ValueError:
+        return question_not_found(question_id)
+    key = detail_cache.key(question_id)
+
+    # the views column and the cached thread are independent, read them together
+    views, envelope = await asyncio.gather(question_views(question_id), detail_cache.aget_raw(key))
+    if views is None:
+        # a missing question never builds, nor takes the rebuild lock
+        return question_not_found(question_id)
+
+    # view hits are buffered in redis and flushed to postgres by the flush_question_views task,
+    # the hit is counted while a cold thread is built
+    try:
+        data, pending = await asyncio.gather(
+            detail_cache.aget_or_build(key, build_detail, envelope=envelope),
+            arecord_question_view(question_id),
+        )
+    except Question.DoesNotExist:
+        # deleted since the check
+        return question_not_found(question_id)
+
+    data['views'] = views + pending
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Question {question_id}.',
+        'data':data
+    })
+
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def get_answers_for_question(request, question_id):
+
+    async def build_answers():
+        if not await Question.objects.filter(question_id=question_id).aexists():
+            raise Question.DoesNotExist
+        answers = [answer async for answer in Answer.objects.filter(question_id=question_id).for_thread()]
+        return AllAnswerSerializer(answers, many=True).data
+
+    try:
+        data = await answers_cache.aget_or_build(answers_cache.key(question_id), build_answers)
+    except (Question.DoesNotExist, ValueError):
+        return question_not_found(question_id)
+
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Answers for question {question_id}',
+        'data':data
+    })
+
+
+@async_api_view(['GET'])
+@permission_classes([AllowAny])
+async def all_tags(request):
+
+    async def build_tags():
+        tags = [tag async for tag in Tag.objects.all().order_by('tag_id')]
+        return TagSerializer(tags, many=True).data
+
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':'All tags.',
+        'data':await tags_cache.aget_or_build(tags_cache.key(), build_tags)
+    })
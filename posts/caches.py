@@ -0,0 +1,36 @@
+from stackoverflow.caching import CacheFamily
+
+
+# feed pages hold only question ids, the rendered rows live in summary_cache
+feed_cache = CacheFamily('all_questions')
+summary_cache = CacheFamily('question_summary')
+detail_cache = CacheFamily('detail_question')
+answers_cache = CacheFamily('question_answers', timeout=60)
+tags_cache = CacheFamily('all_tags')
+# searches are only dropped all at once when a question is deleted, otherwise they age out
+search_cache = CacheFamily('search_results', timeout=120)
+
+
+def feed_page_key(cursor, page_size):
+    return feed_cache.key(f'g{feed_cache.generation()}', cursor or 'first', page_size)
+
+
+def invalidate_question(question_id, summary=False, answers=False):
+    """Drop the cached detail of a question, and optionally its feed row and answers."""
+    keys = [detail_cache.key(question_id)]
+    if summary:
+        keys.append(summary_cache.key(question_id))
+    if answers:
+        keys.append(answers_cache.key(question_id))
+    detail_cache.delete(*keys)
+
+
+def invalidate_feed():
+    # only needed when rows disappear from the middle of the feed, new questions
+    # land on the last page which is never cached
+    feed_cache.bump()
+    search_cache.bump()
+
+
+async def afeed_page_key(cursor, page_size):
+    return feed_cache.key(f'g{await feed_cache.ageneration()}', cursor or 'first', page_size)
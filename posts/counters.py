@@ -0,0 +1,181 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from django_redis import get_redis_connection
+
+from stackoverflow.caching import async_redis
+
+from .models import Tag, Question, Answer
+from .indexing import enqueue_question_ids
+
+
+# pending view hits live in redis until `flush_view_buffer` moves them to postgres
+VIEWS_KEY = 'question_views:{}'
+VIEWS_DIRTY_KEY = 'question_views:dirty'
+
+# tag ids scored by question_count, with their titles alongside for rendering
+POPULAR_TAGS_KEY = 'popular_tags'
+POPULAR_TAG_TITLES_KEY = 'popular_tags:titles'
+
+# top `limit` tags with their titles in a single round trip
+POPULAR_TAGS_SCRIPT = """
+local ranked = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1, 'WITHSCORES')
+local titles = {}
+for i = 1, #ranked, 2 do
+    titles[#titles + 1] = redis.call('HGET', KEYS[2], ranked[i]) or ''
+end
+return {ranked, titles}
+"""
+
+MOVE_POPULAR_TAG_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('ZINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+
+def record_question_view(question_id):
+    """Buffer one view hit and return the number of hits not yet flushed."""
+    redis = get_redis_connection('default')
+    pipe = redis.pipeline()
+    pipe.incr(VIEWS_KEY.format(question_id))
+    pipe.sadd(VIEWS_DIRTY_KEY, question_id)
+    pending, _ = pipe.execute()
+    return pending
+
+
+async def arecord_question_view(question_id):
+    # same keys as record_question_view, django_redis does not prefix raw connection commands
+    pipe = async_redis().pipeline()
+    pipe.incr(VIEWS_KEY.format(question_id))
+    pipe.sadd(VIEWS_DIRTY_KEY, question_id)
+    pending, _ = await pipe.execute()
+    return pending
+
+
+def flush_view_buffer(batch_size=500):
+    """
+    Move buffered view hits into `Question.views`.
+    Every batch is applied with a single `UPDATE ... SET views = views + CASE ...`,
+    so no row is read back and the `post_save` signals do not fire.
+    """
+    redis = get_redis_connection('default')
+    flushed = 0
+
+    while True:
+        question_ids = redis.spop(VIEWS_DIRTY_KEY, batch_size)
+        if not question_ids:
+            return flushed
+
+        pipe = redis.pipeline()
+        for question_id in question_ids:
+            pipe.getdel(VIEWS_KEY.format(int(question_id)))
+        counts = {
+            int(question_id): int(count)
+            for question_id, count in zip(question_ids, pipe.execute())
+            if count
+        }
+        if not counts:
+            continue
+
+        try:
+            with transaction.atomic():
+                Question.objects.filter(question_id__in=counts).update(
+                    views=F('views') + Case(
+                        *[When(question_id=question_id, then=Value(count)) for question_id, count in counts.items()],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                )
+        except Exception:
+            # put the hits back so the next flush retries them
+            pipe = redis.pipeline()
+            for question_id, count in counts.items():
+                pipe.incrby(VIEWS_KEY.format(question_id), count)
+                pipe.sadd(VIEWS_DIRTY_KEY, question_id)
+            pipe.execute()
+            raise
+
+        flushed += sum(counts.values())
+        # views feed the search ranking
+        enqueue_question_ids(counts)
+
+
+def adjust_comments_count(comment, delta):
+    """
+    Move the comments_count of the question or answer `comment` belongs to by `delta`.
+    A single `UPDATE ... SET comments_count = comments_count + delta`, so concurrent
+    comments can not overwrite each other and the text columns are not rewritten.
+    """
+    if comment.question_id:
+        return Question.objects.filter(question_id=comment.question_id).update(comments_count=F('comments_count') + delta)
+    return Answer.objects.filter(answer_id=comment.answer_id).update(comments_count=F('comments_count') + delta)
+
+
+def adjust_question_counts(tag_deltas):
+    """
+    Move the question_count of each tag in `tag_deltas` ({tag_id: delta}) with one
+    `F()` update per distinct delta, and the popular tags sorted set once committed.
+    """
+    tag_deltas = {tag_id: delta for tag_id, delta in tag_deltas.items() if delta}
+    if not tag_deltas:
+        return
+
+    by_delta = defaultdict(list)
+    for tag_id, delta in tag_deltas.items():
+        by_delta[delta].append(tag_id)
+    for delta, tag_ids in by_delta.items():
+        Tag.objects.filter(tag_id__in=tag_ids).update(question_count=F('question_count') + delta)
+
+    transaction.on_commit(lambda: _move_popular_tags(tag_deltas))
+
+
+def _move_popular_tags(tag_deltas):
+    # a missing set is rebuilt from the database on the next read, which already holds these deltas
+    redis = get_redis_connection('default')
+    move = redis.register_script(MOVE_POPULAR_TAG_SCRIPT)
+    pipe = redis.pipeline()
+    for tag_id, delta in tag_deltas.items():
+        move(keys=[POPULAR_TAGS_KEY], args=[delta, tag_id], client=pipe)
+    pipe.execute()
+
+
+def rebuild_popular_tags():
+    tags = list(Tag.objects.values_list('tag_id', 'tag_title', 'question_count'))
+    pipe = get_redis_connection('default').pipeline()
+    pipe.delete(POPULAR_TAGS_KEY, POPULAR_TAG_TITLES_KEY)
+    if tags:
+        pipe.zadd(POPULAR_TAGS_KEY, {tag_id: count for tag_id, _, count in tags})
+        pipe.hset(POPULAR_TAG_TITLES_KEY, mapping={tag_id: title for tag_id, title, _ in tags})
+    pipe.execute()
+
+
+def popular_tags(limit):
+    """The `limit` most used tags, read from the sorted set without touching the database."""
+    redis = get_redis_connection('default')
+    if not redis.exists(POPULAR_TAGS_KEY):
+        rebuild_popular_tags()
+    ranked, titles = redis.register_script(POPULAR_TAGS_SCRIPT)(keys=[POPULAR_TAGS_KEY, POPULAR_TAG_TITLES_KEY], args=[limit])
+    return [
+        {'tag_id':int(tag_id), 'tag_title':title.decode(), 'question_count':int(float(count))}
+        for tag_id, count, title in zip(ranked[::2], ranked[1::2], titles)
+    ]
+
+
+def reconcile_tag_counts():
+    """
+    Recompute every question_count from the through table with one
+    `UPDATE ... SET question_count = (SELECT COUNT(...))`, then reload the sorted set.
+    """
+    Through = Question.tags.through
+    totals = (Through.objects.filter(tag_id=OuterRef('pk'))
+              .order_by()
+              .values('tag_id')
+              .annotate(total=Count('question_id'))
+              .values('total'))
+    updated = Tag.objects.update(question_count=Coalesce(Subquery(totals), 0))
+    rebuild_popular_tags()
+    return updated
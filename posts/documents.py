@@ -1,11 +1,23 @@
-
-from .models import Question
+from .models import Question, Tag, Answer, Comment
 
 from django_elasticsearch_dsl.registries import registry
 from django_elasticsearch_dsl import Document, Index, fields
 
 @registry.register_document
 class QuestionDocument(Document):
+    # everything a search result page shows is in the document, so results need no database query
+    created_user = fields.ObjectField(properties={
+        'id': fields.IntegerField(),
+        'username': fields.KeywordField(),
+    })
+    tags = fields.ObjectField(properties={
+        'tag_id': fields.IntegerField(),
+        'tag_title': fields.KeywordField(),
+    })
+    answers = fields.TextField()
+    # typeahead, see posts/suggest.py
+    title_suggest = fields.CompletionField()
+
     class Index:
         name = 'questions'
         settings = {
@@ -15,7 +27,61 @@ class QuestionDocument(Document):
 
     class Django:
         model = Question
-        fields = ['question_title', 'question_description']
+        fields = ['question_id', 'question_title', 'question_description', 'views', 'votes_count', 'comments_count', 'created_at']
+        # users are left out on purpose, every user save would reindex all their questions;
+        # a renamed author shows up after the next rebuild
+        related_models = [Tag, Answer, Comment]
+        queryset_pagination = 1000
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('created_user').prefetch_related('tags', 'answers')
+
+    def get_instances_from_related(self, related_instance):
+        if isinstance(related_instance, Tag):
+            return related_instance.questions.all()
+        if isinstance(related_instance, Answer):
+            return related_instance.question
+        # only comments on the question itself move its comments_count
+        if isinstance(related_instance, Comment) and related_instance.question_id:
+            return related_instance.question
+
+    def prepare_created_user(self, instance):
+        return {'id': instance.created_user_id, 'username': instance.created_user.username}
+
+    def prepare_tags(self, instance):
+        return [{'tag_id': tag.tag_id, 'tag_title': tag.tag_title} for tag in instance.tags.all()]
+
+    def prepare_answers(self, instance):
+        return '\n'.join(answer.answer_description for answer in instance.answers.all())
+
+    def prepare_title_suggest(self, instance):
+        # a completion field only matches from the start of an input, so every word
+        # of the title starts one; better voted questions are suggested first
+        words = instance.question_title.split()[:20]
+        return {
+            'input': [' '.join(words[i:]) for i in range(len(words))],
+            'weight': max(instance.votes_count, 0) + 1,
+        }
+
+
+@registry.register_document
+class TagDocument(Document):
+    tag_suggest = fields.CompletionField()
+
+    class Index:
+        name = 'tags'
+        settings = {
+            'number_of_shards':1,
+            'number_of_replicas':0,
+        }
+
+    class Django:
+        model = Tag
+        fields = ['tag_id', 'tag_title']
+
+    def prepare_tag_suggest(self, instance):
+        return instance.tag_title
 
-#   to push existing data into elastic search 
-#           python3 manage.py search_index --rebuild
\ No newline at end of file
+#   to push existing data into elastic search
+#           python3 manage.py rebuild_question_index
+#           python3 manage.py search_index --rebuild --models posts.Tag
@@ -1,6 +1,7 @@
 
 
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -14,4 +15,18 @@ def handle_not_found(model, identifier, id_value):
             'status':status.HTTP_404_NOT_FOUND,
             'message': f'{model} not found.'
         }, status.HTTP_404_NOT_FOUND)
-    
+
+
+def question_not_found(question_id):
+    return Response({
+        'status':status.HTTP_404_NOT_FOUND,
+        'message':f'Question {question_id} not found.'
+    }, status.HTTP_404_NOT_FOUND)
+
+
+def valid_date(value):
+    # well formed but impossible dates like 2024-13-45 raise instead of returning None
+    try:
+        return bool(parse_date(value) or parse_datetime(value))
+    except ValueError:
+        return False
@@ -0,0 +1,102 @@
+import uuid
+from datetime import timedelta
+
+from django.db.models import Count, F, FloatField, Func, Value, DateTimeField
+from django.db.models.functions import Cast, Greatest, Log, Power
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from stackoverflow.caching import RELEASE_LOCK_SCRIPT
+from .models import Question
+
+
+# question ids scored by hotness, replaced as a whole by the refresh_hot_questions task
+HOT_KEY = 'hot_questions'
+# set instead of HOT_KEY when no question is recent enough to be hot, redis keeps no empty sets
+HOT_EMPTY_KEY = 'hot_questions:empty'
+HOT_LOCK_KEY = 'hot_questions:lock'
+HOT_LOCK_TIMEOUT = 60
+HOT_LIMIT = 500
+# only questions this recent can be hot, which keeps the scoring query on the created_at index
+HOT_WINDOW_DAYS = 30
+GRAVITY = 1.5
+
+
+class HoursBetween(Func):
+    """Hours from the second datetime expression to the first, as a float."""
+    arity = 2
+    arg_joiner = ' - '
+    template = 'CAST(EXTRACT(EPOCH FROM (%(expressions)s)) AS double precision) / 3600'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='(julianday(%(expressions)s)) * 24',
+                           arg_joiner=') - julianday(', **extra_context)
+
+
+def hot_score(now):
+    """
+    Activity, with views damped by a log, decayed by age like the stack overflow hot tab:
+    max(log10(views + 1) * 4 + answers * 2 + votes, 0) / (age_hours + 2) ** GRAVITY
+    """
+    activity = (Log(10, Cast(F('views') + 1, FloatField())) * 4
+                + Cast(Count('answers') * 2 + F('votes_count'), FloatField()))
+    age_hours = HoursBetween(Value(now, output_field=DateTimeField()), F('created_at'))
+    return Greatest(activity, Value(0.0)) / Power(age_hours + 2, GRAVITY)
+
+
+def refresh_hot_questions(limit=HOT_LIMIT):
+    """Score the recent questions in the database and store the best `limit` in redis."""
+    now = timezone.now()
+    top = dict(Question.objects
+               .filter(created_at__gte=now - timedelta(days=HOT_WINDOW_DAYS))
+               .annotate(hot_score=hot_score(now))
+               .order_by('-hot_score', '-question_id')
+               .values_list('question_id', 'hot_score')[:limit])
+
+    # built aside and renamed, so readers never see a half written list
+    redis = get_redis_connection('default')
+    building = f'{HOT_KEY}:building'
+    pipe = redis.pipeline()
+    pipe.delete(building)
+    if top:
+        pipe.zadd(building, {question_id: float(score) for question_id, score in top.items()})
+        pipe.rename(building, HOT_KEY)
+        pipe.delete(HOT_EMPTY_KEY)
+    else:
+        pipe.delete(HOT_KEY)
+        pipe.set(HOT_EMPTY_KEY, 1)
+    pipe.execute()
+    return len(top)
+
+
+def hot_question_page(page, page_size):
+    """Question ids of one page of the hot list and the length of the list."""
+    redis = get_redis_connection('default')
+    start = (page - 1) * page_size
+    pipe = redis.pipeline()
+    pipe.zrevrange(HOT_KEY, start, start + page_size - 1)
+    pipe.zcard(HOT_KEY)
+    pipe.exists(HOT_EMPTY_KEY)
+    question_ids, count, empty = pipe.execute()
+
+    if not count and not empty:
+        # never built, or lost with redis: one request scores the list, the others get an
+        # empty page until it is done or the beat task builds it
+        token = uuid.uuid4().hex
+        if not redis.set(HOT_LOCK_KEY, token, nx=True, ex=HOT_LOCK_TIMEOUT):
+            return [], 0
+        try:
+            refresh_hot_questions()
+        finally:
+            redis.eval(RELEASE_LOCK_SCRIPT, 1, HOT_LOCK_KEY, token)
+        pipe = redis.pipeline()
+        pipe.zrevrange(HOT_KEY, start, start + page_size - 1)
+        pipe.zcard(HOT_KEY)
+        question_ids, count = pipe.execute()
+
+    return [int(question_id) for question_id in question_ids], count
+
+
+def forget_question(question_id):
+    get_redis_connection('default').zrem(HOT_KEY, question_id)
@@ -0,0 +1,144 @@
+import logging
+from itertools import chain
+
+from django.conf import settings
+from django.db import models, transaction
+
+from django_elasticsearch_dsl.signals import BaseSignalProcessor
+from django_redis import get_redis_connection
+
+from stackoverflow.instrumentation import ELASTICSEARCH_SECONDS
+
+from .models import Question, Tag
+from .documents import QuestionDocument, TagDocument
+
+
+logger = logging.getLogger(__name__)
+
+
+# question ids waiting to be pushed to elasticsearch, a set so repeated saves coalesce
+PENDING_KEY = 'search_index:questions'
+SCHEDULED_KEY = 'search_index:scheduled'
+FLUSH_DELAY = 2
+
+
+def question_ids_for(instance):
+    """Ids of the questions whose search document depends on `instance`."""
+    if isinstance(instance, Question):
+        return [instance.question_id]
+    if not isinstance(instance, tuple(QuestionDocument.django.related_models)):
+        return []
+
+    related = QuestionDocument().get_instances_from_related(instance)
+    if related is None:
+        return []
+    if isinstance(related, models.QuerySet):
+        return list(related.values_list('question_id', flat=True))
+    if isinstance(related, Question):
+        return [related.question_id]
+    return [question.question_id for question in related]
+
+
+def enqueue_question_ids(question_ids):
+    question_ids = list(question_ids)
+    if not question_ids or not getattr(settings, 'ELASTICSEARCH_DSL_AUTOSYNC', True):
+        return
+
+    redis = get_redis_connection('default')
+    redis.sadd(PENDING_KEY, *question_ids)
+    # one flush per FLUSH_DELAY window, however many saves land in it
+    if redis.set(SCHEDULED_KEY, 1, nx=True, ex=FLUSH_DELAY):
+        from .tasks import flush_search_index
+        flush_search_index.apply_async(countdown=FLUSH_DELAY)
+
+
+def flush_pending_documents(batch_size=500):
+    """
+    Push every queued question to elasticsearch with the bulk API, `batch_size` at a time.
+    Questions that no longer exist are removed from the index.
+    """
+    redis = get_redis_connection('default')
+    document = QuestionDocument()
+    flushed = 0
+
+    while True:
+        question_ids = [int(question_id) for question_id in redis.spop(PENDING_KEY, batch_size) or []]
+        if not question_ids:
+            return flushed
+
+        try:
+            questions = list(document.get_queryset().filter(question_id__in=question_ids))
+            existing = {question.question_id for question in questions}
+            deleted = [Question(question_id=question_id) for question_id in question_ids if question_id not in existing]
+
+            actions = chain(document.get_actions(questions, 'index'), document.get_actions(deleted, 'delete'))
+            with ELASTICSEARCH_SECONDS.labels('bulk_index').time():
+                _, errors = document.bulk(actions, raise_on_error=False)
+        except Exception:
+            # keep the ids queued for the next flush
+            redis.sadd(PENDING_KEY, *question_ids)
+            raise
+
+        # deleting a question that was never indexed is not an error
+        errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+        if errors:
+            # every error item is {action: {'_id':..., 'status':..., 'error':...}}
+            failed = [item.get('_id') for error in errors for item in error.values()]
+            logger.error('Failed to index %d questions, ids %s. First error: %s', len(errors), failed, errors[0])
+        flushed += len(question_ids)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Queues search index updates instead of calling elasticsearch inside the request.
+    Ids are added once the transaction commits and flushed by the flush_search_index task.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+        models.signals.m2m_changed.connect(self.handle_m2m_changed)
+        models.signals.pre_delete.connect(self.handle_pre_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+        models.signals.m2m_changed.disconnect(self.handle_m2m_changed)
+        models.signals.pre_delete.disconnect(self.handle_pre_delete)
+
+    def enqueue(self, question_ids):
+        if question_ids:
+            transaction.on_commit(lambda: enqueue_question_ids(question_ids))
+
+    def update_tag(self, tag, action):
+        # tags are only written by admins, a direct update is cheap enough;
+        # copied because a deleted instance loses its pk before the commit
+        if getattr(settings, 'ELASTICSEARCH_DSL_AUTOSYNC', True):
+            tag = Tag(tag_id=tag.tag_id, tag_title=tag.tag_title)
+            transaction.on_commit(lambda: TagDocument().update(tag, action=action, raise_on_error=False))
+
+    def handle_save(self, sender, instance, **kwargs):
+        if isinstance(instance, Tag):
+            self.update_tag(instance, 'index')
+        self.enqueue(question_ids_for(instance))
+
+    def handle_m2m_changed(self, sender, instance, action, reverse=False, pk_set=None, **kwargs):
+        if action not in ('post_add', 'post_remove', 'pre_clear'):
+            return
+        if isinstance(instance, Question):
+            self.enqueue([instance.question_id])
+        elif reverse and pk_set and sender is Question.tags.through:
+            self.enqueue(list(pk_set))
+        else:
+            self.enqueue(question_ids_for(instance))
+
+    def handle_pre_delete(self, sender, instance, **kwargs):
+        # related rows have to be resolved while they still exist
+        if not isinstance(instance, Question):
+            self.enqueue(question_ids_for(instance))
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if isinstance(instance, Tag):
+            self.update_tag(instance, 'delete')
+        if isinstance(instance, Question):
+            self.enqueue([instance.question_id])
@@ -0,0 +1,152 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from django_redis.exceptions import CompressorError
+
+from users.models import User
+from users.serializers import UserSerializer
+from posts.models import Tag, Question, Answer, Comment, question_detail_prefetch
+from posts.serializers import TagSerializer, AllQuestionsSerializer, AllAnswerSerializer, DetailQuestionView
+
+
+SERIALIZERS = {
+    'pickle': 'django_redis.serializers.pickle.PickleSerializer',
+    'json': 'django_redis.serializers.json.JSONSerializer',
+    'msgpack': 'django_redis.serializers.msgpack.MSGPackSerializer',
+    'orjson': 'stackoverflow.cache_codecs.OrjsonSerializer',
+}
+COMPRESSORS = {
+    'none': 'django_redis.compressors.identity.IdentityCompressor',
+    'zlib': 'django_redis.compressors.zlib.ZlibCompressor',
+    'zlib1': 'stackoverflow.cache_codecs.FastZlibCompressor',
+    'lz4': 'django_redis.compressors.lz4.Lz4Compressor',
+    'zstd': 'django_redis.compressors.zstd.ZStdCompressor',
+}
+
+BENCH_KEY = 'bench_cache:{}'
+
+
+class Command(BaseCommand):
+    help = ('Compare django_redis serializers and compressors on the payloads the views cache: '
+            'bytes stored and set / get latency against redis. The seeded rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=200, help='questions to seed, with their answers and comments')
+        parser.add_argument('--rounds', type=int, default=200, help='set / get round trips per payload')
+        parser.add_argument('--serializers', default=','.join(SERIALIZERS))
+        parser.add_argument('--compressors', default=','.join(COMPRESSORS))
+
+    def handle(self, *args, **options):
+        codecs = list(self.codecs(options['serializers'].split(','), options['compressors'].split(',')))
+
+        with transaction.atomic():
+            self.seed(options['questions'])
+            payloads = self.payloads()
+            transaction.set_rollback(True)
+
+        redis = get_redis_connection('default')
+        for payload_name, payload in payloads.items():
+            self.stdout.write(f'\n{payload_name}')
+            self.stdout.write(f'  {"codec":<16}{"bytes":>10}{"set us":>10}{"get us":>10}')
+            baseline = None
+            for codec_name, encode, decode in codecs:
+                size, set_time, get_time = self.measure(redis, BENCH_KEY.format(payload_name), payload, encode, decode, options['rounds'])
+                baseline = baseline or size
+                self.stdout.write(
+                    f'  {codec_name:<16}{size:>10}{set_time * 1e6:>10.1f}{get_time * 1e6:>10.1f}'
+                    f'  {size / baseline * 100:5.0f}% of {codecs[0][0]}'
+                )
+
+    def codecs(self, serializers, compressors):
+        """(name, encode, decode) per combination, encoded like django_redis' DefaultClient does."""
+        for serializer_name in serializers:
+            for compressor_name in compressors:
+                try:
+                    serializer = import_string(SERIALIZERS[serializer_name])({})
+                    compressor = import_string(COMPRESSORS[compressor_name])({})
+                except ImportError as exc:
+                    self.stdout.write(f'skipping {serializer_name}+{compressor_name}: {exc}')
+                    continue
+
+                def encode(value, serializer=serializer, compressor=compressor):
+                    return compressor.compress(serializer.dumps(value))
+
+                def decode(value, serializer=serializer, compressor=compressor):
+                    try:
+                        value = compressor.decompress(value)
+                    except CompressorError:
+                        pass
+                    return serializer.loads(value)
+
+                yield f'{serializer_name}+{compressor_name}', encode, decode
+
+    def measure(self, redis, key, payload, encode, decode, rounds):
+        size = len(encode(payload))
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            redis.set(key, encode(payload))
+        set_time = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            decode(redis.get(key))
+        get_time = (time.perf_counter() - start) / rounds
+
+        redis.delete(key)
+        return size, set_time, get_time
+
+    def payloads(self):
+        """The values the views store, wrapped in the CacheFamily.get_or_build envelope."""
+        def envelope(value):
+            return {'value':value, 'expires':time.time() + 600, 'delta':0.01}
+
+        questions = list(Question.objects.for_list().order_by('-question_id')[:10])
+        question = Question.objects.get(question_id=Answer.objects.values_list('question_id', flat=True).last())
+        prefetch_related_objects([question], *question_detail_prefetch())
+        summaries = AllQuestionsSerializer(questions, many=True).data
+
+        return {
+            'all_questions page': envelope({'ids':[row['question_id'] for row in summaries], 'next_cursor':'cj0xJnA9MjAyNA=='}),
+            'question_summary': summaries[0],
+            'detail_question': envelope(DetailQuestionView(question).data),
+            'question_answers': envelope(AllAnswerSerializer(question.answers.for_thread(), many=True).data),
+            'all_tags': envelope(TagSerializer(Tag.objects.order_by('tag_id'), many=True).data),
+            'all_users': envelope(UserSerializer(User.objects.order_by('created_at'), many=True).data),
+        }
+
+    def seed(self, count):
+        start = time.perf_counter()
+        users = User.objects.bulk_create(
+            User(username=f'bench_cache_{i}', email=f'bench_cache_{i}@example.com', password='!',
+                 first_name='Bench', last_name=f'User {i}')
+            for i in range(100)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(tag_title=f'bench-{i}', tag_description=f'Questions about bench topic {i}') for i in range(50)
+        )
+        text = 'How do I keep the cached payloads of a django view small and fast to decode? ' * 4
+        questions = Question.objects.bulk_create(
+            Question(created_user=users[i % 100], question_title=f'Bench question {i} about caching',
+                     question_description=text, views=i * 7, votes_count=i % 13)
+            for i in range(count)
+        )
+        Question.tags.through.objects.bulk_create(
+            Question.tags.through(question_id=question.question_id, tag_id=tags[(i + offset) % 50].tag_id)
+            for i, question in enumerate(questions) for offset in range(3)
+        )
+        answers = Answer.objects.bulk_create(
+            Answer(question=question, created_user=users[(i + j) % 100], answer_description=text)
+            for i, question in enumerate(questions) for j in range(5)
+        )
+        Comment.objects.bulk_create(
+            [Comment(question=question, created_user=users[i % 100], comment_description='Could you add the traceback?')
+             for i, question in enumerate(questions) for _ in range(3)] +
+            [Comment(answer=answer, created_user=users[i % 100], comment_description='This worked for me, thanks.')
+             for i, answer in enumerate(answers) for _ in range(2)]
+        )
+        self.stdout.write(f'Seeded {count} questions in {time.perf_counter() - start:.1f}s.')
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Question, Comment
+from posts.counters import adjust_comments_count
+
+
+class Command(BaseCommand):
+    help = 'Compare the write cost of the old save() comment counter with the F() update.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--question', type=int, help='question_id to run against, defaults to the first question')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        questions = Question.objects.order_by('question_id')
+        question = questions.get(question_id=options['question']) if options['question'] else questions.first()
+        if question is None:
+            self.stderr.write('No question found, seed the database first.')
+            return
+
+        def full_row_save():
+            row = Question.objects.get(question_id=question.question_id)
+            row.comments_count += 1
+            row.save()
+
+        def f_update():
+            adjust_comments_count(Comment(question_id=question.question_id), 1)
+
+        for name, increment in (('save()', full_row_save), ('F() update', f_update)):
+            # everything is rolled back, the benchmark leaves the counters untouched
+            with transaction.atomic(), CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    increment()
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+
+            sql_bytes = sum(len(query['sql']) for query in ctx.captured_queries)
+            self.stdout.write(
+                f'{name:<12} {iterations} increments  '
+                f'{len(ctx.captured_queries) / iterations:.1f} queries/op  '
+                f'{sql_bytes / iterations:.0f} SQL bytes/op  '
+                f'{elapsed / iterations * 1000:.3f} ms/op'
+            )
@@ -0,0 +1,435 @@
+import contextlib
+import copy
+import gc
+import io
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from rest_framework.test import APIClient
+
+from stackoverflow.celery import app as celery_app
+from users.models import User
+from posts.models import Tag, Question, Answer, Comment
+from posts.counters import reconcile_tag_counts
+
+
+BASELINE_PATH = settings.BASE_DIR / 'benchmarks' / 'endpoints_{}.json'
+
+# a slowdown smaller than this is noise whatever the ratio. The p99 of a few dozen
+# requests is close to their maximum, a single scheduler hiccup moves it
+P50_FLOOR_MS = 1.0
+P99_FLOOR_MS = 10.0
+ALLOCATION_FLOOR_KB = 32
+
+
+class Endpoint:
+    """
+    One benchmarked request. `path` and `data` are formatted with the seeded ids plus
+    whatever `setup(i)` returns for iteration i; setup runs outside the measurement.
+    """
+
+    def __init__(self, name, method, path, user='user', data=None, setup=None, status=200, cold=False, iterations=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.user = user
+        self.data = data
+        self.setup = setup
+        self.status = status
+        # also measure with an empty redis, every iteration rebuilds what the view caches
+        self.cold = cold
+        # caps the iterations of slow endpoints, e.g. password hashing
+        self.iterations = iterations
+
+
+class Command(BaseCommand):
+    help = ('Drive every endpoint of posts.urls and users.urls in process against a seeded test database, '
+            'record p50 / p99 latency, queries and allocations, and fail on regressions against the baseline '
+            'in benchmarks/. Elasticsearch backed endpoints are skipped unless --with-search.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--only', help='comma separated endpoint names')
+        parser.add_argument('--redis-db', type=int, default=15,
+                            help='redis database the benchmark owns, it is flushed before and after the run')
+        parser.add_argument('--with-search', action='store_true', help='include the endpoints that need elasticsearch')
+        parser.add_argument('--baseline', help=f'defaults to {BASELINE_PATH.relative_to(settings.BASE_DIR)} of the database vendor')
+        parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='allowed p50 slowdown, 0.5 is +50%%')
+        parser.add_argument('--p99-tolerance', type=float, default=2.0)
+        parser.add_argument('--allocation-tolerance', type=float, default=0.25)
+        parser.add_argument('--retries', type=int, default=2, help='times a slower endpoint is measured again before it fails')
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline'] or str(BASELINE_PATH).format(connection.vendor)
+        baseline = None if options['update_baseline'] else self.load_baseline(baseline_path, options)
+        caches = self.bench_caches(options['redis_db'])
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        eager = celery_app.conf.task_always_eager
+        # tasks run in process: mail goes to the locmem outbox, nothing reaches the broker
+        celery_app.conf.task_always_eager = True
+        try:
+            with override_settings(CACHES=caches, ELASTICSEARCH_DSL_AUTOSYNC=False):
+                redis = get_redis_connection('default')
+                redis.flushdb()
+                try:
+                    self.rng = random.Random(options['seed'])
+                    self.ids = self.seed(options['questions'])
+                    results = self.run(options, baseline)
+                finally:
+                    redis.flushdb()
+        finally:
+            celery_app.conf.task_always_eager = eager
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'vendor':connection.vendor,
+            'python':platform.python_version(),
+            'questions':options['questions'],
+            'seed':options['seed'],
+            'iterations':options['iterations'],
+            'endpoints':results,
+        }
+        if options['update_baseline']:
+            with open(baseline_path, 'w') as baseline_file:
+                json.dump(report, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}.'))
+            return
+
+        regressions = self.regressions(results, baseline, options)
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(message for _, _, message in regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}.'))
+
+    def bench_caches(self, redis_db):
+        caches = copy.deepcopy(settings.CACHES)
+        location = urlsplit(caches['default']['LOCATION'])
+        if location.path.strip('/') == str(redis_db):
+            raise CommandError(f'redis db {redis_db} is the one the site uses, pick another --redis-db.')
+        caches['default']['LOCATION'] = urlunsplit(location._replace(path=f'/{redis_db}'))
+        return caches
+
+    # ------------------------------------------------------------------------------------
+    # measuring
+
+    def run(self, options, baseline):
+        only = set(options['only'].split(',')) if options['only'] else None
+        self.clients = {
+            'anonymous':APIClient(),
+            'user':self.client_for(self.ids['user']),
+            'admin':self.client_for(self.ids['admin']),
+            'voter':self.client_for(self.ids['voter']),
+        }
+
+        measurements, results = {}, {}
+        for endpoint in self.endpoints(options['with_search']):
+            if only and endpoint.name not in only:
+                continue
+            iterations = min(options['iterations'], endpoint.iterations or options['iterations'])
+            for cold in (False, True) if endpoint.cold else (False,):
+                name = f'{endpoint.name} [cold]' if cold else endpoint.name
+                measurements[name] = (endpoint, iterations, cold)
+                results[name] = self.measure(*measurements[name])
+
+        # a slowdown has to show up again before it fails the run, a noisy neighbour rarely hits twice
+        for _ in range(options['retries'] if baseline else 0):
+            slow = {name for name, field, _ in self.regressions(results, baseline, options) if field != 'queries'}
+            if not slow:
+                break
+            self.stdout.write(f'Measuring {", ".join(sorted(slow))} again.')
+            for name in slow:
+                again = self.measure(*measurements[name])
+                results[name] = {field: min(value, again[field]) for field, value in results[name].items()}
+        return results
+
+    def client_for(self, user_id):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(id=user_id))
+        return client
+
+    def measure(self, endpoint, iterations, cold):
+        redis = get_redis_connection('default')
+        timings, queries = [], []
+
+        # collector pauses land on random requests and swamp the p99, keep them out like timeit does
+        gc.collect()
+        gc.disable()
+        try:
+            # the first, untimed request fills the caches and checks the endpoint works at all
+            for i in range(-1, iterations):
+                client, path, data = self.prepare(endpoint, i)
+                if cold:
+                    redis.flushdb()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = self.request(client, endpoint.method, path, data)
+                    elapsed = time.perf_counter() - start
+                if response.status_code != endpoint.status:
+                    raise CommandError(
+                        f'{endpoint.name}: {endpoint.method} {path} returned {response.status_code}, '
+                        f'expected {endpoint.status}: {response.content[:300]!r}'
+                    )
+                if i >= 0:
+                    timings.append(elapsed * 1000)
+                    queries.append(len(captured))
+        finally:
+            gc.enable()
+
+        # allocations are traced on a separate request, tracing slows everything down
+        client, path, data = self.prepare(endpoint, iterations)
+        if cold:
+            redis.flushdb()
+        tracemalloc.start()
+        try:
+            self.request(client, endpoint.method, path, data)
+            allocated = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'p50_ms':round(statistics.median(timings), 3),
+            'p99_ms':round(self.percentile(timings, 99), 3),
+            'queries':statistics.median_low(queries),
+            'alloc_kb':round(allocated / 1024, 1),
+        }
+        self.stdout.write(
+            f'{endpoint.name + (" [cold]" if cold else ""):<36} p50 {result["p50_ms"]:8.2f} ms  '
+            f'p99 {result["p99_ms"]:8.2f} ms  {result["queries"]:3} queries  {result["alloc_kb"]:8.1f} KB'
+        )
+        return result
+
+    def prepare(self, endpoint, i):
+        context = dict(self.ids)
+        if endpoint.setup:
+            context.update(endpoint.setup(i) or {})
+        client = context.pop('client', None) or self.clients[endpoint.user]
+        data = endpoint.data(context) if callable(endpoint.data) else endpoint.data
+        return client, endpoint.path.format(**context), data
+
+    def request(self, client, method, path, data):
+        # views print, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            return getattr(client, method.lower())(path, data, format='json' if method != 'GET' else None)
+
+    def percentile(self, values, percent):
+        values = sorted(values)
+        return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
+
+    # ------------------------------------------------------------------------------------
+    # comparing
+
+    def load_baseline(self, path, options):
+        try:
+            with open(path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {path}, create one with --update-baseline.')
+
+        for key, value in (('vendor', connection.vendor), ('questions', options['questions']), ('seed', options['seed'])):
+            if baseline[key] != value:
+                raise CommandError(f'The baseline was recorded with {key}={baseline[key]}, this run uses {value}.')
+        return baseline
+
+    def regressions(self, results, baseline, options):
+        """(endpoint, field, message) for every measurement worse than the baseline allows."""
+        found = []
+        for name, result in results.items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                found.append((name, 'queries', f'{name}: {result["queries"]} queries, baseline {before["queries"]}'))
+            for field, tolerance, floor in (
+                ('p50_ms', options['tolerance'], P50_FLOOR_MS),
+                ('p99_ms', options['p99_tolerance'], P99_FLOOR_MS),
+                ('alloc_kb', options['allocation_tolerance'], ALLOCATION_FLOOR_KB),
+            ):
+                if result[field] > before[field] * (1 + tolerance) and result[field] - before[field] > floor:
+                    found.append((name, field, f'{name}: {field} {result[field]}, baseline {before[field]}'))
+        return found
+
+    # ------------------------------------------------------------------------------------
+    # dataset and endpoints
+
+    def seed(self, count):
+        """A deterministic dataset for the seed: a long tail of threads and one busy thread."""
+        rng = self.rng
+        start = time.perf_counter()
+        now = timezone.now()
+
+        admin = User.objects.create_superuser('bench_admin', 'bench_admin@example.com', 'password')
+        users = User.objects.bulk_create(
+            User(username=f'bench_{i}', email=f'bench_{i}@example.com', password='!', first_name='Bench', last_name=str(i))
+            for i in range(50)
+        )
+        # owns nothing, so it may vote on everything
+        voter = User.objects.create_user('bench_voter', 'bench_voter@example.com', None)
+        tags = Tag.objects.bulk_create(Tag(tag_title=f'bench-{i}', tag_description=f'Bench tag {i}') for i in range(30))
+
+        questions = Question.objects.bulk_create(
+            Question(created_user=users[rng.randrange(50)], question_title=f'Bench question {i}',
+                     question_description='Bench description ' * rng.randint(5, 50),
+                     views=int(rng.paretovariate(1.2) * 10), votes_count=0)
+            for i in range(count)
+        )
+        # a question a minute, the newest one now
+        for i, question in enumerate(questions):
+            question.created_at = now - timedelta(minutes=count - i)
+        Question.objects.bulk_update(questions, ['created_at'])
+
+        Question.tags.through.objects.bulk_create(
+            Question.tags.through(question_id=question.question_id, tag_id=tag.tag_id)
+            for question in questions
+            for tag in rng.sample(tags, rng.randint(1, 4))
+        )
+
+        busy = questions[-1]
+        answers = Answer.objects.bulk_create(
+            Answer(question=question, created_user=users[rng.randrange(50)], answer_description='Bench answer ' * 20)
+            for question in questions
+            for _ in range(20 if question is busy else rng.randint(0, 4))
+        )
+        comments = (
+            [Comment(question=question, created_user=users[rng.randrange(50)], comment_description='Bench comment')
+             for question in questions for _ in range(rng.randint(0, 3))] +
+            [Comment(answer=answer, created_user=users[rng.randrange(50)], comment_description='Bench comment')
+             for answer in answers for _ in range(rng.randint(0, 2))]
+        )
+        Comment.objects.bulk_create(comments)
+        reconcile_tag_counts()
+
+        self.stdout.write(f'Seeded {count} questions, {len(answers)} answers and {len(comments)} comments '
+                          f'in {time.perf_counter() - start:.1f}s.')
+        return {
+            'admin':admin.id,
+            'user':users[0].id,
+            'voter':voter.id,
+            'question':busy.question_id,
+            'own_question':Question.objects.filter(created_user=users[0]).values_list('question_id', flat=True).first()
+            or Question.objects.create(created_user=users[0], question_title='Own', question_description='Own').question_id,
+            'answer':answers[-1].answer_id,
+            'tag':tags[0].tag_title,
+            'tag_ids':[tag.tag_id for tag in tags],
+            'questions':[question.question_id for question in questions],
+            'answers':[answer.answer_id for answer in answers],
+        }
+
+    def endpoints(self, with_search):
+        ids = self.ids
+        user = User.objects.get(id=ids['user'])
+        admin = User.objects.get(id=ids['admin'])
+        question_count = len(ids['questions'])
+
+        def own_answer(i):
+            return {'own_answer':Answer.objects.create(question_id=ids['question'], created_user=user, answer_description='Mine').answer_id}
+
+        def admin_question(i):
+            return {'own_question':Question.objects.create(created_user=admin, question_title='Delete', question_description='Delete').question_id}
+
+        def nth_question(i):
+            # a different question each time, so every vote is a new one
+            return {'target':ids['questions'][i % question_count]}
+
+        def nth_answer(i):
+            return {'target':ids['answers'][i % len(ids['answers'])]}
+
+        def voted_question(i):
+            target = nth_question(i)
+            self.client_for(ids['voter']).post(f'/api/question/{target["target"]}/upvote/')
+            return target
+
+        def voted_answer(i):
+            target = nth_answer(i)
+            self.client_for(ids['voter']).post(f'/api/answer/{target["target"]}/upvote/')
+            return target
+
+        def own_comment(i):
+            return {'comment':Comment.objects.create(question_id=ids['question'], created_user=user, comment_description='Mine').comment_id}
+
+        def new_tag(i):
+            return {'tag_id':Tag.objects.create(tag_title=f'bench-new-{i}').tag_id}
+
+        def new_user(i):
+            created = User.objects.create_user(f'bench_new_{i}', f'bench_new_{i}@example.com', None)
+            created.otp = '123456'
+            created.save(update_fields=['otp'])
+            client = APIClient()
+            client.force_authenticate(created)
+            return {'client':client, 'new_user':created.id}
+
+        endpoints = [
+            Endpoint('all_questions', 'GET', '/api/questions/', user='anonymous', cold=True),
+            Endpoint('hot_questions', 'GET', '/api/questions/hot/', user='anonymous', cold=True),
+            Endpoint('detail_question_view', 'GET', '/api/question/{question}/detail/', user='anonymous', cold=True),
+            Endpoint('all_answers_for_question', 'GET', '/api/question/{question}/answers/', cold=True),
+            Endpoint('all_tags', 'GET', '/api/tags/', user='anonymous', cold=True),
+            Endpoint('popular_tags', 'GET', '/api/tags/popular/', user='anonymous', cold=True),
+            Endpoint('tag_questions', 'GET', '/api/tags/{tag}/questions/', user='anonymous', cold=True),
+            Endpoint('tag_questions votes', 'GET', '/api/tags/{tag}/questions/?sort=votes', user='anonymous', cold=True),
+
+            Endpoint('create_question', 'POST', '/api/question/create/', status=201,
+                     data=lambda context: {'question_title':'Benchmarked', 'question_description':'Benchmarked question',
+                                           'tags':context['tag_ids'][:2]}),
+            Endpoint('update_question', 'PATCH', '/api/question/{own_question}/update/', status=202,
+                     data={'question_title':'Benchmarked update'}),
+            Endpoint('delete_question', 'DELETE', '/api/question/{own_question}/delete/', user='admin', setup=admin_question),
+            Endpoint('create_answer', 'POST', '/api/question/{question}/answer/create/', status=201,
+                     data={'answer_description':'Benchmarked answer'}),
+            Endpoint('update_answer', 'PATCH', '/api/answer/{own_answer}/update/', status=202, setup=own_answer,
+                     data={'answer_description':'Benchmarked update'}),
+            Endpoint('delete_answer', 'DELETE', '/api/answer/{own_answer}/delete/', setup=own_answer),
+
+            Endpoint('upvote_question', 'POST', '/api/question/{target}/upvote/', user='voter', setup=nth_question),
+            Endpoint('downvote_question', 'POST', '/api/question/{target}/downvote/', user='voter', setup=nth_question),
+            Endpoint('retract_question_vote', 'DELETE', '/api/question/{target}/vote/delete/', user='voter', setup=voted_question),
+            Endpoint('upvote_answer', 'POST', '/api/answer/{target}/upvote/', user='voter', setup=nth_answer),
+            Endpoint('downvote_answer', 'POST', '/api/answer/{target}/downvote/', user='voter', setup=nth_answer),
+            Endpoint('retract_answer_vote', 'DELETE', '/api/answer/{target}/vote/delete/', user='voter', setup=voted_answer),
+
+            Endpoint('create_comment_for_question', 'POST', '/api/comment/question/{question}/create/',
+                     data={'comment_description':'Benchmarked comment'}),
+            Endpoint('create_comment_for_answer', 'POST', '/api/comment/answer/{answer}/create/',
+                     data={'comment_description':'Benchmarked comment'}),
+            Endpoint('delete_comment', 'DELETE', '/api/comment/{comment}/delete/', setup=own_comment),
+
+            Endpoint('create_tag', 'POST', '/api/tags/create/', user='admin', status=201,
+                     setup=lambda i: {'title':f'bench-created-{i}'}, data=lambda context: {'tag_title':context['title']}),
+            Endpoint('delete_tag', 'DELETE', '/api/tags/delete/{tag_id}/', user='admin', setup=new_tag),
+
+            Endpoint('all-users', 'GET', '/users/', user='admin', cold=True),
+            Endpoint('current-user', 'GET', '/users/me/'),
+            # password hashing dominates, a few iterations are enough
+            Endpoint('create-user', 'POST', '/users/create/', user='anonymous', status=201, iterations=5,
+                     setup=lambda i: {'n':i}, data=lambda context: {
+                         'username':f'bench_signup_{context["n"]}', 'email':f'bench_signup_{context["n"]}@example.com',
+                         'password':'bench-password', 'first_name':'Bench', 'last_name':'Signup'}),
+            Endpoint('update-user', 'PATCH', '/users/update/{user}/', data={'first_name':'Updated'}),
+            Endpoint('delete-user', 'DELETE', '/users/delete/{new_user}/', setup=new_user),
+            Endpoint('verify-otp', 'POST', '/users/verify/', setup=new_user, status=202, data={'otp':'123456'}),
+        ]
+
+        if with_search:
+            endpoints += [
+                Endpoint('all_questions search', 'GET', '/api/questions/?search=bench', user='anonymous', cold=True),
+                Endpoint('suggestions', 'GET', '/api/suggest/?q=bench', user='anonymous'),
+            ]
+        return endpoints
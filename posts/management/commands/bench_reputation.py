@@ -0,0 +1,93 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from users.models import User
+from posts.models import Question, Answer, Vote
+from posts.reputation import rebuild_reputation, record_reputation, flush_reputation, vote_points
+
+
+BENCH_PENDING_KEY = 'reputation:bench'
+
+
+class Command(BaseCommand):
+    help = ('Compare recomputing reputation on demand with the queued F() deltas and the full rebuild, '
+            'on a generated vote table. Everything is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=1_000_000)
+        parser.add_argument('--events', type=int, default=100_000, help='vote events to queue and flush')
+        parser.add_argument('--samples', type=int, default=100, help='users to score on demand')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            authors = self.seed(options['votes'])
+
+            # on demand: one aggregate over the user's posts and their votes per request
+            sample = random.sample(authors, min(options['samples'], len(authors)))
+            start = time.perf_counter()
+            for user_id in sample:
+                self.on_demand(user_id)
+            self.report('on demand', len(sample), 'users', time.perf_counter() - start)
+
+            start = time.perf_counter()
+            rebuilt = rebuild_reputation(discard_pending=False)
+            self.report('rebuild', rebuilt, 'users', time.perf_counter() - start)
+
+            # queued deltas go to a separate hash, real pending deltas are left alone
+            start = time.perf_counter()
+            for _ in range(options['events']):
+                record_reputation(random.choice(authors), vote_points(random.choice((1, -1)), True), BENCH_PENDING_KEY)
+            self.report('record event', options['events'], 'events', time.perf_counter() - start)
+
+            start = time.perf_counter()
+            flushed = flush_reputation(BENCH_PENDING_KEY)
+            self.report('flush', flushed, 'users', time.perf_counter() - start)
+
+            transaction.set_rollback(True)
+
+    def report(self, name, count, unit, elapsed):
+        self.stdout.write(
+            f'{name:<14} {count} {unit} in {elapsed:.3f}s  ({elapsed / count * 1000 if count else 0:.3f} ms per {unit[:-1]})'
+        )
+
+    def on_demand(self, user_id):
+        return sum(
+            vote_points(vote_type, on_question) * total
+            for on_question, field in ((True, 'question__created_user'), (False, 'answer__created_user'))
+            for vote_type, total in (Vote.objects.filter(**{field: user_id})
+                                     .values('vote_type').annotate(total=Count('vote_id')).order_by()
+                                     .values_list('vote_type', 'total'))
+        )
+
+    def seed(self, votes):
+        """Voters each vote on every post, 500 questions and 500 answers by 100 authors."""
+        start = time.perf_counter()
+        posts = min(votes, 1000)
+        voters = max(votes // posts, 1)
+
+        users = User.objects.bulk_create(
+            User(username=f'bench_{i}', email=f'bench_{i}@example.com', password='!')
+            for i in range(voters + 100)
+        )
+        authors, voters = [user.id for user in users[:100]], users[100:]
+        questions = Question.objects.bulk_create(
+            Question(created_user_id=authors[i % 100], question_title='Bench', question_description='Bench')
+            for i in range(posts // 2)
+        )
+        answers = Answer.objects.bulk_create(
+            Answer(question=questions[i % len(questions)], created_user_id=authors[i % 100], answer_description='Bench')
+            for i in range(posts - len(questions))
+        )
+
+        for voter in voters:
+            Vote.objects.bulk_create(
+                [Vote(user=voter, question=question, vote_type=random.choice((1, 1, 1, -1))) for question in questions] +
+                [Vote(user=voter, answer=answer, vote_type=random.choice((1, 1, 1, -1))) for answer in answers],
+                batch_size=5000,
+            )
+        self.stdout.write(f'Seeded {len(voters) * posts} votes in {time.perf_counter() - start:.1f}s.')
+        return authors
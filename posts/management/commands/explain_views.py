@@ -0,0 +1,191 @@
+import copy
+import json
+import time
+from datetime import timedelta
+from urllib.parse import quote, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from rest_framework.test import APIClient
+
+from users.models import User
+from posts.models import Tag, Question, Answer, Comment
+from posts.pagination import QuestionCursorPagination
+from posts.hot import refresh_hot_questions
+
+
+# tables that are read whole on purpose
+SEQ_SCAN_ALLOWED = {'posts_tag'}
+
+
+class Command(BaseCommand):
+    help = ('Request the read endpoints with empty caches, run EXPLAIN ANALYZE on every SELECT they '
+            'sent to the database and fail when one of them does a sequential scan. Postgres only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=20000,
+                            help='questions to generate before explaining, 0 uses the existing data as is')
+        parser.add_argument('--answers', type=int, default=3, help='answers per seeded question')
+        parser.add_argument('--comments', type=int, default=2, help='comments per seeded question and answer')
+        parser.add_argument('--redis-db', type=int, default=15,
+                            help='redis database the views cache into, it is flushed before every request')
+        parser.add_argument('--verbose-plans', action='store_true', help='print every plan')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('explain_views needs postgres, the planner of other databases behaves differently.')
+
+        setup_test_environment()
+        try:
+            # the views run in process against their own redis database, the site's cache is left alone
+            with override_settings(CACHES=self.isolated_caches(options['redis_db']), ELASTICSEARCH_DSL_AUTOSYNC=False):
+                self.redis = get_redis_connection('default')
+                try:
+                    failures = self.explain_views(options)
+                finally:
+                    self.redis.flushdb()
+        finally:
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError('Sequential scans found:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('No sequential scans.'))
+
+    def isolated_caches(self, redis_db):
+        caches = copy.deepcopy(settings.CACHES)
+        location = urlsplit(caches['default']['LOCATION'])
+        if location.path.strip('/') == str(redis_db):
+            raise CommandError(f'redis db {redis_db} is the one the site uses, pick another --redis-db.')
+        caches['default']['LOCATION'] = urlunsplit(location._replace(path=f'/{redis_db}'))
+        return caches
+
+    def explain_views(self, options):
+        # the seeded rows are rolled back, the database is left as it was
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'], options['answers'], options['comments'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            failures = []
+            for name, run in self.scenarios():
+                for sql in self.capture(name, run):
+                    plan, elapsed = self.explain(sql)
+                    scans = set(self.seq_scans(plan['Plan'])) - SEQ_SCAN_ALLOWED
+                    self.stdout.write(
+                        f'{name:<32} {elapsed:8.3f} ms  {"seq scan on " + ", ".join(sorted(scans)) if scans else "ok"}'
+                    )
+                    if options['verbose_plans'] or scans:
+                        self.stdout.write(f'    {sql}')
+                    if options['verbose_plans']:
+                        self.stdout.write(json.dumps(plan['Plan'], indent=2))
+                    if scans:
+                        failures.append(f'{name}: {", ".join(sorted(scans))}')
+
+            transaction.set_rollback(True)
+        return failures
+
+    def scenarios(self):
+        """The read endpoints as the site serves them, each request runs against an empty cache."""
+        questions = Question.objects.order_by('created_at', 'question_id')
+        answered = Answer.objects.values_list('question_id', flat=True).order_by('question_id').last()
+        if answered is None:
+            raise CommandError('No answered question found, run with --seed.')
+        middle = questions[questions.count() // 2]
+        tag = Tag.objects.filter(question_count__gt=0).order_by('-question_count').values_list('tag_title', flat=True).first()
+        deep_cursor = QuestionCursorPagination().encode_cursor(middle)
+        tag = quote(tag or '')
+
+        anonymous, user = APIClient(), APIClient()
+        user.force_authenticate(User.objects.order_by('id').first())
+
+        return [
+            ('all_question first page', lambda: anonymous.get('/api/questions/')),
+            ('all_question deep page', lambda: anonymous.get(f'/api/questions/?cursor={deep_cursor}')),
+            ('all_question previous page', lambda: anonymous.get(
+                f'/api/questions/?cursor={QuestionCursorPagination().encode_cursor(middle, reverse=True)}')),
+            ('detail_question_view', lambda: anonymous.get(f'/api/question/{answered}/detail/')),
+            ('get_answers_for_question', lambda: user.get(f'/api/question/{answered}/answers/')),
+            ('hot_questions', lambda: anonymous.get('/api/questions/hot/')),
+            ('all_tags', lambda: anonymous.get('/api/tags/')),
+            ('popular_tags', lambda: anonymous.get('/api/tags/popular/')),
+            ('tag_questions newest', lambda: anonymous.get(f'/api/tags/{tag}/questions/?sort=newest')),
+            ('tag_questions votes', lambda: anonymous.get(f'/api/tags/{tag}/questions/?sort=votes')),
+            # the beat job behind the hot list
+            ('refresh_hot_questions', refresh_hot_questions),
+        ]
+
+    def capture(self, name, run):
+        """Distinct SELECTs `run` sends to the database, with every cache empty."""
+        self.redis.flushdb()
+        with CaptureQueriesContext(connection) as captured:
+            response = run()
+        if response is not None and response.status_code != 200:
+            raise CommandError(f'{name} returned {response.status_code}: {response.content[:300]!r}')
+
+        queries = []
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if sql.lstrip().upper().startswith('SELECT') and sql not in queries:
+                queries.append(sql)
+        return queries
+
+    def explain(self, sql):
+        # captured queries come with their parameters already interpolated
+        with connection.cursor() as cursor:
+            start = time.perf_counter()
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')
+            elapsed = (time.perf_counter() - start) * 1000
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0], elapsed
+
+    def seq_scans(self, node):
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name']
+        for child in node.get('Plans', []):
+            yield from self.seq_scans(child)
+
+    def seed(self, count, answers, comments):
+        start = time.perf_counter()
+        user = User.objects.filter(username='explain_seed').first() or \
+            User.objects.create_user('explain_seed', 'explain_seed@example.com', None)
+        tags = list(Tag.objects.all()[:50]) or [Tag.objects.create(tag_title=f'seed-{i}') for i in range(50)]
+        now = timezone.now()
+
+        for offset in range(0, count, 1000):
+            size = min(1000, count - offset)
+            created = Question.objects.bulk_create(
+                Question(created_user=user, question_title=f'Seeded question {offset + i}',
+                         question_description='Seeded description', views=(offset + i) % 997,
+                         votes_count=(offset + i) % 89)
+                for i in range(size)
+            )
+            Question.tags.through.objects.bulk_create(
+                Question.tags.through(question_id=question.question_id, tag_id=tags[i % len(tags)].tag_id)
+                for i, question in enumerate(created)
+            )
+            created_answers = Answer.objects.bulk_create(
+                Answer(question=question, created_user=user, answer_description='Seeded answer')
+                for question in created for _ in range(answers)
+            )
+            Comment.objects.bulk_create(
+                [Comment(question=question, created_user=user, comment_description='Seeded comment')
+                 for question in created for _ in range(comments)] +
+                [Comment(answer=answer, created_user=user, comment_description='Seeded comment')
+                 for answer in created_answers for _ in range(comments)]
+            )
+
+        # auto_now_add stamps every row with the same time, spread them out so the feed has an order
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE posts_question SET created_at = %s - question_id * interval \'1 second\' WHERE created_user_id = %s',
+                [now - timedelta(days=1), user.pk]
+            )
+        self.stdout.write(f'Seeded {count} questions in {time.perf_counter() - start:.1f}s.')
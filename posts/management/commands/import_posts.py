@@ -0,0 +1,206 @@
+import csv
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Tag, Question, Answer, Comment
+from posts.caches import invalidate_feed, tags_cache
+from posts.tag_feeds import drop_tags
+from posts.counters import reconcile_tag_counts
+from posts.indexing import enqueue_question_ids
+from users.models import User
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def to_int(value, default=0):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+class Command(BaseCommand):
+    help = ('Stream questions, answers and comments from CSV files into the database with bulk inserts. '
+            'The questions they touch are queued for the search index like regular saves.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', help='question CSV (question_title, question_description, tags, created_user)')
+        parser.add_argument('--answers', help='answer CSV (answer_description, question, created_user)')
+        parser.add_argument('--question-comments', help='question comment CSV (comment_description, question, created_user)')
+        parser.add_argument('--answer-comments', help='answer comment CSV (comment_description, answer, created_user)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='rows per bulk insert')
+
+    def handle(self, *args, **options):
+        files = {
+            'questions': options['questions'],
+            'answers': options['answers'],
+            'question_comments': options['question_comments'],
+            'answer_comments': options['answer_comments'],
+        }
+        if not any(files.values()):
+            # same files the old *_scripts.py loaders read
+            files = {
+                'questions': os.path.join(settings.BASE_DIR, 'question_data.csv'),
+                'answers': os.path.join(settings.BASE_DIR, 'answer_data.csv'),
+                'question_comments': os.path.join(settings.BASE_DIR, 'comment_question_data.csv'),
+                'answer_comments': os.path.join(settings.BASE_DIR, 'comment_answer_data.csv'),
+            }
+        for path in filter(None, files.values()):
+            if not os.path.exists(path):
+                raise CommandError(f'File {path} does not exist.')
+
+        self.chunk_size = options['chunk_size']
+        self.user_ids = set(User.objects.values_list('id', flat=True).iterator())
+        self.touched_questions = set()
+
+        if files['questions']:
+            self.run('questions', files['questions'], self.import_questions)
+            # bulk_create sends no post_save signals, clear the caches they would have cleared
+            invalidate_feed()
+            tags_cache.delete(tags_cache.key())
+            drop_tags(self.tag_ids.values())
+            reconcile_tag_counts()
+        if files['answers']:
+            self.run('answers', files['answers'], self.import_answers)
+        if files['question_comments']:
+            self.run('question comments', files['question_comments'], self.import_question_comments)
+        if files['answer_comments']:
+            self.run('answer comments', files['answer_comments'], self.import_answer_comments)
+        if files['question_comments'] or files['answer_comments']:
+            self.refresh_comment_counts()
+
+        # bulk_create sends no post_save either, queue the search documents the signal processor
+        # would have, once every counter above is final
+        for question_ids in chunked(sorted(self.touched_questions), self.chunk_size):
+            enqueue_question_ids(question_ids)
+        self.stdout.write(f'Queued {len(self.touched_questions)} questions for the search index.')
+
+    def run(self, name, path, importer):
+        start = time.perf_counter()
+        with open(path, 'r', newline='') as csvfile:
+            created, skipped = importer(csv.DictReader(csvfile))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} {name} in {elapsed:.2f}s '
+            f'({created / elapsed if elapsed else 0:.0f} rows/sec), skipped {skipped}.'
+        ))
+
+    def valid_user(self, row):
+        return to_int(row.get('created_user'), None) in self.user_ids
+
+    def resolve_tags(self, titles):
+        """Map tag titles to ids, creating the missing ones with a single bulk insert."""
+        missing = titles - self.tag_ids.keys()
+        if missing:
+            Tag.objects.bulk_create([Tag(tag_title=title) for title in missing], ignore_conflicts=True)
+            self.tag_ids.update(Tag.objects.filter(tag_title__in=missing).values_list('tag_title', 'tag_id'))
+
+    def import_questions(self, reader):
+        self.tag_ids = dict(Tag.objects.values_list('tag_title', 'tag_id'))
+        Through = Question.tags.through
+        created = skipped = 0
+
+        for rows in chunked(reader, self.chunk_size):
+            questions, question_tags = [], []
+            for row in rows:
+                if not row.get('question_title') or not row.get('question_description') or not self.valid_user(row):
+                    skipped += 1
+                    continue
+                questions.append(Question(
+                    question_title=row['question_title'],
+                    question_description=row['question_description'],
+                    created_user_id=to_int(row['created_user']),
+                    views=to_int(row.get('views')),
+                    votes_count=to_int(row.get('votes_count')),
+                    comments_count=to_int(row.get('comments_count')),
+                ))
+                question_tags.append({tag.strip() for tag in (row.get('tags') or '').split(',') if tag.strip()})
+
+            with transaction.atomic():
+                self.resolve_tags(set().union(*question_tags))
+                Question.objects.bulk_create(questions)
+                Through.objects.bulk_create([
+                    Through(question_id=question.question_id, tag_id=self.tag_ids[title])
+                    for question, titles in zip(questions, question_tags)
+                    for title in titles
+                ])
+            self.touched_questions.update(question.question_id for question in questions)
+            created += len(questions)
+
+        return created, skipped
+
+    def import_answers(self, reader):
+        question_ids = set(Question.objects.values_list('question_id', flat=True).iterator())
+        created = skipped = 0
+
+        for rows in chunked(reader, self.chunk_size):
+            answers = []
+            for row in rows:
+                question_id = to_int(row.get('question'), None)
+                if not row.get('answer_description') or question_id not in question_ids or not self.valid_user(row):
+                    skipped += 1
+                    continue
+                answers.append(Answer(
+                    answer_description=row['answer_description'],
+                    question_id=question_id,
+                    created_user_id=to_int(row['created_user']),
+                ))
+            Answer.objects.bulk_create(answers)
+            # answers are part of the question's search document
+            self.touched_questions.update(answer.question_id for answer in answers)
+            created += len(answers)
+
+        return created, skipped
+
+    def import_comments(self, reader, field, valid_ids):
+        created = skipped = 0
+
+        for rows in chunked(reader, self.chunk_size):
+            comments = []
+            for row in rows:
+                target_id = to_int(row.get(field), None)
+                if not row.get('comment_description') or target_id not in valid_ids or not self.valid_user(row):
+                    skipped += 1
+                    continue
+                comments.append(Comment(
+                    comment_description=row['comment_description'],
+                    created_user_id=to_int(row['created_user']),
+                    **{f'{field}_id': target_id},
+                ))
+            Comment.objects.bulk_create(comments)
+            if field == 'question':
+                # comments_count of the question is indexed
+                self.touched_questions.update(comment.question_id for comment in comments)
+            created += len(comments)
+
+        return created, skipped
+
+    def import_question_comments(self, reader):
+        question_ids = set(Question.objects.values_list('question_id', flat=True).iterator())
+        return self.import_comments(reader, 'question', question_ids)
+
+    def import_answer_comments(self, reader):
+        answer_ids = set(Answer.objects.values_list('answer_id', flat=True).iterator())
+        return self.import_comments(reader, 'answer', answer_ids)
+
+    def refresh_comment_counts(self):
+        # bulk_create skips the views that maintain comments_count, fix them in one UPDATE per table
+        for model, field in ((Question, 'question'), (Answer, 'answer')):
+            counts = (Comment.objects.filter(**{field: OuterRef('pk')})
+                      .order_by()
+                      .values(field)
+                      .annotate(total=Count('comment_id'))
+                      .values('total'))
+            model.objects.update(comments_count=Coalesce(Subquery(counts), 0))
+        self.stdout.write('Refreshed comments_count for questions and answers.')
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.documents import QuestionDocument
+
+
+class Command(BaseCommand):
+    help = 'Recreate the questions search index, streaming questions from the database in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='questions per database fetch and bulk request')
+        parser.add_argument('--keep-index', action='store_true', help='reindex into the existing index instead of recreating it')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        document = QuestionDocument()
+
+        if not options['keep_index']:
+            QuestionDocument._index.delete(ignore_unavailable=True)
+            QuestionDocument.init()
+
+        start = time.perf_counter()
+        # iterator() keeps one chunk in memory, prefetch_related runs once per chunk
+        questions = document.get_queryset().order_by('question_id').iterator(chunk_size=chunk_size)
+        indexed, errors = document.bulk(document.get_actions(questions, 'index'), chunk_size=chunk_size, raise_on_error=False)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} questions in {elapsed:.2f}s ({indexed / elapsed if elapsed else 0:.0f} docs/sec), {len(errors)} errors.'
+        ))
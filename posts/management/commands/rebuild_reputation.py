@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.reputation import rebuild_reputation
+
+
+class Command(BaseCommand):
+    help = 'Recompute User.score of every user from the Vote table with one grouped aggregate.'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        updated = rebuild_reputation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt reputation of {updated} users in {time.perf_counter() - start:.2f}s.'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.votes import reconcile_vote_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute votes_count of every question and answer from the Vote table.'
+
+    def handle(self, *args, **options):
+        updated = reconcile_vote_counts()
+        for model, count in updated.items():
+            self.stdout.write(self.style.SUCCESS(f'Reconciled votes_count for {count} {model} rows.'))
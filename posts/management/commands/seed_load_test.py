@@ -0,0 +1,69 @@
+import json
+import re
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.models import User
+from posts.models import Tag, Question, Answer
+
+
+WORD = re.compile(r'[a-z][a-z0-9+#.-]{2,}')
+STOP_WORDS = {'the', 'and', 'for', 'with', 'how', 'what', 'why', 'can', 'not', 'does', 'from', 'when', 'use', 'using'}
+
+
+class Command(BaseCommand):
+    help = ('Create the accounts the locust scenarios log in with and write the ids they pick from '
+            '(questions hottest first, answers, tags, search words) to a json file for loadtests/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='load test accounts, loadtest_<n>@example.com')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--questions', type=int, default=10000, help='most viewed questions to include')
+        parser.add_argument('--answers', type=int, default=20000)
+        parser.add_argument('--out', default='locust_seed.json')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        emails = [f'loadtest_{i}@example.com' for i in range(options['users'])]
+
+        # one hash for every account, hashing each password would take minutes
+        password = make_password(options['password'])
+        with transaction.atomic():
+            existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+            User.objects.filter(email__in=existing).update(password=password, is_active=True, is_verified=True)
+            User.objects.bulk_create(
+                User(email=email, username=email.split('@')[0], password=password, is_verified=True,
+                     first_name='Load', last_name='Test')
+                for email in emails if email not in existing
+            )
+
+        # rank 1 is the most viewed question, the scenarios pick ranks from a Zipf distribution
+        questions = list(Question.objects.order_by('-views', '-question_id')
+                         .values_list('question_id', 'question_title')[:options['questions']])
+        if not questions:
+            raise CommandError('No questions to load test against, import some with import_posts first.')
+        question_ids = [question_id for question_id, _ in questions]
+        answer_ids = list(Answer.objects.filter(question_id__in=question_ids[:1000])
+                          .order_by('question_id', 'answer_id').values_list('answer_id', flat=True)[:options['answers']])
+
+        words = Counter(word for _, title in questions for word in WORD.findall(title.lower()) if word not in STOP_WORDS)
+
+        seed = {
+            'password':options['password'],
+            'emails':emails,
+            'question_ids':question_ids,
+            'answer_ids':answer_ids,
+            'tags':list(Tag.objects.order_by('-question_count', 'tag_id').values_list('tag_title', flat=True)[:200]),
+            'search_words':[word for word, _ in words.most_common(500)],
+        }
+        with open(options['out'], 'w') as seed_file:
+            json.dump(seed, seed_file)
+
+        self.stdout.write(
+            f'{len(emails)} accounts ({len(existing)} already there), {len(question_ids)} questions, '
+            f'{len(answer_ids)} answers written to {options["out"]} in {time.perf_counter() - start:.1f}s.'
+        )
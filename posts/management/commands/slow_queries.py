@@ -0,0 +1,87 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, ProgrammingError
+
+from stackoverflow.slow_queries import slow_queries, clear_slow_queries
+
+
+class Command(BaseCommand):
+    help = ('Show the slow query log of the views grouped by statement, slowest total first, '
+            'or the top statements of pg_stat_statements.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='statements to show')
+        parser.add_argument('--view', help='only queries run by this view name')
+        parser.add_argument('--plans', action='store_true', help='print the latest EXPLAIN ANALYZE plan of each statement')
+        parser.add_argument('--statements', action='store_true',
+                            help='read pg_stat_statements instead of the log, every statement the database ran')
+        parser.add_argument('--clear', action='store_true', help='empty the log')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_slow_queries()
+            self.stdout.write('Slow query log cleared.')
+            return
+        if options['statements']:
+            return self.statements(options['limit'])
+
+        groups = defaultdict(list)
+        for entry in slow_queries():
+            if options['view'] is None or entry['view'] == options['view']:
+                groups[entry['sql']].append(entry)
+        if not groups:
+            self.stdout.write('No slow queries logged.')
+            return
+
+        ranked = sorted(groups.values(), key=lambda entries: -sum(entry['duration_ms'] for entry in entries))
+        for entries in ranked[:options['limit']]:
+            durations = [entry['duration_ms'] for entry in entries]
+            latest = entries[0]
+            views = sorted({entry['view'] for entry in entries})
+            seen = datetime.fromtimestamp(latest['at'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            self.stdout.write(self.style.WARNING(
+                f'{len(entries):>5}x  avg {sum(durations) / len(durations):8.1f} ms  max {max(durations):8.1f} ms  '
+                f'last {seen}  {", ".join(views)}'
+            ))
+            self.stdout.write(f'    {latest["sql"]}')
+            for frame in latest['stack'][-5:]:
+                self.stdout.write(f'      at {frame}')
+
+            plan = next((entry['plan'] for entry in entries if entry['plan']), None)
+            if plan:
+                self.stdout.write(
+                    f'    plan: {plan["Plan"]["Node Type"]}, execution {plan.get("Execution Time", 0):.1f} ms, '
+                    f'shared hit {plan["Plan"].get("Shared Hit Blocks", 0)} read {plan["Plan"].get("Shared Read Blocks", 0)}'
+                )
+                if options['plans']:
+                    self.stdout.write(json.dumps(plan, indent=2))
+
+    def statements(self, limit):
+        if connection.vendor != 'postgresql':
+            raise CommandError('pg_stat_statements needs postgres.')
+        try:
+            rows = self.top_statements(limit)
+        except ProgrammingError as e:
+            raise CommandError(f'pg_stat_statements is not available, migrate and preload the library first: {e}')
+
+        for calls, mean, total, returned, hit, read, query in rows:
+            hit_ratio = hit / (hit + read) if hit + read else 1
+            self.stdout.write(self.style.WARNING(
+                f'{calls:>8} calls  mean {mean:8.2f} ms  total {total / 1000:8.1f} s  '
+                f'{returned:>9} rows  cache hit {hit_ratio:.1%}'
+            ))
+            self.stdout.write(f'    {" ".join(query.split())[:300]}')
+
+    def top_statements(self, limit):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT calls, mean_exec_time, total_exec_time, rows, shared_blks_hit, shared_blks_read, query
+                FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                ORDER BY total_exec_time DESC
+                LIMIT %s
+            """, [limit])
+            return cursor.fetchall()
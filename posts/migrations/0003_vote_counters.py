@@ -0,0 +1,61 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def split_votes(apps, schema_editor):
+    """
+    Votes used to carry both a question and an answer. A row naming an answer is a vote on that
+    answer, its question is still reachable through the answer, so the question is cleared.
+    The counters are then recounted from what each row now targets.
+    """
+    Vote = apps.get_model('posts', 'Vote')
+    Vote.objects.filter(answer__isnull=False, question__isnull=False).update(question=None)
+
+    for model_name, field in (('Question', 'question'), ('Answer', 'answer')):
+        model = apps.get_model('posts', model_name)
+        totals = (Vote.objects.filter(**{field: OuterRef('pk')})
+                  .order_by()
+                  .values(field)
+                  .annotate(total=Sum('vote_type'))
+                  .values('total'))
+        model.objects.update(votes_count=Coalesce(Subquery(totals), 0))
+
+    # postgres refuses to ALTER a table with deferred foreign key checks still pending
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_alter_comment_created_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='votes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='answer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='posts.answer'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='posts.question'),
+        ),
+        migrations.RunPython(split_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('answer__isnull', True), ('question__isnull', False)), models.Q(('answer__isnull', False), ('question__isnull', True)), _connector='OR'), name='vote_on_question_or_answer'),
+        ),
+    ]
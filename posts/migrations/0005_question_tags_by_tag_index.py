@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_query_indexes'),
+    ]
+
+    # the auto created through table cannot declare Meta.indexes. Questions of a tag,
+    # newest first, become an index only scan instead of a join and a sort.
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS question_tags_tag_idx ON posts_question_tags (tag_id, question_id DESC);',
+            reverse_sql='DROP INDEX IF EXISTS question_tags_tag_idx;',
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_questions(apps, schema_editor):
+    Tag = apps.get_model('posts', 'Tag')
+    Through = apps.get_model('posts', 'Question').tags.through
+    totals = (Through.objects.filter(tag_id=OuterRef('pk'))
+              .order_by()
+              .values('tag_id')
+              .annotate(total=Count('question_id'))
+              .values('total'))
+    Tag.objects.update(question_count=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_question_tags_by_tag_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='question_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_questions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:20
+
+from django.contrib.postgres.operations import CreateExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_tag_question_count'),
+    ]
+
+    # per statement totals read by postgres-exporter, see queries.yml. The library has to be
+    # preloaded by the server (shared_preload_libraries), the operation is a no-op off postgres.
+    operations = [
+        CreateExtension('pg_stat_statements'),
+    ]
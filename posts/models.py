@@ -7,10 +7,23 @@ VOTE_CHOICE = (
     (-1, 'Downvote')
 )
 
+class QuestionQuerySet(models.QuerySet):
+    # shared prefetch plans, so each serializer renders in a constant number of queries
+    def for_list(self):
+        return self.prefetch_related(*question_list_prefetch())
+
+
+class AnswerQuerySet(models.QuerySet):
+    def for_thread(self):
+        return self.order_by('created_at', 'answer_id').prefetch_related(*answer_thread_prefetch())
+
+
 class Tag(models.Model):
     tag_id = models.AutoField(primary_key=True)
     tag_title = models.CharField(max_length=20, unique=True)
     tag_description = models.CharField(max_length=50, blank=True, null=True)
+    # maintained by posts.counters from the tags m2m signals
+    question_count = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         return str(f'{self.tag_id} - {self.tag_title}')
@@ -27,6 +40,17 @@ class Question(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset feed pagination, see QuestionCursorPagination
+            models.Index(fields=['created_at', 'question_id'], name='question_feed_idx'),
+            # hot question lists
+            models.Index(fields=['-votes_count', '-question_id'], name='question_votes_idx'),
+            models.Index(fields=['-views', '-question_id'], name='question_views_idx'),
+        ]
+
     def __str__(self):
         return str(f'{self.question_title} - {self.created_user.email} - {self.question_id}')
     
@@ -35,10 +59,19 @@ class Answer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='answers')
     created_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='answers')
     answer_description = models.TextField()
+    votes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AnswerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # answers of a question in thread order, see AnswerQuerySet.for_thread
+            models.Index(fields=['question', 'created_at', 'answer_id'], name='answer_thread_idx'),
+        ]
+
     def __str__(self):
         return str(f'{self.question.question_title} - {self.answer_id} - {self.created_user.email}')
 
@@ -51,26 +84,50 @@ class Comment(models.Model):
     comment_description = models.CharField(max_length=150, blank=False, null=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # a comment belongs to a question or to an answer, each partial index only holds one kind
+    class Meta:
+        indexes = [
+            models.Index(fields=['question', 'created_at', 'comment_id'], condition=models.Q(answer__isnull=True), name='comment_question_idx'),
+            models.Index(fields=['answer', 'created_at', 'comment_id'], condition=models.Q(question__isnull=True), name='comment_answer_idx'),
+        ]
+
     def __str__(self):
         return str(f'Created by : {self.created_user.email}')
     
 class Vote(models.Model):
     vote_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='votes')
-    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='votes')
-    answer = models.ForeignKey(Answer, on_delete=models.CASCADE, related_name='votes')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='votes', null=True, blank=True)
+    answer = models.ForeignKey(Answer, on_delete=models.CASCADE, related_name='votes', null=True, blank=True)
     vote_type = models.SmallIntegerField(choices=VOTE_CHOICE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # votes_count on Question / Answer is maintained incrementally by posts.votes
     class Meta:
         unique_together = (('user', 'question'), ('user', 'answer'))
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(question__isnull=False, answer__isnull=True) | models.Q(question__isnull=True, answer__isnull=False),
+                name='vote_on_question_or_answer',
+            ),
+        ]
+
+    def __str__(self):
+        return str(f'{self.user.email} - {self.vote_type}')
+
+
+# prefetch plans shared by the list, detail and answers endpoints
+def question_list_prefetch():
+    return ['tags']
+
+# the isnull filters match the partial comment indexes, without them the planner cannot use them
+def answer_thread_prefetch(prefix=''):
+    return [
+        models.Prefetch(f'{prefix}comments', queryset=Comment.objects.filter(question__isnull=True).order_by('created_at', 'comment_id')),
+    ]
 
-    def save(self, *args, **kwargs):
-        
-        if self.question:
-            self.question.votes_count = sum(v.vote_type for v in self.question.votes.all())
-            self.question.save()
-        elif self.answer:
-            self.answer.votes_count = sum(v.vote_type for v in self.answer.votes.all())
-            self.answer.save()
-        super().save(*args, **kwargs)
+def question_detail_prefetch():
+    return question_list_prefetch() + [
+        models.Prefetch('comments', queryset=Comment.objects.filter(answer__isnull=True).order_by('created_at', 'comment_id')),
+        models.Prefetch('answers', queryset=Answer.objects.order_by('created_at', 'answer_id')),
+    ] + answer_thread_prefetch(prefix='answers__')
@@ -1,6 +1,182 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.pagination import PageNumberPagination, BasePagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+
+class SearchPagination(CustomPagination):
+    """
+    Page number links for results that elasticsearch already sliced with from / size,
+    so only the current page is ever held in memory.
+    """
+
+    def get_page(self, request):
+        self.request = request
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number=request.query_params.get(self.page_query_param), message='Not a number.'))
+        return self.page_number, self.get_page_size(request)
+
+    def get_next_link(self):
+        if self.page_number * self.get_page_size(self.request) >= self.count:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data, count=0):
+        self.count = count
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class QuestionCursorPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, question_id).
+
+    Every page is a bounded `WHERE (created_at, question_id) > cursor LIMIT n`
+    query, so the cost of a page does not grow with the size of the table.
+    The cursor is an opaque token holding the key of the row the page starts after,
+    or for `previous` links the key of the row the page ends before.
+    There is no `count`, counting the whole table is what keyset pagination avoids.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('created_at', 'question_id')
+    invalid_cursor_message = 'Invalid cursor.'
+    reverse_prefix = '<|'
+
+    def __init__(self):
+        self.request = None
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_cursor(self, request):
+        return request.query_params.get(self.cursor_query_param) or None
+
+    def encode_cursor(self, obj, reverse=False):
+        position = f'{self.reverse_prefix if reverse else ""}{obj.created_at.isoformat()}|{obj.question_id}'
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """(reverse, created_at, question_id) of a cursor."""
+        try:
+            position = base64.urlsafe_b64decode(cursor.encode()).decode()
+            reverse = position.startswith(self.reverse_prefix)
+            if reverse:
+                position = position[len(self.reverse_prefix):]
+            created_at, question_id = position.rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            if not isinstance(created_at, datetime):
+                raise ValueError
+            return reverse, created_at, int(question_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def page_queryset(self, queryset, request):
+        """The queryset of the requested page with one extra row, to know whether another page exists."""
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+        self.cursor = self.get_cursor(request)
+        self.reverse = False
+
+        if self.cursor:
+            self.reverse, created_at, question_id = self.decode_cursor(self.cursor)
+            if self.reverse:
+                # walk backwards from the cursor, the rows are put back in order in finish_page
+                return queryset.filter(
+                    Q(created_at__lt=created_at) |
+                    Q(created_at=created_at, question_id__lt=question_id)
+                ).order_by(*(f'-{field}' for field in self.ordering))[:self.current_page_size + 1]
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) |
+                Q(created_at=created_at, question_id__gt=question_id)
+            )
+        return queryset.order_by(*self.ordering)[:self.current_page_size + 1]
+
+    def finish_page(self, rows):
+        more = len(rows) > self.current_page_size
+        page = rows[:self.current_page_size]
+        if self.reverse:
+            page.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, self.cursor is not None
+        self.next_cursor = self.encode_cursor(page[-1]) if page and has_next else None
+        self.previous_cursor = self.encode_cursor(page[0], reverse=True) if page and has_previous else None
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.finish_page([row async for row in self.page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_previous_link(self):
+        if self.previous_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class TagQuestionPagination(QuestionCursorPagination):
+    """
+    Keyset pagination over the redis sorted sets of posts.tag_feeds,
+    the cursor is the score of the last question served. Forward only, `previous` is always null.
+    """
+
+    def encode_cursor(self, score):
+        return base64.urlsafe_b64encode(str(score).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
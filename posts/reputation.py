@@ -0,0 +1,151 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, IntegerField, Sum
+from django.db.models.functions import Coalesce
+
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from stackoverflow.caching import RELEASE_LOCK_SCRIPT
+from users.models import User
+from .models import Vote
+
+
+# points the author of a post earns from one vote on it
+QUESTION_UPVOTE = 5
+ANSWER_UPVOTE = 10
+DOWNVOTE = -2
+
+# pending reputation deltas per user id, applied to User.score by `flush_reputation`
+PENDING_KEY = 'reputation:pending'
+BATCH_SIZE = 1000
+# one flush or rebuild at a time, a second flush would apply the batch being applied again
+LOCK_TIMEOUT = 300
+LOCK_POLL = 0.1
+
+
+def vote_points(vote_type, on_question):
+    if vote_type == 1:
+        return QUESTION_UPVOTE if on_question else ANSWER_UPVOTE
+    if vote_type == -1:
+        return DOWNVOTE
+    return 0
+
+
+def record_reputation(user_id, delta, pending_key=PENDING_KEY):
+    """Queue a reputation change, deltas of the same user add up in redis until the next flush."""
+    if delta:
+        get_redis_connection('default').hincrby(pending_key, user_id, delta)
+
+
+def apply_score_deltas(deltas):
+    """One `UPDATE ... SET score = COALESCE(score, 0) + CASE id WHEN ... END` per batch of users."""
+    deltas = list(deltas.items())
+    for start in range(0, len(deltas), BATCH_SIZE):
+        batch = dict(deltas[start:start + BATCH_SIZE])
+        User.objects.filter(id__in=batch).update(score=Coalesce('score', 0) + Case(
+            *[When(id=user_id, then=Value(delta)) for user_id, delta in batch.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+
+@contextmanager
+def reputation_lock(pending_key=PENDING_KEY, wait=0):
+    """
+    SET NX lock of the flushes and rebuilds of `pending_key`, yields whether it was taken
+    within `wait` seconds.
+    """
+    redis = get_redis_connection('default')
+    lock_key, token = f'{pending_key}:lock', uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not (acquired := redis.set(lock_key, token, nx=True, ex=LOCK_TIMEOUT)) and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+    try:
+        yield bool(acquired)
+    finally:
+        if acquired:
+            redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+
+def flush_reputation(pending_key=PENDING_KEY):
+    """
+    Apply every queued reputation delta to User.score and return the number of users updated.
+    The pending hash is renamed before it is read, so deltas recorded meanwhile wait for
+    the next flush, and a flush that fails leaves its batch to be retried. While another
+    flush or a rebuild runs it returns 0 and leaves the deltas to the next one.
+    """
+    with reputation_lock(pending_key) as acquired:
+        return _flush_reputation(pending_key) if acquired else 0
+
+
+def _flush_reputation(pending_key):
+    redis = get_redis_connection('default')
+    processing_key = f'{pending_key}:processing'
+
+    # a batch left behind by a failed flush goes first
+    if not redis.exists(processing_key):
+        try:
+            redis.rename(pending_key, processing_key)
+        except ResponseError:
+            # nothing pending
+            return 0
+
+    deltas = {int(user_id): int(delta) for user_id, delta in redis.hgetall(processing_key).items() if int(delta)}
+    with transaction.atomic():
+        apply_score_deltas(deltas)
+    redis.delete(processing_key)
+    return len(deltas)
+
+
+def reputation_totals():
+    """{user_id: reputation} from every vote, as one grouped aggregate query."""
+    points = Case(
+        When(vote_type=1, question__isnull=False, then=Value(QUESTION_UPVOTE)),
+        When(vote_type=1, then=Value(ANSWER_UPVOTE)),
+        default=Value(DOWNVOTE),
+        output_field=IntegerField(),
+    )
+    totals = (Vote.objects
+              .annotate(author=Coalesce('question__created_user', 'answer__created_user'))
+              .values('author')
+              .annotate(total=Sum(points))
+              .order_by()
+              .values_list('author', 'total'))
+    return dict(totals)
+
+
+def rebuild_reputation(discard_pending=True, wait=LOCK_TIMEOUT):
+    """
+    Recompute every User.score from the Vote table.
+    Pending deltas are dropped, the votes they stand for are counted by the totals. This runs
+    under the flush lock, waiting up to `wait` seconds for a running flush, and on postgres
+    with the vote table locked against writes, so no vote commits between dropping the
+    deltas and summing the votes.
+    """
+    with reputation_lock(wait=wait) as acquired:
+        if not acquired:
+            raise RuntimeError('A reputation flush holds the lock, try again later.')
+        return _rebuild_reputation(discard_pending)
+
+
+def _rebuild_reputation(discard_pending):
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {Vote._meta.db_table} IN SHARE MODE')
+        if discard_pending:
+            get_redis_connection('default').delete(PENDING_KEY, f'{PENDING_KEY}:processing')
+
+        totals = list(reputation_totals().items())
+        User.objects.exclude(score=0).update(score=0)
+        for start in range(0, len(totals), BATCH_SIZE):
+            batch = dict(totals[start:start + BATCH_SIZE])
+            User.objects.filter(id__in=batch).update(score=Case(
+                *[When(id=user_id, then=Value(total)) for user_id, total in batch.items()],
+                output_field=IntegerField(),
+            ))
+    return len(totals)
@@ -0,0 +1,90 @@
+import hashlib
+
+from elasticsearch_dsl import Q
+
+from stackoverflow.instrumentation import ELASTICSEARCH_SECONDS
+
+from .documents import QuestionDocument
+
+
+# elasticsearch refuses from + size beyond index.max_result_window
+MAX_RESULT_WINDOW = 10000
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+def search_cache_key(query, tags, created_after, created_before, page, page_size):
+    """Identical searches share one cache entry, whatever the case or spacing of the query."""
+    parts = [normalize_query(query), ','.join(sorted(tags)), created_after or '', created_before or '', page, page_size]
+    return hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+# fields sent back with every hit, the long text fields only come back as highlights
+RESULT_FIELDS = ['question_id', 'created_user', 'question_title', 'tags', 'views', 'votes_count', 'comments_count', 'created_at']
+
+# relevance is multiplied by 1 + log(views) / 10 + log(votes) + recency, so well received
+# and recent questions rank higher without drowning out the text match
+RANKING_FUNCTIONS = [
+    {'weight': 1},
+    {'field_value_factor': {'field': 'views', 'modifier': 'log1p', 'factor': 0.1, 'missing': 0}},
+    {'script_score': {'script': {'source': "Math.log1p(Math.max(doc['votes_count'].value, 0))"}}},
+    {'gauss': {'created_at': {'origin': 'now', 'scale': '30d', 'decay': 0.5}}},
+]
+
+
+def search_questions(query, tags=(), created_after=None, created_before=None, page=1, page_size=10):
+    """
+    Run one page of a question search in elasticsearch.
+    Pagination, filtering, ranking and highlighting are all done by elasticsearch and
+    every result is rendered from the document, so a page costs `page_size` hits
+    whatever its depth and no database query.
+    """
+    start = (page - 1) * page_size
+    if start >= MAX_RESULT_WINDOW:
+        raise ValueError(f'page {page} starts past the first {MAX_RESULT_WINDOW} results')
+
+    search = QuestionDocument.search()
+    text_match = Q("multi_match",
+                   query=query,
+                   fields=["question_title^3", "tags.tag_title^2", "question_description", "answers"])
+    search = search.query('function_score', query=text_match, functions=RANKING_FUNCTIONS,
+                          score_mode='sum', boost_mode='multiply')
+    # every requested tag has to be present
+    for tag in tags:
+        search = search.filter('term', **{'tags.tag_title': tag})
+    if created_after or created_before:
+        date_range = {}
+        if created_after:
+            date_range['gte'] = created_after
+        if created_before:
+            date_range['lte'] = created_before
+        search = search.filter('range', created_at=date_range)
+
+    search = search.source(RESULT_FIELDS)
+    search = search.highlight_options(pre_tags=['<em>'], post_tags=['</em>'], fragment_size=150, number_of_fragments=1)
+    search = search.highlight('question_title', 'question_description', 'answers')
+    search = search.extra(track_total_hits=MAX_RESULT_WINDOW)
+    with ELASTICSEARCH_SECONDS.labels('search').time():
+        # the last page of the window may be cut short, it is never shifted back
+        response = search[start:min(start + page_size, MAX_RESULT_WINDOW)].execute()
+
+    results = []
+    for hit in response:
+        source = hit.to_dict()
+        highlight = hit.meta.to_dict().get('highlight', {})
+        results.append({
+            "question_id":source.get('question_id'),
+            "created_user":source.get('created_user', {}).get('id'),
+            "username":source.get('created_user', {}).get('username'),
+            "question_title":source.get('question_title'),
+            "tags":[tag['tag_title'] for tag in source.get('tags', [])],
+            "views":source.get('views', 0),
+            "votes_count":source.get('votes_count', 0),
+            "comments_count":source.get('comments_count', 0),
+            "created_at":source.get('created_at'),
+            "highlight":{field: fragments[0] for field, fragments in highlight.items()},
+        })
+
+    return {'count':min(response.hits.total.value, MAX_RESULT_WINDOW), 'results':results}
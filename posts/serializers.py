@@ -1,53 +1,55 @@
 from rest_framework import serializers
+
+from stackoverflow.instrumentation import TimedSerializerMixin
 from .models import Tag, Question, Answer, Comment
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = ['tag_id', 'tag_title', 'tag_description']
+        fields = ['tag_id', 'tag_title', 'tag_description', 'question_count']
 
-class AllQuestionsSerializer(serializers.ModelSerializer):
+class AllQuestionsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = ['question_id', 'created_user', 'question_title', 'tags', 'views', 'comments_count', 'created_at']
         read_only_fields = ['created_user']
 
-class CreateQuestionSerializer(serializers.ModelSerializer):
+class CreateQuestionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Question
         fields = ['question_id', 'created_user', 'question_title', 'question_description', 'tags', 'views', 'votes_count', 'comments_count', 'created_at', 'updated_at']
         read_only_fields = ['question_id', 'created_user', 'views', 'votes_count', 'comments_count', 'created_at', 'updated_at']
 
-class CreateAnswerSerializer(serializers.ModelSerializer):
+class CreateAnswerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Answer
-        fields = ['answer_id', 'question', 'created_user', 'answer_description', 'comments_count', 'created_at', 'updated_at']
-        read_only_fields = ['answer_id', 'question', 'created_user', 'comments_count', 'created_at', 'updated_at']
+        fields = ['answer_id', 'question', 'created_user', 'answer_description', 'votes_count', 'comments_count', 'created_at', 'updated_at']
+        read_only_fields = ['answer_id', 'question', 'created_user', 'votes_count', 'comments_count', 'created_at', 'updated_at']
 
 
-class CreateCommentSerializer(serializers.ModelSerializer):
+class CreateCommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['comment_id', 'question', 'answer', 'created_user', 'comment_description', 'created_at',]
         read_only_fields = ['comment_id', 'question', 'answer', 'created_user', 'created_at']
 
-class AllCommentSerializer(serializers.ModelSerializer):
+class AllCommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['comment_id', 'created_user', 'comment_description', 'created_at']
         read_only_fields = ['comment_id', 'created_user', 'created_at']
 
-class AllAnswerSerializer(serializers.ModelSerializer):
+class AllAnswerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     comments = AllCommentSerializer(many=True, read_only=True)
     class Meta:
         model = Answer
-        fields = ['answer_id', 'created_user', 'answer_description', 'comments_count', 'created_at', 'updated_at', 'comments',]
+        fields = ['answer_id', 'created_user', 'answer_description', 'votes_count', 'comments_count', 'created_at', 'updated_at', 'comments',]
 
 
-class DetailQuestionView(serializers.ModelSerializer):
+class DetailQuestionView(TimedSerializerMixin, serializers.ModelSerializer):
 
     answers = AllAnswerSerializer(many=True, read_only=True)
     comments = AllCommentSerializer(many=True, read_only=True)
@@ -1,45 +1,117 @@
-from django.db.models.signals import post_save, post_delete
-from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 
 from .models import Question, Answer, Comment, Tag
-import hashlib
+from .caches import invalidate_question, invalidate_feed, tags_cache
+from .counters import adjust_question_counts, rebuild_popular_tags
+from .hot import forget_question
+from . import tag_feeds
 
 
-@receiver([post_save, post_delete], sender=Question)
-def clear_question_cache(sender, instance, **kwargs):
-    cache_key = hashlib.md5(f'{instance.question_id}'.encode()).hexdigest()
-    cache.delete(cache_key)
+@receiver(post_save, sender=Question)
+def clear_question_cache_on_save(sender, instance, created, **kwargs):
+    # a new question only lands on the last feed page, which is never cached
+    if not created:
+        invalidate_question(instance.question_id, summary=True)
+
+@receiver(post_delete, sender=Question)
+def clear_question_cache_on_delete(sender, instance, **kwargs):
+    invalidate_question(instance.question_id, summary=True, answers=True)
+    invalidate_feed()
+    forget_question(instance.question_id)
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def clear_question_cache_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        question_ids = pk_set if reverse else [instance.question_id]
+    elif action == 'pre_clear' and reverse:
+        question_ids = list(instance.questions.values_list('question_id', flat=True))
+    elif action == 'post_clear' and not reverse:
+        question_ids = [instance.question_id]
+    else:
+        return
+    for question_id in question_ids:
+        invalidate_question(question_id, summary=True)
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def update_tag_feeds_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # the sorted sets are only touched once the transaction commits
+    if not reverse:
+        if action == 'post_add':
+            tag_ids, questions = list(pk_set), [(instance.question_id, instance.votes_count)]
+            transaction.on_commit(lambda: tag_feeds.add_questions(tag_ids, questions))
+        elif action in ('post_remove', 'pre_clear'):
+            tag_ids = list(pk_set) if action == 'post_remove' else list(instance.tags.values_list('tag_id', flat=True))
+            transaction.on_commit(lambda: tag_feeds.remove_questions(tag_ids, [instance.question_id]))
+    elif action == 'post_add':
+        questions = list(Question.objects.filter(question_id__in=pk_set).values_list('question_id', 'votes_count'))
+        transaction.on_commit(lambda: tag_feeds.add_questions([instance.tag_id], questions))
+    elif action == 'post_remove':
+        question_ids = list(pk_set)
+        transaction.on_commit(lambda: tag_feeds.remove_questions([instance.tag_id], question_ids))
+    elif action == 'pre_clear':
+        tag_id = instance.tag_id
+        transaction.on_commit(lambda: tag_feeds.drop_tags([tag_id]))
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def update_question_counts_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # post_add only reports the links that were really created, removals report
+    # whatever was asked for, so they are counted before the rows go
+    Through = Question.tags.through
+    if action == 'post_add':
+        delta = {instance.tag_id: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1)
+    elif action == 'pre_remove' and reverse:
+        delta = {instance.tag_id: -Through.objects.filter(tag_id=instance.tag_id, question_id__in=pk_set).count()}
+    elif action == 'pre_remove':
+        delta = dict.fromkeys(Through.objects.filter(question_id=instance.question_id, tag_id__in=pk_set).values_list('tag_id', flat=True), -1)
+    elif action == 'pre_clear' and reverse:
+        delta = {instance.tag_id: -Through.objects.filter(tag_id=instance.tag_id).count()}
+    elif action == 'pre_clear':
+        delta = dict.fromkeys(instance.tags.values_list('tag_id', flat=True), -1)
+    else:
+        return
+    adjust_question_counts(delta)
+
+@receiver(pre_delete, sender=Question)
+def update_tags_on_question_delete(sender, instance, **kwargs):
+    # the through rows are removed without m2m_changed
+    tag_ids = list(instance.tags.values_list('tag_id', flat=True))
+    question_id = instance.question_id
+    adjust_question_counts(dict.fromkeys(tag_ids, -1))
+    transaction.on_commit(lambda: tag_feeds.remove_questions(tag_ids, [question_id]))
 
 @receiver([post_save, post_delete], sender=Answer)
 def clear_answer_cache(sender, instance, **kwargs):
-    question_id = instance.question.question_id
-    cache_key = hashlib.md5(f'{question_id}'.encode()).hexdigest()
-    cache.delete(cache_key)
+    invalidate_question(instance.question_id, answers=True)
 
 
 @receiver([post_save, post_delete], sender=Comment)
 def clear_comment_cache(sender, instance, **kwargs):
-    question_id = instance.question.question_id
-    cache_key = hashlib.md5(f'{question_id}'.encode()).hexdigest()
-    cache.delete(cache_key)
-
+    # comments_count is part of the feed row of a question, answers carry their own comments
+    if instance.question_id:
+        invalidate_question(instance.question_id, summary=True)
+    elif Comment.answer.is_cached(instance):
+        invalidate_question(instance.answer.question_id, answers=True)
+    else:
+        # only the question id is needed, don't load the whole answer row
+        question_id = Answer.objects.filter(pk=instance.answer_id).values_list('question_id', flat=True).first()
+        if question_id is not None:
+            invalidate_question(question_id, answers=True)
 
-@receiver(post_save, sender=Question)
-def clear_question_cache_on_create(sender, instance, created, **kwargs):
-    if created:
-        cache.delete('all_questions')
-
-@receiver(post_delete, sender=Question)
-def clear_question_cache_on_delete(sender, instance, **kwargs):
-    cache.delete('all_questions')
 
 @receiver(post_save, sender=Tag)
 def clear_tag_cache_on_save(sender, instance, created, **kwargs):
-    if created:
-        cache.delete('all_tags')
+    tags_cache.delete(tags_cache.key())
+    # titles are kept next to the popular tags, tags are only edited by admins
+    transaction.on_commit(rebuild_popular_tags)
 
-@receiver(post_delete, sender=Tag)
+@receiver(pre_delete, sender=Tag)
 def clear_tag_cache_on_delete(sender, instance, **kwargs):
-    cache.delete('all_tags')
-
+    # the through rows are removed without m2m_changed, so collect the questions first
+    for question_id in instance.questions.values_list('question_id', flat=True):
+        invalidate_question(question_id, summary=True)
+    tags_cache.delete(tags_cache.key())
+    tag_id = instance.tag_id
+    transaction.on_commit(lambda: tag_feeds.drop_tags([tag_id]))
+    transaction.on_commit(rebuild_popular_tags)
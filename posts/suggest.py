@@ -0,0 +1,47 @@
+from elasticsearch_dsl import MultiSearch
+
+from stackoverflow.caching import LocalLRUCache
+from stackoverflow.instrumentation import ELASTICSEARCH_SECONDS
+
+from .documents import QuestionDocument, TagDocument
+from .search import normalize_query
+
+
+MAX_PREFIX_LENGTH = 50
+MAX_SUGGESTIONS = 10
+
+# keystrokes repeat the same short prefixes over and over, answer them from process memory
+suggest_cache = LocalLRUCache('suggest', maxsize=4096, ttl=60)
+
+
+def suggest(prefix, limit=5):
+    """
+    Question titles and tags starting with `prefix`, from the completion suggesters
+    of both indices in a single elasticsearch round trip.
+    """
+    prefix = normalize_query(prefix)[:MAX_PREFIX_LENGTH]
+    if not prefix:
+        return {'questions':[], 'tags':[]}
+    return suggest_cache.get_or_build((prefix, limit), lambda: fetch_suggestions(prefix, limit))
+
+
+def fetch_suggestions(prefix, limit):
+    completion = {'size': limit, 'skip_duplicates': True}
+    questions = QuestionDocument.search().source(['question_id', 'question_title']).extra(size=0)
+    questions = questions.suggest('titles', prefix, completion={'field': 'title_suggest', **completion})
+    tags = TagDocument.search().source(['tag_title']).extra(size=0)
+    tags = tags.suggest('tags', prefix, completion={'field': 'tag_suggest', **completion})
+
+    with ELASTICSEARCH_SECONDS.labels('suggest').time():
+        question_response, tag_response = MultiSearch().add(questions).add(tags).execute()
+
+    return {
+        'questions':[
+            {
+                'question_id':option._source.question_id,
+                'question_title':option._source.question_title,
+            }
+            for option in question_response.suggest.titles[0].options
+        ],
+        'tags':[option._source.tag_title for option in tag_response.suggest.tags[0].options],
+    }
@@ -0,0 +1,142 @@
+from django.db.models import Q
+from django_redis import get_redis_connection
+
+from .models import Question
+
+
+# every tag has one redis sorted set per ordering, members are question ids.
+# scores are unique so they double as keyset cursors:
+#   newest  the question id, ids are handed out in creation order
+#   votes   votes_count * VOTES_SCALE + question id, ties on votes go to the newer question
+FEED_KEY = 'tag_questions:{}:{}'
+TRUNCATED_KEY = 'tag_questions:{}:{}:truncated'
+SORTS = ('newest', 'votes')
+VOTES_SCALE = 10 ** 9
+
+# the hottest part of a tag lives in redis, deeper pages are read from the database
+MAX_FEED_LENGTH = 5000
+# sets are rebuilt from the database this often, which also heals any missed update
+FEED_TIMEOUT = 60 * 60
+
+# adds or moves a question in a set that already exists. When the set was cut at
+# MAX_FEED_LENGTH a question scoring below its tail is left to the database, so the
+# set always stays a gapless prefix of the ordering.
+UPSERT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local tail = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    if tail[2] and tonumber(ARGV[1]) < tonumber(tail[2]) then
+        redis.call('ZREM', KEYS[1], ARGV[2])
+        return 0
+    end
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('ZCARD', KEYS[1]) > tonumber(ARGV[3]) then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, 0)
+    redis.call('SET', KEYS[2], 1, 'PX', redis.call('PTTL', KEYS[1]))
+end
+return 1
+"""
+
+
+def score(sort, question_id, votes_count):
+    if sort == 'votes':
+        return votes_count * VOTES_SCALE + question_id
+    return question_id
+
+
+def _from_database(tag_id, sort, before, limit):
+    """(question_id, score) pairs of `tag_id` scoring below `before`, best first."""
+    if sort == 'newest':
+        # index only scan on the (tag_id, question_id) index of the through table
+        rows = Question.tags.through.objects.filter(tag_id=tag_id)
+        if before is not None:
+            rows = rows.filter(question_id__lt=before)
+        return [(question_id, question_id) for question_id in
+                rows.order_by('-question_id').values_list('question_id', flat=True)[:limit]]
+
+    rows = Question.objects.filter(tags=tag_id)
+    if before is not None:
+        votes, question_id = divmod(before, VOTES_SCALE)
+        rows = rows.filter(Q(votes_count__lt=votes) | Q(votes_count=votes, question_id__lt=question_id))
+    rows = rows.order_by('-votes_count', '-question_id').values_list('question_id', 'votes_count')[:limit]
+    return [(question_id, score(sort, question_id, votes_count)) for question_id, votes_count in rows]
+
+
+def rebuild(tag_id, sort):
+    redis = get_redis_connection('default')
+    key, truncated_key = FEED_KEY.format(tag_id, sort), TRUNCATED_KEY.format(tag_id, sort)
+    rows = _from_database(tag_id, sort, None, MAX_FEED_LENGTH)
+
+    pipe = redis.pipeline()
+    pipe.delete(key, truncated_key)
+    if rows:
+        pipe.zadd(key, {question_id: row_score for question_id, row_score in rows})
+        pipe.expire(key, FEED_TIMEOUT)
+        if len(rows) == MAX_FEED_LENGTH:
+            pipe.set(truncated_key, 1, ex=FEED_TIMEOUT)
+    pipe.execute()
+
+
+def tag_question_page(tag_id, sort, before=None, page_size=10):
+    """
+    One page of the questions of `tag_id` as (question_ids, next_cursor).
+    `before` is the cursor of the previous page, the score of its last question.
+    """
+    redis = get_redis_connection('default')
+    key = FEED_KEY.format(tag_id, sort)
+    if not redis.exists(key):
+        rebuild(tag_id, sort)
+
+    high = f'({before}' if before is not None else '+inf'
+    rows = [(int(question_id), int(row_score)) for question_id, row_score in
+            redis.zrevrangebyscore(key, high, '-inf', start=0, num=page_size + 1, withscores=True)]
+
+    if len(rows) <= page_size and redis.exists(TRUNCATED_KEY.format(tag_id, sort)):
+        # ran past the end of the set, carry on in the database
+        last = rows[-1][1] if rows else before
+        rows += _from_database(tag_id, sort, last, page_size + 1 - len(rows))
+
+    page = rows[:page_size]
+    next_cursor = page[-1][1] if len(rows) > page_size else None
+    return [question_id for question_id, _ in page], next_cursor
+
+
+def add_questions(tag_ids, questions):
+    """Add or move `questions` ((question_id, votes_count) pairs) in the sets of `tag_ids`."""
+    redis = get_redis_connection('default')
+    upsert = redis.register_script(UPSERT_SCRIPT)
+    pipe = redis.pipeline()
+    for tag_id in tag_ids:
+        for sort in SORTS:
+            keys = [FEED_KEY.format(tag_id, sort), TRUNCATED_KEY.format(tag_id, sort)]
+            for question_id, votes_count in questions:
+                upsert(keys=keys, args=[score(sort, question_id, votes_count), question_id, MAX_FEED_LENGTH], client=pipe)
+    pipe.execute()
+
+
+def remove_questions(tag_ids, question_ids):
+    if not question_ids:
+        return
+    redis = get_redis_connection('default')
+    pipe = redis.pipeline()
+    for tag_id in tag_ids:
+        for sort in SORTS:
+            pipe.zrem(FEED_KEY.format(tag_id, sort), *question_ids)
+    pipe.execute()
+
+
+def drop_tags(tag_ids):
+    keys = [key.format(tag_id, sort) for tag_id in tag_ids for sort in SORTS for key in (FEED_KEY, TRUNCATED_KEY)]
+    if keys:
+        get_redis_connection('default').delete(*keys)
+
+
+def refresh_question(question_id):
+    """Move a question whose votes changed within the sets of its tags."""
+    row = Question.objects.filter(question_id=question_id).values_list('votes_count', flat=True).first()
+    if row is not None:
+        tag_ids = Question.tags.through.objects.filter(question_id=question_id).values_list('tag_id', flat=True)
+        add_questions(list(tag_ids), [(question_id, row)])
@@ -4,6 +4,11 @@ from django.core.mail import send_mail
 from celery import shared_task
 from django.conf import settings
 
+from .counters import flush_view_buffer, reconcile_tag_counts
+from .indexing import flush_pending_documents
+from .hot import refresh_hot_questions as store_hot_questions
+from .reputation import flush_reputation
+
 
 @shared_task
 def send_answer_notification_mail(email, question_title):
@@ -17,3 +22,37 @@ def send_answer_notification_mail(email, question_title):
     except Exception as e:
         print(f'Failed to send mail to {email}. Error : {e}')
 
+
+@shared_task
+def flush_question_views():
+    flushed = flush_view_buffer()
+    print(f'Flushed {flushed} buffered question views.')
+    return flushed
+
+
+@shared_task
+def flush_search_index():
+    flushed = flush_pending_documents()
+    print(f'Pushed {flushed} questions to the search index.')
+    return flushed
+
+
+@shared_task
+def reconcile_question_counts():
+    updated = reconcile_tag_counts()
+    print(f'Reconciled question_count of {updated} tags.')
+    return updated
+
+
+@shared_task
+def refresh_hot_questions():
+    stored = store_hot_questions()
+    print(f'Stored {stored} hot questions.')
+    return stored
+
+
+@shared_task
+def apply_reputation():
+    updated = flush_reputation()
+    print(f'Applied reputation changes of {updated} users.')
+    return updated
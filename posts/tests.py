@@ -1,3 +1,1003 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import aprefetch_related_objects
+from django.urls import include, path
+from django.utils import timezone
 
-# Create your tests here.
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+import threading
+import asyncio
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+import time
+
+from elasticsearch_dsl.response import Response as ESResponse
+from prometheus_client import REGISTRY
+
+from stackoverflow.caching import CacheFamily, _async_clients
+from stackoverflow.instrumentation import QueryMetricsMiddleware, install_query_wrapper
+from stackoverflow.profiling import IDLE_FRAMES, StackSampler, frame_label, function_label, rolling_stacks, store_sample, top_functions
+from stackoverflow.slow_queries import slow_queries, clear_slow_queries, redact
+
+from asgiref.sync import sync_to_async
+from django_redis import get_redis_connection
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.schemas.generators import is_api_view
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+from .models import Tag, Question, Answer, Comment, Vote
+from .counters import flush_view_buffer, reconcile_tag_counts
+from .votes import reconcile_vote_counts
+from . import async_views
+from .caches import detail_cache
+from .urls import post_urlpatterns
+from .suggest import suggest_cache
+from .search import MAX_RESULT_WINDOW, search_questions
+from .indexing import PENDING_KEY, flush_pending_documents
+from .documents import QuestionDocument
+from .hot import refresh_hot_questions, HOT_KEY, HOT_EMPTY_KEY, HOT_LOCK_KEY
+from .reputation import flush_reputation, rebuild_reputation, reputation_lock, PENDING_KEY as REPUTATION_PENDING_KEY
+
+
+class AsgiURLConf:
+    # the routes with SERVER_MODE = 'asgi', for the tests of the async views
+    urlpatterns = [path('api/', include(post_urlpatterns(async_views)))]
+
+
+class PrefetchQueryCountTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.tags = [Tag.objects.create(tag_title=f'tag-{i}') for i in range(3)]
+
+    def create_thread(self, answers, comments):
+        question = Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+        question.tags.set(self.tags)
+        for _ in range(comments):
+            Comment.objects.create(question=question, created_user=self.user, comment_description='comment')
+        for _ in range(answers):
+            answer = Answer.objects.create(question=question, created_user=self.user, answer_description='answer')
+            for _ in range(comments):
+                Comment.objects.create(answer=answer, created_user=self.user, comment_description='comment')
+        cache.clear()
+        return question
+
+    def test_detail_question_view_query_count_is_constant(self):
+        small = self.create_thread(answers=1, comments=1)
+        large = self.create_thread(answers=30, comments=10)
+
+        # read views, fetch question, then tags, comments, answers and answer comments
+        for question in (small, large):
+            with self.assertNumQueries(6):
+                response = self.client.get(f'/api/question/{question.question_id}/detail/')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(response.data['data']['answers']), 30)
+        self.assertEqual(len(response.data['data']['answers'][0]['comments']), 10)
+
+    def test_get_answers_for_question_query_count_is_constant(self):
+        question = self.create_thread(answers=30, comments=10)
+
+        # fetch question, answers and answer comments
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/question/{question.question_id}/answers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 30)
+
+    def test_all_question_query_count_is_constant(self):
+        for _ in range(10):
+            self.create_thread(answers=0, comments=0)
+
+        # fetch page, prefetch tags
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/questions/?page_size=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']['data']), 10)
+
+
+class ImportPostsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        Tag.objects.create(tag_title='python')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, header, rows):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='') as csv_file:
+            csv_file.write('\n'.join([header] + rows) + '\n')
+        return path
+
+    def run_import(self, **files):
+        out = StringIO()
+        with mock.patch('posts.management.commands.import_posts.enqueue_question_ids') as enqueue:
+            call_command('import_posts', chunk_size=2, stdout=out, **files)
+        queued = [question_id for call in enqueue.call_args_list for question_id in call.args[0]]
+        return out.getvalue(), queued
+
+    def test_questions_imported_in_chunks_with_tags(self):
+        user = self.user.pk
+        questions = self.write('questions.csv', 'question_title,question_description,tags,created_user', [
+            f'First,Description,"python, django",{user}',
+            f'Second,Description,django,{user}',
+            f'Third,Description,,{user}',
+            f',No title,python,{user}',
+            'No user,Description,python,999999',
+            f'Fifth,Description,"rust,python",{user}',
+        ])
+        output, queued = self.run_import(questions=questions)
+
+        self.assertIn('Imported 4 questions', output)
+        self.assertIn('skipped 2', output)
+        self.assertEqual(
+            sorted(Question.objects.values_list('question_title', flat=True)), ['Fifth', 'First', 'Second', 'Third']
+        )
+        # tags are created once and shared across chunks, counts follow the imported rows
+        self.assertEqual(dict(Tag.objects.values_list('tag_title', 'question_count')), {'python':2, 'django':2, 'rust':1})
+        self.assertEqual(
+            set(Question.objects.get(question_title='First').tags.values_list('tag_title', flat=True)), {'python', 'django'}
+        )
+        self.assertEqual(sorted(queued), sorted(Question.objects.values_list('question_id', flat=True)))
+
+    def test_answers_and_comments_skip_unknown_targets(self):
+        question = Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+        other = Question.objects.create(created_user=self.user, question_title='Other', question_description='Description')
+        user, question_id = self.user.pk, question.question_id
+        answers = self.write('answers.csv', 'answer_description,question,created_user', [
+            f'Answer,{question_id},{user}',
+            f'Answer,999999,{user}',
+            f',{question_id},{user}',
+            f'Answer,not a number,{user}',
+        ])
+        comments = self.write('comments.csv', 'comment_description,question,created_user', [
+            f'Comment,{question_id},{user}',
+            f'Comment,{question_id},{user}',
+            f'Comment,{other.question_id},999999',
+        ])
+        output, queued = self.run_import(answers=answers, question_comments=comments)
+
+        self.assertIn('Imported 1 answers', output)
+        self.assertIn('skipped 3', output)
+        self.assertIn('Imported 2 question comments', output)
+        question.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((question.comments_count, other.comments_count), (2, 0))
+        self.assertEqual(sorted(set(queued)), [question_id])
+
+
+class BufferedViewCounterTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.question = Question.objects.create(created_user=user, question_title='Title', question_description='Description')
+
+    def test_views_are_buffered_until_flushed(self):
+        url = f'/api/question/{self.question.question_id}/detail/'
+        responses = [self.client.get(url) for _ in range(3)]
+
+        self.assertEqual([r.data['data']['views'] for r in responses], [1, 2, 3])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.views, 0)
+
+        self.assertEqual(flush_view_buffer(), 3)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.views, 3)
+        self.assertEqual(self.client.get(url).data['data']['views'], 4)
+
+
+class VoteCounterTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.voter = User.objects.create_user('voter', 'voter@example.com', 'password')
+        self.client.force_authenticate(self.voter)
+        self.question = Question.objects.create(created_user=author, question_title='Title', question_description='Description')
+        self.answer = Answer.objects.create(question=self.question, created_user=author, answer_description='answer')
+
+    def test_vote_flip_and_retract_on_question(self):
+        question_id = self.question.question_id
+
+        response = self.client.post(f'/api/question/{question_id}/upvote/')
+        self.assertEqual(response.data['data']['votes_count'], 1)
+        response = self.client.post(f'/api/question/{question_id}/upvote/')
+        self.assertEqual(response.data['data']['votes_count'], 1)
+        response = self.client.post(f'/api/question/{question_id}/downvote/')
+        self.assertEqual(response.data['data']['votes_count'], -1)
+        response = self.client.delete(f'/api/question/{question_id}/vote/delete/')
+        self.assertEqual(response.data['data']['votes_count'], 0)
+        response = self.client.delete(f'/api/question/{question_id}/vote/delete/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_vote_on_answer(self):
+        response = self.client.post(f'/api/answer/{self.answer.answer_id}/upvote/')
+        self.assertEqual(response.data['data']['votes_count'], 1)
+        self.answer.refresh_from_db()
+        self.assertEqual(self.answer.votes_count, 1)
+
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.votes_count, 0)
+
+    def test_reconcile_vote_counts(self):
+        Vote.objects.create(user=self.voter, question=self.question, vote_type=1)
+        Vote.objects.create(user=self.voter, answer=self.answer, vote_type=-1)
+        Question.objects.update(votes_count=42)
+
+        reconcile_vote_counts()
+        self.question.refresh_from_db()
+        self.answer.refresh_from_db()
+        self.assertEqual(self.question.votes_count, 1)
+        self.assertEqual(self.answer.votes_count, -1)
+
+
+class ConcurrentCommentCounterTest(TransactionTestCase):
+
+    threads = 8
+    comments_per_thread = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.question = Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+        self.answer = Answer.objects.create(question=self.question, created_user=self.user, answer_description='answer')
+
+    def hammer(self, url):
+        def post_comments():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                return [client.post(url, {'comment_description':'comment'}).status_code for _ in range(self.comments_per_thread)]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            results = list(executor.map(lambda _: post_comments(), range(self.threads)))
+        self.assertTrue(all(code == 200 for codes in results for code in codes))
+
+    def test_no_lost_increments_on_question(self):
+        self.hammer(f'/api/comment/question/{self.question.question_id}/create/')
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.comments_count, self.threads * self.comments_per_thread)
+
+    def test_no_lost_increments_on_answer(self):
+        self.hammer(f'/api/comment/answer/{self.answer.answer_id}/create/')
+        self.answer.refresh_from_db()
+        self.assertEqual(self.answer.comments_count, self.threads * self.comments_per_thread)
+
+    def test_delete_comment_decrements(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f'/api/comment/question/{self.question.question_id}/create/', {'comment_description':'comment'})
+        client.delete(f'/api/comment/{response.data["data"]["comment_id"]}/delete/')
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.comments_count, 0)
+
+
+class CacheInvalidationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.questions = [
+            Question.objects.create(created_user=self.user, question_title=f'Title {i}', question_description='Description')
+            for i in range(4)
+        ]
+
+    def test_update_only_refreshes_the_question_row(self):
+        self.client.get('/api/questions/?page_size=2')
+        question = self.questions[0]
+        self.client.patch(f'/api/question/{question.question_id}/update/', {'question_title':'Updated'})
+
+        # page of ids is still cached, only the changed row is rendered again
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/questions/?page_size=2')
+        self.assertEqual(response.data['results']['data'][0]['question_title'], 'Updated')
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/questions/?page_size=2')
+
+    def test_new_question_shows_up_on_the_last_page(self):
+        first = self.client.get('/api/questions/?page_size=2')
+        last = self.client.get(first.data['next'])
+        self.assertIsNone(last.data['next'])
+
+        Question.objects.create(created_user=self.user, question_title='New', question_description='Description')
+        last = self.client.get(first.data['next'])
+        self.assertIsNotNone(last.data['next'])
+        self.assertEqual(self.client.get(last.data['next']).data['results']['data'][0]['question_title'], 'New')
+
+    def test_previous_link_walks_back(self):
+        first = self.client.get('/api/questions/?page_size=2')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(second.data['next'])
+
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results']['data'], first.data['results']['data'])
+        self.assertIsNone(back.data['previous'])
+        self.assertEqual(self.client.get(back.data['next']).data['results']['data'], second.data['results']['data'])
+
+    def test_detail_is_refreshed_after_new_answer(self):
+        question = self.questions[0]
+        self.client.get(f'/api/question/{question.question_id}/detail/')
+        self.client.post(f'/api/question/{question.question_id}/answer/create/', {'answer_description':'answer'})
+        response = self.client.get(f'/api/question/{question.question_id}/detail/')
+        self.assertEqual(len(response.data['data']['answers']), 1)
+
+    def test_answer_comment_refreshes_detail_without_loading_the_answer(self):
+        question = self.questions[0]
+        answer = Answer.objects.create(question=question, created_user=self.user, answer_description='answer')
+        self.client.get(f'/api/question/{question.question_id}/detail/')
+
+        comment = Comment(answer_id=answer.answer_id, created_user=self.user, comment_description='comment')
+        with CaptureQueriesContext(connection) as queries:
+            comment.save()
+        self.assertFalse(any('"posts_answer"."answer_description"' in query['sql'] for query in queries))
+
+        response = self.client.get(f'/api/question/{question.question_id}/detail/')
+        self.assertEqual(len(response.data['data']['answers'][0]['comments']), 1)
+
+
+class StampedeProtectionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.family = CacheFamily('stampede_test', timeout=60)
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        time.sleep(0.2)
+        return 'value'
+
+    def test_cold_key_is_built_once(self):
+        key = self.family.key('cold')
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            values = list(executor.map(lambda _: self.family.get_or_build(key, self.build), range(8)))
+        self.assertEqual(values, ['value'] * 8)
+        self.assertEqual(self.builds, 1)
+
+    def test_stale_value_is_served_while_rebuilding(self):
+        key = self.family.key('stale')
+        cache.set(key, {'value':'old', 'expires':time.time() - 1, 'delta':0.1})
+        token = self.family.acquire(key)
+
+        self.assertEqual(self.family.get_or_build(key, self.build), 'old')
+        self.assertEqual(self.builds, 0)
+
+        self.family.release(key, token)
+        self.assertEqual(self.family.get_or_build(key, self.build), 'value')
+        self.assertEqual(self.builds, 1)
+
+
+    def test_expired_lock_is_not_released_by_its_old_owner(self):
+        key = self.family.key('slow')
+        first = self.family.acquire(key)
+        # the first build outlived lock_timeout and another request took the lock
+        cache.delete(f'{key}:lock')
+        second = self.family.acquire(key)
+        self.assertIsNotNone(second)
+
+        self.family.release(key, first)
+        self.assertIsNone(self.family.acquire(key))
+        self.family.release(key, second)
+        self.assertIsNotNone(self.family.acquire(key))
+
+
+class SuggestTest(TestCase):
+
+    def setUp(self):
+        suggest_cache.clear()
+        self.client = APIClient()
+
+    def fake_responses(self, search):
+        responses = []
+        for s in search._searches:
+            name, option = ('titles', {'_source':{'question_id':1, 'question_title':'Django ORM'}}) if 'titles' in s.to_dict()['suggest'] \
+                else ('tags', {'_source':{'tag_title':'django'}})
+            responses.append(ESResponse(s, {'hits':{'hits':[]}, 'suggest':{name:[{'text':'dj', 'options':[option]}]}}))
+        return responses
+
+    def test_repeated_prefix_is_served_from_memory(self):
+        with mock.patch('elasticsearch_dsl.MultiSearch.execute', autospec=True, side_effect=self.fake_responses) as execute:
+            first = self.client.get('/api/suggest/?q=Dj')
+            second = self.client.get('/api/suggest/?q=dj ')
+        self.assertEqual(first.data['data'], {'questions':[{'question_id':1, 'question_title':'Django ORM'}], 'tags':['django']})
+        self.assertEqual(second.data['data'], first.data['data'])
+        self.assertEqual(execute.call_count, 1)
+
+    def test_empty_prefix_skips_elasticsearch(self):
+        with mock.patch('elasticsearch_dsl.MultiSearch.execute') as execute:
+            response = self.client.get('/api/suggest/?q=')
+        self.assertEqual(response.data['data'], {'questions':[], 'tags':[]})
+        execute.assert_not_called()
+
+
+class SearchIndexQueueTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.redis = get_redis_connection('default')
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.question = Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+
+    def pending(self):
+        return {int(question_id) for question_id in self.redis.smembers(PENDING_KEY)}
+
+    @override_settings(ELASTICSEARCH_DSL_AUTOSYNC=True)
+    def test_repeated_saves_coalesce_into_one_flush(self):
+        with mock.patch('posts.tasks.flush_search_index.apply_async') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                for views in range(3):
+                    self.question.views = views
+                    self.question.save()
+                Answer.objects.create(question=self.question, created_user=self.user, answer_description='answer')
+                Comment.objects.create(question=self.question, created_user=self.user, comment_description='comment')
+
+        self.assertEqual(self.pending(), {self.question.question_id})
+        schedule.assert_called_once()
+
+    def test_flush_indexes_existing_and_deletes_missing_questions(self):
+        self.redis.sadd(PENDING_KEY, self.question.question_id, 999999)
+        deleted_twice = {'delete':{'_id':'999999', 'status':404}}
+
+        def bulk(document, actions, **kwargs):
+            bulk.calls.append(list(actions))
+            return 1, [deleted_twice]
+        bulk.calls = []
+
+        with mock.patch.object(QuestionDocument, 'bulk', autospec=True, side_effect=bulk) as patched:
+            self.assertEqual(flush_pending_documents(), 2)
+        ops = sorted((action['_op_type'], int(action['_id'])) for action in bulk.calls[0])
+        self.assertEqual(ops, [('delete', 999999), ('index', self.question.question_id)])
+        patched.assert_called_once()
+        self.assertEqual(self.pending(), set())
+
+    def test_failed_bulk_requeues_the_ids(self):
+        self.redis.sadd(PENDING_KEY, self.question.question_id)
+        with mock.patch.object(QuestionDocument, 'bulk', side_effect=ConnectionError('elasticsearch is down')):
+            with self.assertRaises(ConnectionError):
+                flush_pending_documents()
+        self.assertEqual(self.pending(), {self.question.question_id})
+
+    def test_bulk_errors_log_the_failed_ids(self):
+        self.redis.sadd(PENDING_KEY, self.question.question_id)
+        failed = {'index':{'_id':str(self.question.question_id), 'status':400, 'error':'mapper_parsing_exception'}}
+        with mock.patch.object(QuestionDocument, 'bulk', return_value=(0, [failed])):
+            with self.assertLogs('posts.indexing', 'ERROR') as logs:
+                flush_pending_documents()
+        self.assertIn(f"['{self.question.question_id}']", logs.output[0])
+
+    def test_flush_works_through_batches(self):
+        questions = [self.question] + [
+            Question.objects.create(created_user=self.user, question_title=f'Title {i}', question_description='Description')
+            for i in range(4)
+        ]
+        self.redis.sadd(PENDING_KEY, *[question.question_id for question in questions])
+        with mock.patch.object(QuestionDocument, 'bulk', return_value=(2, [])) as bulk:
+            self.assertEqual(flush_pending_documents(batch_size=2), 5)
+        self.assertEqual(bulk.call_count, 3)
+        self.assertEqual(self.pending(), set())
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_impossible_date_is_a_bad_request(self):
+        with mock.patch('posts.async_views.search_questions') as search:
+            for value in ('yesterday', '2024-13-45', '2024-02-30T10:00:00'):
+                response = self.client.get(f'/api/questions/?search=django&created_after={value}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(value, response.json()['message'])
+        search.assert_not_called()
+
+    def test_page_past_the_result_window_is_not_found(self):
+        with mock.patch('posts.async_views.search_questions') as search:
+            response = self.client.get(f'/api/questions/?search=django&page_size=10&page={MAX_RESULT_WINDOW // 10 + 1}')
+        self.assertEqual(response.status_code, 404)
+        search.assert_not_called()
+
+    def test_last_page_of_the_window_is_cut_short_not_shifted(self):
+        slices = []
+
+        def execute(search):
+            slices.append((search.to_dict()['from'], search.to_dict()['size']))
+            return ESResponse(search, {'hits':{'hits':[], 'total':{'value':MAX_RESULT_WINDOW, 'relation':'gte'}}})
+
+        with mock.patch('elasticsearch_dsl.Search.execute', autospec=True, side_effect=execute):
+            search_questions('django', page=MAX_RESULT_WINDOW // 30 + 1, page_size=30)
+            with self.assertRaises(ValueError):
+                search_questions('django', page=MAX_RESULT_WINDOW // 30 + 2, page_size=30)
+        self.assertEqual(slices, [(MAX_RESULT_WINDOW // 30 * 30, MAX_RESULT_WINDOW % 30)])
+
+
+class TagQuestionsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.tag = Tag.objects.create(tag_title='python')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.questions = []
+            for i in range(5):
+                question = Question.objects.create(created_user=self.user, question_title=f'Title {i}', question_description='Description', votes_count=i % 3)
+                question.tags.add(self.tag)
+                self.questions.append(question)
+
+    def titles(self, url):
+        titles = []
+        while url:
+            response = self.client.get(url)
+            titles += [row['question_title'] for row in response.data['results']['data']]
+            url = response.data['next']
+        return titles
+
+    def test_newest_first_across_pages(self):
+        self.assertEqual(self.titles('/api/tags/python/questions/?page_size=2'), [f'Title {i}' for i in reversed(range(5))])
+
+    def test_votes_order_follows_new_votes(self):
+        self.assertEqual(self.titles('/api/tags/python/questions/?sort=votes'), ['Title 2', 'Title 4', 'Title 1', 'Title 3', 'Title 0'])
+
+        for name in ('first', 'second'):
+            self.client.force_authenticate(User.objects.create_user(name, f'{name}@example.com', 'password'))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/api/question/{self.questions[0].question_id}/upvote/')
+        self.assertEqual(self.titles('/api/tags/python/questions/?sort=votes&page_size=2')[:2], ['Title 2', 'Title 0'])
+
+    def test_untagged_question_leaves_the_page(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.questions[4].tags.remove(self.tag)
+        self.assertEqual(self.titles('/api/tags/python/questions/')[0], 'Title 3')
+
+    def test_pages_past_a_truncated_set_come_from_the_database(self):
+        with mock.patch('posts.tag_feeds.MAX_FEED_LENGTH', 3):
+            with self.captureOnCommitCallbacks(execute=True):
+                question = Question.objects.create(created_user=self.user, question_title='Old favourite', question_description='Description', votes_count=-1)
+                question.tags.add(self.tag)
+            self.assertEqual(
+                self.titles('/api/tags/python/questions/?sort=votes&page_size=2'),
+                ['Title 2', 'Title 4', 'Title 1', 'Title 3', 'Title 0', 'Old favourite']
+            )
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.client.get('/api/tags/nope/questions/').status_code, 404)
+
+
+class TagQuestionCountTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.python, self.django = Tag.objects.create(tag_title='python'), Tag.objects.create(tag_title='django')
+        self.questions = [
+            Question.objects.create(created_user=self.user, question_title=f'Title {i}', question_description='Description')
+            for i in range(3)
+        ]
+
+    def counts(self):
+        return dict(Tag.objects.values_list('tag_title', 'question_count'))
+
+    def test_counts_follow_tag_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for question in self.questions:
+                question.tags.add(self.python)
+            self.questions[0].tags.add(self.django, self.python)
+            self.django.questions.add(*self.questions[1:])
+        self.assertEqual(self.counts(), {'python':3, 'django':3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # removing a tag the question does not have changes nothing
+            self.questions[0].tags.remove(self.django)
+            self.questions[0].tags.remove(self.django)
+            self.django.questions.clear()
+            self.questions[1].delete()
+        self.assertEqual(self.counts(), {'python':2, 'django':0})
+
+        response = self.client.get('/api/tags/popular/')
+        self.assertEqual([(tag['tag_title'], tag['question_count']) for tag in response.data['data']], [('python', 2), ('django', 0)])
+
+    def test_reconcile_fixes_drift(self):
+        self.questions[0].tags.add(self.python)
+        Tag.objects.update(question_count=42)
+        reconcile_tag_counts()
+        self.assertEqual(self.counts(), {'python':1, 'django':0})
+        self.assertEqual(self.client.get('/api/tags/popular/?limit=1').data['data'], [{'tag_id':self.python.tag_id, 'tag_title':'python', 'question_count':1}])
+
+
+class HotQuestionsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+
+    def create(self, title, views=0, votes=0, answers=0, hours_old=0):
+        question = Question.objects.create(created_user=self.user, question_title=title, question_description='Description',
+                                           views=views, votes_count=votes)
+        Question.objects.filter(pk=question.pk).update(created_at=timezone.now() - timedelta(hours=hours_old))
+        for _ in range(answers):
+            Answer.objects.create(question=question, created_user=self.user, answer_description='answer')
+        return question
+
+    def test_ranking_and_pages(self):
+        self.create('Busy but old', views=1000, votes=20, answers=5, hours_old=24 * 7)
+        self.create('Busy and new', views=100, votes=5, answers=2, hours_old=1)
+        self.create('Quiet', hours_old=2)
+        deleted = self.create('Deleted', views=100, votes=5, answers=3, hours_old=1)
+        self.create('Too old', views=10 ** 6, votes=1000, hours_old=24 * 60)
+        refresh_hot_questions()
+
+        deleted.delete()
+        first = self.client.get('/api/questions/hot/?page_size=2')
+        self.assertEqual(first.data['count'], 3)
+        self.assertEqual([row['question_title'] for row in first.data['results']['data']], ['Busy and new', 'Busy but old'])
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['question_title'] for row in second.data['results']['data']], ['Quiet'])
+        self.assertIsNone(second.data['next'])
+
+    def test_score_is_computed_in_the_database(self):
+        question = self.create('Scored', views=99, votes=3, answers=1, hours_old=7)
+        refresh_hot_questions()
+        score = get_redis_connection('default').zscore(HOT_KEY, question.question_id)
+        # (log10(100) * 4 + 1 * 2 + 3) / (7 + 2) ** 1.5
+        self.assertAlmostEqual(score, 13 / 27, places=4)
+
+    def test_cold_list_is_built_once_under_the_lock(self):
+        redis = get_redis_connection('default')
+        with mock.patch('posts.hot.refresh_hot_questions', wraps=refresh_hot_questions) as refresh:
+            # no recent question, the empty list is remembered
+            self.assertEqual(self.client.get('/api/questions/hot/').data['count'], 0)
+            self.assertEqual(self.client.get('/api/questions/hot/').data['count'], 0)
+            self.assertEqual(refresh.call_count, 1)
+            self.assertTrue(redis.exists(HOT_EMPTY_KEY))
+
+            # another request holds the lock, the page is empty until the list is built
+            redis.delete(HOT_EMPTY_KEY)
+            self.create('New')
+            redis.set(HOT_LOCK_KEY, 'other', ex=60)
+            self.assertEqual(self.client.get('/api/questions/hot/').data['count'], 0)
+            self.assertEqual(refresh.call_count, 1)
+
+            redis.delete(HOT_LOCK_KEY)
+            self.assertEqual(self.client.get('/api/questions/hot/').data['count'], 1)
+            self.assertEqual(refresh.call_count, 2)
+            self.assertFalse(redis.exists(HOT_EMPTY_KEY))
+            self.assertFalse(redis.exists(HOT_LOCK_KEY))
+
+
+class ReputationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.voter = User.objects.create_user('voter', 'voter@example.com', 'password')
+        self.client.force_authenticate(self.voter)
+        self.question = Question.objects.create(created_user=self.author, question_title='Title', question_description='Description')
+        self.answer = Answer.objects.create(question=self.question, created_user=self.author, answer_description='answer')
+
+    def vote(self, url, method='post'):
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(self.client, method)(url)
+
+    def score(self):
+        flush_reputation()
+        self.author.refresh_from_db()
+        return self.author.score
+
+    def test_votes_move_the_author_score(self):
+        self.vote(f'/api/question/{self.question.question_id}/upvote/')
+        self.vote(f'/api/answer/{self.answer.answer_id}/upvote/')
+        self.assertEqual(self.score(), 15)
+
+        self.vote(f'/api/answer/{self.answer.answer_id}/downvote/')
+        self.assertEqual(self.score(), 3)
+        self.vote(f'/api/question/{self.question.question_id}/vote/delete/', 'delete')
+        self.assertEqual(self.score(), -2)
+
+    def test_rebuild_matches_incremental_score(self):
+        self.vote(f'/api/question/{self.question.question_id}/downvote/')
+        self.vote(f'/api/answer/{self.answer.answer_id}/upvote/')
+        incremental = self.score()
+
+        User.objects.update(score=None)
+        rebuild_reputation()
+        self.author.refresh_from_db()
+        self.voter.refresh_from_db()
+        self.assertEqual((self.author.score, self.voter.score), (incremental, 0))
+
+    def test_flush_skips_while_another_holds_the_lock(self):
+        self.vote(f'/api/question/{self.question.question_id}/upvote/')
+        with reputation_lock() as acquired:
+            self.assertTrue(acquired)
+            # a second worker's flush must not apply the batch the first one is applying
+            self.assertEqual(flush_reputation(), 0)
+        self.assertEqual(self.score(), 5)
+        self.assertEqual(self.score(), 5)
+
+    def test_rebuild_waits_for_the_flush_and_drops_pending_deltas(self):
+        self.vote(f'/api/question/{self.question.question_id}/upvote/')
+        with reputation_lock():
+            with self.assertRaises(RuntimeError):
+                rebuild_reputation(wait=0.2)
+        rebuild_reputation()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.score, 5)
+        self.assertEqual(flush_reputation(), 0)
+        self.assertFalse(get_redis_connection('default').exists(f'{REPUTATION_PENDING_KEY}:lock'))
+
+
+@override_settings(ROOT_URLCONF=AsgiURLConf)
+class AsyncViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        self.question = Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+        Answer.objects.create(question=self.question, created_user=self.user, answer_description='answer')
+
+    async def test_detail_served_on_the_event_loop(self):
+        url = f'/api/question/{self.question.question_id}/detail/'
+        first = await self.async_client.get(url)
+        second = await self.async_client.get(url)
+        self.assertEqual(first.json()['data']['views'], 1)
+        self.assertEqual(second.json()['data']['views'], 2)
+        self.assertEqual(len(second.json()['data']['answers']), 1)
+
+    async def test_detail_lookups_overlap(self):
+        # each stand-in waits for its partner to start, run one after the other they time out
+        row, cached, build, hit = (asyncio.Event() for _ in range(4))
+
+        async def rendezvous(mine, other, result):
+            mine.set()
+            await asyncio.wait_for(other.wait(), 1)
+            return result
+
+        async def prefetch(*args):
+            await rendezvous(build, hit, None)
+            await aprefetch_related_objects(*args)
+
+        with mock.patch('posts.async_views.question_views', lambda question_id: rendezvous(row, cached, 7)), \
+                mock.patch.object(detail_cache, 'aget_raw', lambda key: rendezvous(cached, row, None)), \
+                mock.patch('posts.async_views.aprefetch_related_objects', prefetch), \
+                mock.patch('posts.async_views.arecord_question_view', lambda question_id: rendezvous(hit, build, 1)):
+            response = await self.async_client.get(f'/api/question/{self.question.question_id}/detail/')
+        self.assertEqual(response.json()['data']['views'], 8)
+
+    async def test_missing_question_is_a_json_404_without_a_cache_build(self):
+        with mock.patch.object(detail_cache, 'aget_or_build') as build:
+            for question_id in ('0', 'abc'):
+                response = await self.async_client.get(f'/api/question/{question_id}/detail/')
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json()['message'], f'Question {question_id} not found.')
+        build.assert_not_called()
+
+    async def test_errors_go_through_the_drf_exception_handler(self):
+        response = await self.async_client.post('/api/tags/')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.json(), {'detail':'Method "POST" not allowed.'})
+
+    async def test_answers_need_authentication(self):
+        url = f'/api/question/{self.question.question_id}/answers/'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+        response = await self.async_client.get(url, headers={'Authorization':f'Bearer {token}'})
+        self.assertEqual(len(response.json()['data']), 1)
+
+    @override_settings(ROOT_URLCONF='stackoverflow.urls')
+    def test_wsgi_routes_keep_the_sync_views(self):
+        # an async view under WSGI runs on a new event loop, with a new redis.asyncio pool, every request
+        pools = len(_async_clients)
+        for _ in range(3):
+            self.assertEqual(self.client.get(f'/api/question/{self.question.question_id}/detail/').status_code, 200)
+        self.assertEqual(len(_async_clients), pools)
+
+    def test_async_views_are_drf_views(self):
+        # drf_yasg only lists views built on APIView
+        for view in (async_views.all_question, async_views.detail_question_view,
+                     async_views.get_answers_for_question, async_views.all_tags):
+            self.assertTrue(is_api_view(view))
+        self.assertEqual(async_views.get_answers_for_question.cls.permission_classes, [IsAuthenticated])
+
+
+class RequestMetricsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        for i in range(3):
+            Question.objects.create(created_user=self.user, question_title=f'Title {i}', question_description='Description')
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_queries_and_serializer_time_recorded_per_view(self):
+        queries = self.sample('stackoverflow_view_db_queries_sum', view='all_questions')
+        requests = self.sample('stackoverflow_view_db_queries_count', view='all_questions')
+        renders = self.sample('stackoverflow_serializer_seconds_count', serializer='AllQuestionsSerializer')
+
+        self.client.get('/api/questions/')
+        self.assertEqual(self.sample('stackoverflow_view_db_queries_count', view='all_questions'), requests + 1)
+        self.assertGreater(self.sample('stackoverflow_view_db_queries_sum', view='all_questions'), queries)
+        self.assertEqual(self.sample('stackoverflow_serializer_seconds_count', serializer='AllQuestionsSerializer'), renders + 1)
+
+        self.assertIn(b'stackoverflow_view_db_seconds_bucket', self.client.get('/metrics').content)
+
+    @override_settings(ROOT_URLCONF=AsgiURLConf)
+    async def test_queries_of_async_views_recorded(self):
+        # the async ORM runs its queries in a sync_to_async thread, not where the middleware runs
+        queries = self.sample('stackoverflow_view_db_queries_sum', view='all_tags')
+        await self.async_client.get('/api/tags/')
+        self.assertGreater(self.sample('stackoverflow_view_db_queries_sum', view='all_tags'), queries)
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION':f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    @override_settings(PROFILING_INTERVAL=0.0005)
+    def test_staff_profile_single_request(self):
+        response = self.client.get('/api/questions/hot/?profile=collapsed', **self.auth(self.staff))
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        for line in response.content.decode().splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack and int(count) > 0)
+
+        response = self.client.get('/api/questions/hot/', HTTP_X_PROFILE='1', **self.auth(self.staff))
+        self.assertEqual(response.status_code, 200)
+        stored = self.client.get(f'/profiling/{response["X-Profile-Id"]}/', **self.auth(self.staff))
+        self.assertEqual(stored.status_code, 200)
+
+    def test_only_known_modes_profile(self):
+        for headers in ({'HTTP_X_PROFILE':'0'}, {'HTTP_X_PROFILE':'false'}, {}):
+            with mock.patch('stackoverflow.profiling.StackSampler') as sampler:
+                response = self.client.get('/api/questions/hot/?profile=false', **headers, **self.auth(self.staff))
+            sampler.assert_not_called()
+            self.assertNotIn('X-Profile-Id', response)
+
+    def test_rolling_stacks_capped(self):
+        sampler = StackSampler()
+        sampler.stacks.update({f'deep;stack;{i}': i + 1 for i in range(10)})
+        with mock.patch('stackoverflow.profiling.MAX_STACKS', 4):
+            store_sample(sampler)
+        stacks, _ = rolling_stacks()
+        self.assertEqual(set(stacks), {f'deep;stack;{i}' for i in range(6, 10)})
+
+    def test_flag_ignored_for_other_users(self):
+        for headers in ({}, self.auth(self.user)):
+            response = self.client.get('/api/questions/hot/?profile=collapsed', HTTP_X_PROFILE='1', **headers)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get('/profiling/top/', **self.auth(self.user)).status_code, 403)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_INTERVAL=0.0005)
+    def test_rolling_sample(self):
+        for _ in range(3):
+            self.client.get('/api/questions/hot/')
+        data = self.client.get('/profiling/top/', **self.auth(self.staff)).json()['data']
+        self.assertEqual(data['requests'], 3)
+        self.assertEqual(sum(row['self'] for row in data['functions']) > 0, data['samples'] > 0)
+
+    def test_top_functions(self):
+        stacks = [('a;b;c', 3), ('a;b', 2), ('a;d;c', 1)]
+        self.assertEqual(top_functions(stacks), [
+            {'function':'c', 'self':4, 'total':4},
+            {'function':'b', 'self':2, 'total':5},
+        ])
+
+    async def test_async_sampler_follows_sync_to_async_threads_only(self):
+        stop = threading.Event()
+
+        def unrelated():
+            while not stop.is_set():
+                pass
+
+        def request_work():
+            deadline = time.monotonic() + 0.05
+            while time.monotonic() < deadline:
+                pass
+
+        other = threading.Thread(target=unrelated)
+        other.start()
+        try:
+            with StackSampler({threading.get_ident()}, 0.0005, sync_to_async_threads=True) as sampler:
+                await sync_to_async(request_work)()
+        finally:
+            stop.set()
+            other.join()
+
+        leaves = {stack.rpartition(';')[2] for stack in sampler.stacks}
+        self.assertIn(function_label(request_work), leaves)
+        self.assertNotIn(function_label(unrelated), leaves)
+        self.assertFalse(leaves & IDLE_FRAMES)
+
+    def test_frame_label_without_qualname(self):
+        # python 3.10 code objects have no co_qualname
+        class Code:
+            co_name = 'handler'
+        self.assertEqual(frame_label(Code(), 'module'), 'module.handler')
+
+
+class SlowQueryLogTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_slow_queries()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password')
+        Question.objects.create(created_user=self.user, question_title='Title', question_description='Description')
+
+    @override_settings(SLOW_QUERY_SECONDS=0)
+    def test_queries_logged_with_view_and_stack(self):
+        self.client.get('/api/questions/hot/')
+        entries = slow_queries()
+        self.assertTrue(entries)
+        self.assertEqual({entry['view'] for entry in entries}, {'hot_questions'})
+        self.assertTrue(any(frame.startswith('posts/') for entry in entries for frame in entry['stack']))
+
+        out = StringIO()
+        call_command('slow_queries', view='hot_questions', stdout=out)
+        self.assertIn('hot_questions', out.getvalue())
+
+    @override_settings(SLOW_QUERY_SECONDS=0, ROOT_URLCONF=AsgiURLConf)
+    async def test_queries_of_async_views_logged_without_params(self):
+        with self.assertLogs('stackoverflow.slow_queries', 'WARNING') as logs:
+            await self.async_client.get('/api/tags/')
+        self.assertTrue(any('in all_tags' in line for line in logs.output))
+        entries = await sync_to_async(slow_queries)()
+        self.assertEqual({entry['view'] for entry in entries}, {'all_tags'})
+        self.assertFalse(any('params' in entry for entry in entries))
+
+    def test_plan_literals_redacted(self):
+        plan = {'Plan':{'Filter':"((email)::text = 'tester@example.com'::text)", 'Plans':[{'Index Cond':"(otp = 'it''s 1234')"}]}}
+        self.assertEqual(redact(plan), {'Plan':{'Filter':"((email)::text = '?'::text)", 'Plans':[{'Index Cond':"(otp = '?')"}]}})
+
+    @override_settings(SLOW_QUERY_SECONDS=0)
+    def test_failed_queries_not_logged(self):
+        install_query_wrapper(None)
+        middleware = QueryMetricsMiddleware(lambda request: None)
+        with mock.patch('stackoverflow.instrumentation.record_slow_query') as record:
+            with middleware.recording(RequestFactory().get('/')), self.assertRaises(DatabaseError), transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT * FROM no_such_table')
+            with middleware.recording(RequestFactory().get('/')), connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        logged = [call.args[1] for call in record.call_args_list]
+        self.assertIn('SELECT 1', logged)
+        self.assertFalse([sql for sql in logged if 'no_such_table' in sql])
+
+    def test_fast_queries_not_logged(self):
+        self.client.get('/api/questions/hot/')
+        self.assertEqual(slow_queries(), [])
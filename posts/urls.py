@@ -1,27 +1,48 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
 
-urlpatterns = [
-    path("questions/", views.all_question, name='all_questions'),
-    path("question/create/", views.create_question, name='create_question'),
-    path("question/<str:question_id>/update/", views.update_question, name='update_question'),
-    path("question/<str:question_id>/delete/", views.delete_question, name='delete_question'),
+def post_urlpatterns(read_views):
+    """
+    Routes of the posts app, with the feed, detail, answers and tags views taken from
+    `read_views`, posts.views or posts.async_views.
+    """
+    return [
+        path("questions/", read_views.all_question, name='all_questions'),
+        path("questions/hot/", views.hot_questions, name='hot_questions'),
+        path("suggest/", views.suggestions, name='suggestions'),
+        path("question/create/", views.create_question, name='create_question'),
+        path("question/<str:question_id>/update/", views.update_question, name='update_question'),
+        path("question/<str:question_id>/delete/", views.delete_question, name='delete_question'),
 
-    path("question/<str:question_id>/detail/", views.detail_question_view, name='detail_question_view'),
+        path("question/<str:question_id>/detail/", read_views.detail_question_view, name='detail_question_view'),
 
-    path("question/<str:question_id>/answers/", views.get_answers_for_question, name='all_answers_for_question'),
-    path("question/<str:question_id>/answer/create/", views.create_answer_for_question, name='create_answer'),
-    path("answer/<str:answer_id>/update/", views.update_answer, name='update_answer'),
-    path("answer/<str:answer_id>/delete/", views.delete_answer, name='delete_answer'),
+        path("question/<str:question_id>/answers/", read_views.get_answers_for_question, name='all_answers_for_question'),
+        path("question/<str:question_id>/answer/create/", views.create_answer_for_question, name='create_answer'),
+        path("answer/<str:answer_id>/update/", views.update_answer, name='update_answer'),
+        path("answer/<str:answer_id>/delete/", views.delete_answer, name='delete_answer'),
 
-    path("comment/question/<str:question_id>/create/", views.create_comment_for_question, name='create_comment_for_question'),
-    path("comment/answer/<str:answer_id>/create/", views.create_comment_for_answer, name='create_comment_for_answer'),
-    path("comment/<str:comment_id>/delete/", views.delete_comment, name='delete_comment'),
+        path("question/<str:question_id>/upvote/", views.vote_question, {'vote_type':1}, name='upvote_question'),
+        path("question/<str:question_id>/downvote/", views.vote_question, {'vote_type':-1}, name='downvote_question'),
+        path("question/<str:question_id>/vote/delete/", views.retract_question_vote, name='retract_question_vote'),
+        path("answer/<str:answer_id>/upvote/", views.vote_answer, {'vote_type':1}, name='upvote_answer'),
+        path("answer/<str:answer_id>/downvote/", views.vote_answer, {'vote_type':-1}, name='downvote_answer'),
+        path("answer/<str:answer_id>/vote/delete/", views.retract_answer_vote, name='retract_answer_vote'),
 
-    # admin user can perform this actions.
-    path("tags/", views.all_tags, name='all_tags'),
-    path("tags/create/", views.create_tag, name='create_tag'),
-    path("tags/delete/<str:tag_id>/", views.delete_tag, name='delete_tag'),
-]
+        path("comment/question/<str:question_id>/create/", views.create_comment_for_question, name='create_comment_for_question'),
+        path("comment/answer/<str:answer_id>/create/", views.create_comment_for_answer, name='create_comment_for_answer'),
+        path("comment/<str:comment_id>/delete/", views.delete_comment, name='delete_comment'),
 
+        # admin user can perform this actions.
+        path("tags/", read_views.all_tags, name='all_tags'),
+        path("tags/popular/", views.all_popular_tags, name='popular_tags'),
+        path("tags/<str:tag>/questions/", views.tag_questions, name='tag_questions'),
+        path("tags/create/", views.create_tag, name='create_tag'),
+        path("tags/delete/<str:tag_id>/", views.delete_tag, name='delete_tag'),
+    ]
+
+
+# The async views wait on redis and postgres on the worker's event loop. Under WSGI there is
+# no such loop, every async request would get one of its own and new redis connections with it.
+urlpatterns = post_urlpatterns(async_views if settings.SERVER_MODE == 'asgi' else views)
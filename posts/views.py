@@ -6,67 +6,145 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import mixins, generics
 
-from .models import Tag, Question, Answer, Comment
+from rest_framework.exceptions import NotFound
+
+from .models import Tag, Question, Answer, Comment, question_detail_prefetch
 from .serializers import ( TagSerializer, CreateQuestionSerializer, 
                           AllQuestionsSerializer, CreateAnswerSerializer, 
                           AllAnswerSerializer, CreateCommentSerializer, 
                           DetailQuestionView )
 
-from .pagination import CustomPagination
+from .pagination import SearchPagination, QuestionCursorPagination, TagQuestionPagination
 from .tasks import send_answer_notification_mail
-from .helper import handle_not_found
-
-from django.core.cache import cache
+from .counters import record_question_view, adjust_comments_count, popular_tags
+from .votes import cast_vote, retract_vote
+from .caches import feed_cache, summary_cache, detail_cache, answers_cache, tags_cache, search_cache, feed_page_key
+from .helper import handle_not_found, question_not_found, valid_date
 
-import hashlib
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 
 from drf_yasg.utils import swagger_auto_schema
 
-from .documents import QuestionDocument
-from django_elasticsearch_dsl.search import Search
+from .search import MAX_RESULT_WINDOW, search_questions, search_cache_key
+from .suggest import suggest, MAX_SUGGESTIONS
+from .tag_feeds import tag_question_page, SORTS
+from .hot import hot_question_page
+
+# all_question, detail_question_view, get_answers_for_question and all_tags are served by
+# posts/async_views.py under ASGI, see posts/urls.py. These are the WSGI versions.
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def all_question(request):
     search_query = request.GET.get('search', None)      # get search parameters
-    cached_questions = cache.get('all_questions')
 
     if search_query:
-        search = QuestionDocument.search()
-        search = search.query("multi_match",
-                              query=search_query,
-                              fields = ["question_title", "question_description"])
-        search = search[:100]
-        search_result = search.execute()
-
-        # serialize search result
-        questions = []
-        for hit in search_result:
-            question = {
-                "id": hit.meta.id,
-                "question_title":hit.question_title,
-                "question_description":hit.question_description,
-            }
-            questions.append(question)
-
-        cache_key = f'search_results_{search_query}'
-        cache.set(cache_key, questions, timeout=600)
-        data = questions
-
-    elif not cached_questions:
-        questions = Question.objects.all().order_by('created_at')
-        serializer = AllQuestionsSerializer(questions, many=True)
-        cache.set('all_questions', serializer.data, timeout=600)
-        data = serializer.data
-    else:
-        data = cached_questions
+        return search_page(request, search_query)
+
+    # keyset pagination, a cached page is a list of ids rendered from per-question fragments
+    paginator = QuestionCursorPagination()
+    page_key = feed_page_key(paginator.get_cursor(request), paginator.get_page_size(request))
+
+    def build_page():
+        page = paginator.paginate_queryset(Question.objects.for_list(), request)
+        data = AllQuestionsSerializer(page, many=True).data
+        summary_cache.set_many({summary_cache.key(row['question_id']): row for row in data})
+        return {'ids':[row['question_id'] for row in data], 'next_cursor':paginator.next_cursor,
+                'previous_cursor':paginator.previous_cursor}
+
+    # the last page changes with every new question, so it is never cached
+    cached_page = feed_cache.get_or_build(page_key, build_page, cache_if=lambda page: page['next_cursor'] is not None)
+    paginator.request = request
+    paginator.next_cursor = cached_page['next_cursor']
+    paginator.previous_cursor = cached_page.get('previous_cursor')
+
+    return paginator.get_paginated_response({
+        'status':status.HTTP_200_OK,
+        'message':'All questions',
+        'data':question_summaries(cached_page['ids'])
+    })
+
+
+def search_page(request, search_query):
+    tags = [tag.strip() for tag in request.GET.get('tags', '').split(',') if tag.strip()]
+    created_after = request.GET.get('created_after') or None
+    created_before = request.GET.get('created_before') or None
+    for value in (created_after, created_before):
+        if value and not valid_date(value):
+            return Response({
+                'status':status.HTTP_400_BAD_REQUEST,
+                'message':f'Invalid date "{value}", use YYYY-MM-DD or an ISO 8601 datetime.'
+            }, status.HTTP_400_BAD_REQUEST)
+
+    paginator = SearchPagination()
+    page, page_size = paginator.get_page(request)
+    if (page - 1) * page_size >= MAX_RESULT_WINDOW:
+        raise NotFound(f'Only the first {MAX_RESULT_WINDOW} results can be paged through, narrow the search.')
+    cache_key = search_cache.key(
+        search_cache.generation(),
+        search_cache_key(search_query, tags, created_after, created_before, page, page_size)
+    )
+    result = search_cache.get_or_build(cache_key, lambda: search_questions(
+        search_query, tags=tags, created_after=created_after, created_before=created_before,
+        page=page, page_size=page_size
+    ))
+
+    return paginator.get_paginated_response({
+        'status':status.HTTP_200_OK,
+        'message':f'Search result for "{search_query}"',
+        'data':result['results']
+    }, count=result['count'])
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def hot_questions(request):
+    # ranked by the refresh_hot_questions task, a page is a range read on a redis sorted set
+    paginator = SearchPagination()
+    page, page_size = paginator.get_page(request)
+    question_ids, count = hot_question_page(page, page_size)
 
-    paginator = CustomPagination()
-    result_page = paginator.paginate_queryset(data, request)
     return paginator.get_paginated_response({
         'status':status.HTTP_200_OK,
-        'message':'All questions' if not search_query else f'Search result for "{search_query}"',
-        'data':result_page
+        'message':'Hot questions',
+        'data':question_summaries(question_ids)
+    }, count=count)
+
+
+def question_summaries(question_ids):
+    """Feed rows for `question_ids`, from cache where possible, in the given order."""
+    keys = {question_id: summary_cache.key(question_id) for question_id in question_ids}
+    cached = summary_cache.get_many(list(keys.values()))
+
+    missing = [question_id for question_id, key in keys.items() if key not in cached]
+    if missing:
+        questions = Question.objects.for_list().filter(question_id__in=missing)
+        rendered = {summary_cache.key(row['question_id']): row for row in AllQuestionsSerializer(questions, many=True).data}
+        summary_cache.set_many(rendered)
+        cached.update(rendered)
+
+    # questions deleted since the page was cached are skipped
+    return [cached[key] for key in keys.values() if key in cached]
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def suggestions(request):
+    # typeahead, called on every keystroke instead of a full search
+    prefix = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), MAX_SUGGESTIONS)
+    except ValueError:
+        return Response({
+            'status':status.HTTP_400_BAD_REQUEST,
+            'message':'limit must be a number.'
+        }, status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Suggestions for "{prefix}"',
+        'data':suggest(prefix, limit)
     })
 
 
@@ -99,31 +177,20 @@ def create_answer_for_question(request, question_id):
 @permission_classes([IsAuthenticated])
 def get_answers_for_question(request, question_id):
 
-    cache_key = hashlib.md5(f'{question_id}'.encode()).hexdigest()
-    cache_data = cache.get(cache_key)
+    def build_answers():
+        question = Question.objects.get(question_id=question_id)
+        answers = Answer.objects.filter(question=question).for_thread()
+        return AllAnswerSerializer(answers, many=True).data
 
-    if cache_data:
-        return Response({
-        'status':status.HTTP_200_OK,
-        'message':f'Answers for question {question_id}',
-        'data':cache_data
-    }, status.HTTP_200_OK)
-    
     try:
-        question = Question.objects.get(question_id=question_id)
-    except Question.DoesNotExist:
-        return Response({
-            'status':status.HTTP_404_NOT_FOUND,
-            'message':f'Question {question_id} not found.'
-        }, status.HTTP_404_NOT_FOUND)
-    
-    answers = question.answers.all()
-    serializer = AllAnswerSerializer(answers, many=True)
-    cache.set(cache_key, serializer.data, timeout=60)
+        data = answers_cache.get_or_build(answers_cache.key(question_id), build_answers)
+    except (Question.DoesNotExist, ValueError):
+        return question_not_found(question_id)
+
     return Response({
         'status':status.HTTP_200_OK,
         'message':f'Answers for question {question_id}',
-        'data':serializer.data
+        'data':data
     }, status.HTTP_200_OK)
 
 
@@ -191,30 +258,33 @@ def delete_answer(request, answer_id):
 @permission_classes([AllowAny])
 def detail_question_view(request, question_id):
 
-    cache_key = f'detail_question_{question_id}'
-
-    question = get_object_or_404(Question, question_id=question_id)
-    question.views += 1
-    question.save()
-
-    cached_data = cache.get(cache_key)
-
-    if cached_data:
-        cached_data['views'] = question.views
-        cache.set(cache_key, cached_data, timeout=600)
+    # the views column is read on every request, the thread only when the cache is cold,
+    # and a missing question never takes the rebuild lock
+    try:
+        row = Question.objects.filter(question_id=question_id).values_list('question_id', 'views').first()
+    except ValueError:
+        row = None
+    if row is None:
+        return question_not_found(question_id)
+    question_id, views = row
+
+    def build_detail():
+        question = Question.objects.get(question_id=question_id)
+        prefetch_related_objects([question], *question_detail_prefetch())
+        return DetailQuestionView(question).data
 
-        return Response({
-        'status':status.HTTP_200_OK,
-        'message':f'Question {question_id}.',
-        'data':cached_data
-    }, status.HTTP_200_OK)
+    try:
+        data = detail_cache.get_or_build(detail_cache.key(question_id), build_detail)
+    except Question.DoesNotExist:
+        # deleted since the check
+        return question_not_found(question_id)
 
-    serializer = DetailQuestionView(question)
-    cache.set(cache_key, serializer.data, timeout=600)
+    # view hits are buffered in redis and flushed to postgres by the flush_question_views task
+    data['views'] = views + record_question_view(question_id)
     return Response({
         'status':status.HTTP_200_OK,
         'message':f'Question {question_id}.',
-        'data':serializer.data
+        'data':data
     }, status.HTTP_200_OK)
 
 
@@ -294,7 +364,6 @@ def delete_question(request, question_id):
         }, status.HTTP_401_UNAUTHORIZED)
     else:
         question.delete()
-        cache.delete('all_questions')
         return Response({
             'status':status.HTTP_200_OK,
             'message':'Question deleted successfully.',
@@ -310,10 +379,9 @@ def create_comment_for_question(request, question_id):
 
     serializer = CreateCommentSerializer(data=data)
     if serializer.is_valid():
-        serializer.save(question=question, created_user=request.user)
-
-        question.comments_count += 1
-        question.save()
+        with transaction.atomic():
+            comment = serializer.save(question=question, created_user=request.user)
+            adjust_comments_count(comment, 1)
 
         return Response({
             'status':status.HTTP_200_OK,
@@ -337,10 +405,9 @@ def create_comment_for_answer(request, answer_id):
 
     serializer = CreateCommentSerializer(data=data)
     if serializer.is_valid():
-        serializer.save(answer=answer, created_user=request.user)
-
-        answer.comments_count += 1
-        answer.save()
+        with transaction.atomic():
+            comment = serializer.save(answer=answer, created_user=request.user)
+            adjust_comments_count(comment, 1)
 
         return Response({
             'status':status.HTTP_200_OK,
@@ -367,16 +434,9 @@ def delete_comment(request, comment_id):
             'message':'You are not allowed to delete this comment.'
         }, status.HTTP_401_UNAUTHORIZED)
     
-    comment.delete()
-
-    question = comment.question
-    answer = comment.answer
-    if comment.question != None:
-        question.comments_count -= 1
-        question.save()
-    else:
-        answer.comments_count -= 1
-        answer.save()
+    with transaction.atomic():
+        comment.delete()
+        adjust_comments_count(comment, -1)
 
     return Response({
         'status':status.HTTP_200_OK,
@@ -384,6 +444,82 @@ def delete_comment(request, comment_id):
     }, status.HTTP_200_OK)
     
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def vote_question(request, question_id, vote_type):
+    question = get_object_or_404(Question, question_id=question_id)
+
+    if question.created_user_id == request.user.id:
+        return Response({
+            'status':status.HTTP_401_UNAUTHORIZED,
+            'message':'You cannot vote on your own question.'
+        }, status.HTTP_401_UNAUTHORIZED)
+
+    votes_count = cast_vote(request.user, vote_type, question=question)
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Vote recorded for question {question.question_id}.',
+        'data':{'vote_type':vote_type, 'votes_count':votes_count}
+    }, status.HTTP_200_OK)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def retract_question_vote(request, question_id):
+    question = get_object_or_404(Question, question_id=question_id)
+
+    votes_count = retract_vote(request.user, question=question)
+    if votes_count is None:
+        return Response({
+            'status':status.HTTP_404_NOT_FOUND,
+            'message':'No vote found for this question.'
+        }, status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Vote retracted for question {question.question_id}.',
+        'data':{'votes_count':votes_count}
+    }, status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def vote_answer(request, answer_id, vote_type):
+    answer = get_object_or_404(Answer, answer_id=answer_id)
+
+    if answer.created_user_id == request.user.id:
+        return Response({
+            'status':status.HTTP_401_UNAUTHORIZED,
+            'message':'You cannot vote on your own answer.'
+        }, status.HTTP_401_UNAUTHORIZED)
+
+    votes_count = cast_vote(request.user, vote_type, answer=answer)
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Vote recorded for answer {answer.answer_id}.',
+        'data':{'vote_type':vote_type, 'votes_count':votes_count}
+    }, status.HTTP_200_OK)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def retract_answer_vote(request, answer_id):
+    answer = get_object_or_404(Answer, answer_id=answer_id)
+
+    votes_count = retract_vote(request.user, answer=answer)
+    if votes_count is None:
+        return Response({
+            'status':status.HTTP_404_NOT_FOUND,
+            'message':'No vote found for this answer.'
+        }, status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':f'Vote retracted for answer {answer.answer_id}.',
+        'data':{'votes_count':votes_count}
+    }, status.HTTP_200_OK)
+
+
 @swagger_auto_schema(method='POST', request_body=TagSerializer)
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
@@ -409,25 +545,71 @@ def create_tag(request):
 @permission_classes([AllowAny])
 def all_tags(request):
 
-    cached_data = cache.get('all_tags')
+    def build_tags():
+        tags = Tag.objects.all().order_by('tag_id')
+        return TagSerializer(tags, many=True).data
 
-    if cached_data:
-        return Response({
+    return Response({
         'status':status.HTTP_200_OK,
         'message':'All tags.',
-        'data':cached_data
+        'data':tags_cache.get_or_build(tags_cache.key(), build_tags)
     }, status.HTTP_200_OK)
 
-    tags = Tag.objects.all().order_by('tag_id')
-    serializer = TagSerializer(tags, many=True)
-    cache.set('all_tags', serializer.data, timeout=600)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def all_popular_tags(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 500)
+    except ValueError:
+        return Response({
+            'status':status.HTTP_400_BAD_REQUEST,
+            'message':'limit must be a number.'
+        }, status.HTTP_400_BAD_REQUEST)
+
+    # a single redis call on the tags sorted by question_count
     return Response({
         'status':status.HTTP_200_OK,
-        'message':'All tags.',
-        'data':serializer.data
+        'message':'Popular tags.',
+        'data':popular_tags(limit)
     }, status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def tag_questions(request, tag):
+    sort = request.GET.get('sort', 'newest')
+    if sort not in SORTS:
+        return Response({
+            'status':status.HTTP_400_BAD_REQUEST,
+            'message':f'sort must be one of {", ".join(SORTS)}.'
+        }, status.HTTP_400_BAD_REQUEST)
+
+    tag_id = Tag.objects.filter(tag_title=tag).values_list('tag_id', flat=True).first()
+    if tag_id is None:
+        return Response({
+            'status':status.HTTP_404_NOT_FOUND,
+            'message':f'Tag {tag} not found.'
+        }, status.HTTP_404_NOT_FOUND)
+
+    # the page comes from a redis sorted set per tag, rows from the feed row cache
+    paginator = TagQuestionPagination()
+    paginator.request = request
+    cursor = paginator.get_cursor(request)
+    question_ids, next_score = tag_question_page(
+        tag_id, sort,
+        before=paginator.decode_cursor(cursor) if cursor else None,
+        page_size=paginator.get_page_size(request),
+    )
+    paginator.next_cursor = paginator.encode_cursor(next_score) if next_score is not None else None
+
+    return paginator.get_paginated_response({
+        'status':status.HTTP_200_OK,
+        'message':f'Questions tagged {tag}',
+        'data':question_summaries(question_ids)
+    })
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAdminUser])
 def delete_tag(request, tag_id):
@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import F, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Question, Answer, Vote
+from .caches import invalidate_question
+from .indexing import enqueue_question_ids
+from .tag_feeds import refresh_question
+from .reputation import vote_points, record_reputation
+
+
+def _target(question=None, answer=None):
+    if question is not None:
+        return Question, {'question': question}, question.question_id, question.question_id
+    return Answer, {'answer': answer}, answer.answer_id, answer.question_id
+
+
+def _after_vote(question_id, on_question, author_id, reputation):
+    invalidate_question(question_id, answers=True)
+    # applied to the author's score in batches by the posts.tasks.apply_reputation task
+    record_reputation(author_id, reputation)
+    # votes_count is part of the search ranking and of the tag pages, the F() update sends no signal
+    if on_question:
+        enqueue_question_ids([question_id])
+        refresh_question(question_id)
+
+
+def cast_vote(user, vote_type, question=None, answer=None):
+    """
+    Create or flip `user`'s vote on a question or an answer and return the new votes_count.
+    The counter is moved by the vote delta with a single `F()` update, never recomputed.
+    """
+    model, target, pk, question_id = _target(question, answer)
+    author_id, on_question = (question or answer).created_user_id, answer is None
+
+    with transaction.atomic():
+        vote, created = Vote.objects.select_for_update().get_or_create(
+            user=user, **target, defaults={'vote_type': vote_type}
+        )
+        if created:
+            delta = vote_type
+            reputation = vote_points(vote_type, on_question)
+        else:
+            delta = vote_type - vote.vote_type
+            reputation = vote_points(vote_type, on_question) - vote_points(vote.vote_type, on_question)
+            if delta:
+                vote.vote_type = vote_type
+                vote.save(update_fields=['vote_type'])
+
+        if delta:
+            model.objects.filter(pk=pk).update(votes_count=F('votes_count') + delta)
+            transaction.on_commit(lambda: _after_vote(question_id, on_question, author_id, reputation))
+        return model.objects.filter(pk=pk).values_list('votes_count', flat=True).get()
+
+
+def retract_vote(user, question=None, answer=None):
+    """Remove `user`'s vote, returns the new votes_count or None when there was no vote."""
+    model, target, pk, question_id = _target(question, answer)
+    author_id, on_question = (question or answer).created_user_id, answer is None
+
+    with transaction.atomic():
+        vote = Vote.objects.select_for_update().filter(user=user, **target).first()
+        if vote is None:
+            return None
+
+        vote.delete()
+        model.objects.filter(pk=pk).update(votes_count=F('votes_count') - vote.vote_type)
+        reputation = -vote_points(vote.vote_type, on_question)
+        transaction.on_commit(lambda: _after_vote(question_id, on_question, author_id, reputation))
+        return model.objects.filter(pk=pk).values_list('votes_count', flat=True).get()
+
+
+def reconcile_vote_counts():
+    """
+    Recompute every votes_count from the Vote table.
+    Each model is fixed with one `UPDATE ... SET votes_count = (SELECT SUM(...))`.
+    """
+    updated = {}
+    for model, field in ((Question, 'question'), (Answer, 'answer')):
+        totals = (Vote.objects.filter(**{field: OuterRef('pk')})
+                  .order_by()
+                  .values(field)
+                  .annotate(total=Sum('vote_type'))
+                  .values('total'))
+        updated[model.__name__] = model.objects.update(votes_count=Coalesce(Subquery(totals), 0))
+    return updated
@@ -0,0 +1,36 @@
+import orjson
+from django_redis.compressors.zlib import ZlibCompressor
+from django_redis.serializers.base import BaseSerializer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Serializer and compressor of the django_redis cache, see CACHES in settings.py.
+# Compare the options on the real payloads with `manage.py bench_cache`.
+
+_api_encoder = JSONEncoder()
+
+
+class OrjsonSerializer(BaseSerializer):
+    """
+    Cached values are serializer output, lists and dicts of strings, numbers and None,
+    which orjson encodes and decodes several times faster than pickle.
+    ReturnDict / ReturnList / OrderedDict come back as plain dicts and lists and
+    dict keys come back as strings, both render the same.
+    """
+
+    def dumps(self, value):
+        # anything orjson has no type for (Decimal, lazy strings, ...) is stored the way the API renders it
+        return orjson.dumps(value, default=_api_encoder.default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, value):
+        return orjson.loads(value)
+
+
+class FastZlibCompressor(ZlibCompressor):
+    """
+    zlib level 1. The repeated keys of JSON lists shrink them to 15-20% of their size at
+    any level, level 1 stores 5-20% more bytes than the default level 6 at half the compression
+    time, decompressing costs the same.
+    """
+
+    preset = 1
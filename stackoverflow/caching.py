@@ -0,0 +1,321 @@
+import asyncio
+import math
+import random
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+from prometheus_client import Counter
+import redis.asyncio as aioredis
+
+
+CACHE_REQUESTS = Counter(
+    'stackoverflow_cache_requests_total',
+    'Read-through cache lookups, by key family and result (hit / stale / refresh / miss).',
+    ['family', 'result'],
+)
+
+
+# deletes a lock only while it still holds the token of the request releasing it, a build that
+# outlived lock_timeout must not drop the lock another request has taken since
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# default of aget_or_build(envelope=...), the entry has not been read yet
+UNREAD = object()
+
+# redis.asyncio pools belong to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_redis():
+    """redis.asyncio client on the redis of the default cache, for the async views."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool_class = import_string(getattr(settings, 'ASYNC_REDIS_POOL_CLASS', 'redis.asyncio.ConnectionPool'))
+        pool = pool_class.from_url(
+            settings.CACHES['default']['LOCATION'], **getattr(settings, 'ASYNC_REDIS_POOL_KWARGS', {})
+        )
+        client = _async_clients[loop] = aioredis.Redis(connection_pool=pool)
+    return client
+
+
+class CacheFamily:
+    """
+    A group of cache keys sharing a prefix, a timeout and hit / miss metrics.
+
+    Keys can embed a generation counter (`generation` / `bump`), which drops every
+    key built from the old generation in O(1) without scanning redis; the orphaned
+    keys simply expire with their timeout.
+
+    `get_or_build` is the stampede-safe read-through path: a single request rebuilds
+    a key (redis SET NX lock) while the others wait for it or keep serving the
+    stale value, and keys are refreshed early with a probability that grows as
+    they approach expiry.
+    """
+
+    lock_timeout = 10       # seconds a rebuild may hold the lock
+    lock_wait = 2           # seconds a request waits for another one to fill a cold key
+    lock_poll = 0.05
+    beta = 1.0              # > 1 favours earlier refreshes
+
+    def __init__(self, name, timeout=600, stale_timeout=None):
+        self.name = name
+        self.timeout = timeout
+        # how long a value may still be served after its timeout while it is rebuilt
+        self.stale_timeout = timeout if stale_timeout is None else stale_timeout
+
+    def key(self, *parts):
+        return ':'.join([self.name, *map(str, parts)])
+
+    def generation_key(self, scope=None):
+        return self.key('generation', scope) if scope is not None else self.key('generation')
+
+    def generation(self, scope=None):
+        return cache.get(self.generation_key(scope), 0)
+
+    def bump(self, scope=None):
+        key = self.generation_key(scope)
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+    def record(self, result, count=1):
+        if count:
+            CACHE_REQUESTS.labels(self.name, result).inc(count)
+
+    def get(self, key):
+        value = cache.get(key)
+        self.record('hit' if value is not None else 'miss')
+        return value
+
+    def get_many(self, keys):
+        values = cache.get_many(keys)
+        self.record('hit', len(values))
+        self.record('miss', len(keys) - len(values))
+        return values
+
+    def set(self, key, value):
+        cache.set(key, value, timeout=self.timeout)
+
+    def set_many(self, values):
+        if values:
+            cache.set_many(values, timeout=self.timeout)
+
+    def delete(self, *keys):
+        cache.delete_many(keys)
+
+    def lock_key(self, key):
+        return self.raw_key(f'{key}:lock')
+
+    def acquire(self, key):
+        """Take the rebuild lock of `key`, returns the token to release it with or None."""
+        token = uuid.uuid4().hex
+        if get_redis_connection('default').set(self.lock_key(key), token, nx=True, ex=self.lock_timeout):
+            return token
+        return None
+
+    def release(self, key, token):
+        redis = get_redis_connection('default')
+        redis.eval(RELEASE_LOCK_SCRIPT, 1, self.lock_key(key), token)
+
+    def wait_for(self, key):
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.lock_poll)
+            envelope = cache.get(key)
+            if envelope is not None:
+                return envelope
+        return None
+
+    def get_or_build(self, key, build, cache_if=None):
+        """
+        Return the cached value of `key`, calling `build()` to fill it when needed.
+        `cache_if(value)` can veto storing a freshly built value.
+        """
+        envelope = cache.get(key)
+
+        if envelope is not None:
+            # XFetch: refresh early with a probability that grows as expiry nears
+            # and with how long the value took to build
+            early = envelope['delta'] * self.beta * -math.log(1.0 - random.random())
+            if time.time() + early < envelope['expires']:
+                self.record('hit')
+                return envelope['value']
+            token = self.acquire(key)
+            if token is None:
+                # someone else is already rebuilding, serve what we have
+                self.record('stale')
+                return envelope['value']
+            self.record('refresh')
+        elif (token := self.acquire(key)) is not None:
+            self.record('miss')
+        else:
+            envelope = self.wait_for(key)
+            if envelope is not None:
+                self.record('hit')
+                return envelope['value']
+            # the other request is too slow, build without the lock
+            self.record('miss')
+            return build()
+
+        try:
+            start = time.time()
+            value = build()
+            delta = time.time() - start
+            if cache_if is None or cache_if(value):
+                cache.set(key, {
+                    'value':value,
+                    'expires':time.time() + self.timeout,
+                    'delta':delta,
+                }, timeout=self.timeout + self.stale_timeout)
+            return value
+        finally:
+            self.release(key, token)
+
+    # async counterparts of the read path, for the async views. They share keys and
+    # value encoding with django_redis, so sync writers and async readers see the same entries.
+
+    def raw_key(self, key):
+        return str(cache.client.make_key(key))
+
+    async def aget_raw(self, key):
+        value = await async_redis().get(self.raw_key(key))
+        return None if value is None else cache.client.decode(value)
+
+    async def aset_raw(self, key, value, timeout):
+        await async_redis().set(self.raw_key(key), cache.client.encode(value), ex=timeout)
+
+    async def ageneration(self, scope=None):
+        generation = await self.aget_raw(self.generation_key(scope))
+        return generation or 0
+
+    async def aget_many(self, keys):
+        raw = await async_redis().mget([self.raw_key(key) for key in keys]) if keys else []
+        values = {key: cache.client.decode(value) for key, value in zip(keys, raw) if value is not None}
+        self.record('hit', len(values))
+        self.record('miss', len(keys) - len(values))
+        return values
+
+    async def aset_many(self, values):
+        if values:
+            pipe = async_redis().pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.set(self.raw_key(key), cache.client.encode(value), ex=self.timeout)
+            await pipe.execute()
+
+    async def aacquire(self, key):
+        # same lock as acquire
+        token = uuid.uuid4().hex
+        if await async_redis().set(self.lock_key(key), token, nx=True, ex=self.lock_timeout):
+            return token
+        return None
+
+    async def arelease(self, key, token):
+        await async_redis().eval(RELEASE_LOCK_SCRIPT, 1, self.lock_key(key), token)
+
+    async def await_for(self, key):
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.lock_poll)
+            envelope = await self.aget_raw(key)
+            if envelope is not None:
+                return envelope
+        return None
+
+    async def aget_or_build(self, key, build, cache_if=None, envelope=UNREAD):
+        """
+        `get_or_build` with an async `build()`, waiting on redis without blocking the event loop.
+        Pass the `envelope` read with `aget_raw` when the caller fetched it alongside other lookups.
+        """
+        if envelope is UNREAD:
+            envelope = await self.aget_raw(key)
+
+        if envelope is not None:
+            early = envelope['delta'] * self.beta * -math.log(1.0 - random.random())
+            if time.time() + early < envelope['expires']:
+                self.record('hit')
+                return envelope['value']
+            token = await self.aacquire(key)
+            if token is None:
+                self.record('stale')
+                return envelope['value']
+            self.record('refresh')
+        elif (token := await self.aacquire(key)) is not None:
+            self.record('miss')
+        else:
+            envelope = await self.await_for(key)
+            if envelope is not None:
+                self.record('hit')
+                return envelope['value']
+            self.record('miss')
+            return await build()
+
+        try:
+            start = time.time()
+            value = await build()
+            delta = time.time() - start
+            if cache_if is None or cache_if(value):
+                await self.aset_raw(key, {
+                    'value':value,
+                    'expires':time.time() + self.timeout,
+                    'delta':delta,
+                }, timeout=self.timeout + self.stale_timeout)
+            return value
+        finally:
+            await self.arelease(key, token)
+
+
+class LocalLRUCache:
+    """
+    A small per-process LRU with a ttl, for hot keys where even a redis round trip is too slow.
+    Every worker process keeps its own copy, so only use it for data that may be `ttl` seconds stale.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                CACHE_REQUESTS.labels(self.name, 'hit').inc()
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+        CACHE_REQUESTS.labels(self.name, 'miss').inc()
+        return None
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_or_build(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.set(key, value)
+        return value
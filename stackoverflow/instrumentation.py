@@ -0,0 +1,157 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import Histogram
+from rest_framework import serializers
+
+from .slow_queries import record_slow_query
+
+
+# Where the time of a request goes, next to the per view latency django_prometheus reports.
+# Cache lookups per key family are counted by CACHE_REQUESTS in stackoverflow/caching.py.
+
+VIEW_DB_QUERIES = Histogram(
+    'stackoverflow_view_db_queries',
+    'Database queries run by one request, by view.',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+VIEW_DB_SECONDS = Histogram(
+    'stackoverflow_view_db_seconds',
+    'Time one request spent in database queries, by view.',
+    ['view'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+ELASTICSEARCH_SECONDS = Histogram(
+    'stackoverflow_elasticsearch_seconds',
+    'Elasticsearch round trips, by operation.',
+    ['operation'],
+    buckets=(.0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+SERIALIZER_SECONDS = Histogram(
+    'stackoverflow_serializer_seconds',
+    'Time to render a DRF serializer to primitive data, by serializer.',
+    ['serializer'],
+    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25),
+)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+# The request whose queries are being counted. Connections belong to a thread and the async
+# views query from sync_to_async threads, so the wrapper sits on every connection and finds
+# its request through this context variable, which sync_to_async carries into the thread.
+_recording = ContextVar('query_recording', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recording = _recording.get()
+    if recording is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        recording['queries'] += 1
+        recording['seconds'] += duration
+    # a query that raised is not logged as slow, nor run again under EXPLAIN ANALYZE
+    if duration >= recording['slow_query_seconds']:
+        record_slow_query(context['connection'], sql, params, many, duration, view_name(recording['request']))
+    return result
+
+
+def install_query_wrapper(sender, connection=None, **kwargs):
+    """
+    Put record_query on `connection`, or on every connection of the current thread. Runs on
+    request_started, which an ASGI request sends from the thread its sync_to_async calls use,
+    and on connection_created for connections opened elsewhere.
+    """
+    for conn in [connection] if connection is not None else connections.all():
+        if record_query not in conn.execute_wrappers:
+            conn.execute_wrappers.append(record_query)
+
+
+request_started.connect(install_query_wrapper, dispatch_uid='install_query_wrapper')
+connection_created.connect(install_query_wrapper, dispatch_uid='install_query_wrapper')
+
+
+class QueryMetricsMiddleware:
+    """
+    Counts and times the database queries of each request and records them under its view name,
+    queries slower than SLOW_QUERY_SECONDS also go to the slow query log.
+    Runs natively in both stacks so the async views are not pushed onto a thread for it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_query_seconds = settings.SLOW_QUERY_SECONDS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.recording(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.recording(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def recording(self, request):
+        recording = {'queries':0, 'seconds':0.0, 'request':request, 'slow_query_seconds':self.slow_query_seconds}
+        token = _recording.set(recording)
+        try:
+            yield
+        finally:
+            _recording.reset(token)
+
+        view = view_name(request)
+        VIEW_DB_QUERIES.labels(view).observe(recording['queries'])
+        VIEW_DB_SECONDS.labels(view).observe(recording['seconds'])
+
+
+class TimedListSerializer(serializers.ListSerializer):
+
+    @property
+    def data(self):
+        if hasattr(self, '_data'):
+            return super().data
+        with SERIALIZER_SECONDS.labels(type(self.child).__name__).time():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Records how long `.data` takes to render, for single objects and for `many=True`.
+    Nested serializers are rendered as part of their parent and are not recorded separately.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, 'Meta', None)
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        if hasattr(self, '_data'):
+            return super().data
+        with SERIALIZER_SECONDS.labels(type(self).__name__).time():
+            return super().data
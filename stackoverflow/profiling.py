@@ -0,0 +1,324 @@
+import asyncio
+import random
+import selectors
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import thread as futures_thread
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django_redis import get_redis_connection
+
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .caching import async_redis
+
+
+# A stack sampler for finding the hot Python frames of production requests.
+#
+# - One request: a staff user sends `X-Profile: 1` (or `?profile=1`). The collapsed stacks
+#   of the request are stored for PROFILE_TTL and the response carries `X-Profile-Id`, fetch
+#   them from /profiling/<id>/. With `X-Profile: collapsed` (or `?profile=collapsed`) the
+#   stacks replace the response body.
+# - Rolling: PROFILING_SAMPLE_RATE of all requests are sampled and their stacks summed in
+#   redis per PROFILING_WINDOW, /profiling/top/ and /profiling/stacks/ read the last
+#   PROFILING_WINDOWS windows.
+#
+# Collapsed stacks are one `frame;frame;frame count` line per stack, what flamegraph.pl,
+# speedscope and inferno read. A request that is not profiled costs one header lookup.
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_KEY = 'profiling:request:{}'
+PROFILE_TTL = 3600
+STACKS_KEY = 'profiling:stacks:{}'
+REQUESTS_KEY = 'profiling:requests:{}'
+PROFILE_MODES = {'1', 'collapsed'}
+# distinct stacks kept per window, the least sampled ones are dropped past it
+MAX_STACKS = 5000
+
+_labels = {}
+
+
+def frame_label(code, module):
+    label = _labels.get(code)
+    if label is None:
+        # co_qualname is new in python 3.11
+        label = _labels[code] = f'{module}.{getattr(code, "co_qualname", code.co_name)}'
+    return label
+
+
+def function_label(function):
+    return frame_label(function.__code__, function.__module__)
+
+
+# leaves of a thread waiting, for work in an executor or for I/O in the event loop, not time
+# spent on a request
+IDLE_FRAMES = {function_label(function) for function in [
+    futures_thread._worker,
+    asyncio.BaseEventLoop.run_forever,
+    *(getattr(selectors, name).select for name in
+      ('SelectSelector', 'PollSelector', 'EpollSelector', 'DevpollSelector', 'KqueueSelector')
+      if hasattr(selectors, name)),
+]}
+
+# a thread with this frame on its stack is running the sync part of an async request
+SYNC_TO_ASYNC_CODE = SyncToAsync.thread_handler.__code__
+
+
+def collapse(frame):
+    """`frame` and its callers as a collapsed stack, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code, frame.f_globals.get('__name__', '?')))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+def in_sync_to_async(frame):
+    while frame is not None:
+        if frame.f_code is SYNC_TO_ASYNC_CODE:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class StackSampler:
+    """
+    Records the stacks of `thread_ids` (every other thread when None) every `interval` seconds
+    from a background thread, the profiled code runs unmodified. With `sync_to_async_threads`, other
+    threads are recorded while they run a sync_to_async call.
+    """
+
+    def __init__(self, thread_ids=None, interval=0.002, sync_to_async_threads=False):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.sync_to_async_threads = sync_to_async_threads
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if (self.thread_ids is None or ident in self.thread_ids
+                        or (self.sync_to_async_threads and in_sync_to_async(frame))):
+                    stack = collapse(frame)
+                    if stack.rpartition(';')[2] not in IDLE_FRAMES:
+                        self.stacks[stack] += 1
+
+    def collapsed(self):
+        return format_collapsed(self.stacks.items())
+
+
+def format_collapsed(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks, key=lambda item: -item[1]))
+
+
+def top_functions(stacks, limit=30):
+    """Functions by samples spent in them (`self`) and in them or their callees (`total`)."""
+    own, total = Counter(), Counter()
+    for stack, count in stacks:
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [
+        {'function':function, 'self':own[function], 'total':total[function]}
+        for function, _ in own.most_common(limit)
+    ]
+
+
+def is_staff(request):
+    """Staff check ahead of DRF, by the admin session or the JWT of the request."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return False
+    return bool(authenticated and authenticated[0].is_staff)
+
+
+def current_window():
+    return int(time.time() // settings.PROFILING_WINDOW)
+
+
+def store_sample(sampler):
+    window = current_window()
+    expire = settings.PROFILING_WINDOW * (settings.PROFILING_WINDOWS + 1)
+    pipe = get_redis_connection('default').pipeline()
+    for stack, count in sampler.stacks.items():
+        pipe.zincrby(STACKS_KEY.format(window), count, stack)
+    pipe.zremrangebyrank(STACKS_KEY.format(window), 0, -MAX_STACKS - 1)
+    pipe.expire(STACKS_KEY.format(window), expire)
+    pipe.incr(REQUESTS_KEY.format(window))
+    pipe.expire(REQUESTS_KEY.format(window), expire)
+    pipe.execute()
+
+
+async def astore_sample(sampler):
+    # same keys as store_sample
+    window = current_window()
+    expire = settings.PROFILING_WINDOW * (settings.PROFILING_WINDOWS + 1)
+    pipe = async_redis().pipeline()
+    for stack, count in sampler.stacks.items():
+        pipe.zincrby(STACKS_KEY.format(window), count, stack)
+    pipe.zremrangebyrank(STACKS_KEY.format(window), 0, -MAX_STACKS - 1)
+    pipe.expire(STACKS_KEY.format(window), expire)
+    pipe.incr(REQUESTS_KEY.format(window))
+    pipe.expire(REQUESTS_KEY.format(window), expire)
+    await pipe.execute()
+
+
+def rolling_stacks():
+    """Stacks summed over the last PROFILING_WINDOWS windows and the number of requests sampled."""
+    redis = get_redis_connection('default')
+    window = current_window()
+    windows = range(window - settings.PROFILING_WINDOWS + 1, window + 1)
+    pipe = redis.pipeline()
+    for w in windows:
+        pipe.zrange(STACKS_KEY.format(w), 0, -1, withscores=True)
+        pipe.get(REQUESTS_KEY.format(w))
+    results = pipe.execute()
+
+    stacks, requests = Counter(), 0
+    for ranked, sampled in zip(results[::2], results[1::2]):
+        for stack, count in ranked:
+            stacks[stack.decode()] += int(count)
+        requests += int(sampled or 0)
+    return stacks, requests
+
+
+class ProfilingMiddleware:
+    """
+    Samples the stacks of requests a staff user asks to profile, and of a random
+    PROFILING_SAMPLE_RATE share of all requests.
+
+    Sync requests sample their own thread. Async requests sample the event loop thread and
+    the threads running sync_to_async calls, where their database work happens, so requests
+    running concurrently on the same event loop show up in the profile too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.interval = settings.PROFILING_INTERVAL
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def requested_mode(self, request):
+        mode = request.META.get(PROFILE_HEADER)
+        if mode is None and 'profile=' in request.META.get('QUERY_STRING', ''):
+            mode = request.GET.get('profile')
+        # X-Profile: 0 or ?profile=false is not a request to profile
+        return mode if mode in PROFILE_MODES else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        mode = self.requested_mode(request)
+        if mode and is_staff(request):
+            with StackSampler({threading.get_ident()}, self.interval) as sampler:
+                response = self.get_response(request)
+            return self.profiled_response(response, sampler, mode)
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            with StackSampler({threading.get_ident()}, self.interval) as sampler:
+                response = self.get_response(request)
+            store_sample(sampler)
+            return response
+
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        threads = {threading.get_ident()}
+        mode = self.requested_mode(request)
+        if mode and await sync_to_async(is_staff)(request):
+            with StackSampler(threads, self.interval, sync_to_async_threads=True) as sampler:
+                response = await self.get_response(request)
+            return await sync_to_async(self.profiled_response)(response, sampler, mode)
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            with StackSampler(threads, self.interval, sync_to_async_threads=True) as sampler:
+                response = await self.get_response(request)
+            await astore_sample(sampler)
+            return response
+
+        return await self.get_response(request)
+
+    def profiled_response(self, response, sampler, mode):
+        collapsed = sampler.collapsed()
+        if mode == 'collapsed':
+            response = HttpResponse(collapsed, content_type='text/plain; charset=utf-8')
+        else:
+            profile_id = uuid.uuid4().hex
+            get_redis_connection('default').set(PROFILE_KEY.format(profile_id), collapsed, ex=PROFILE_TTL)
+            response['X-Profile-Id'] = profile_id
+        response['X-Profile-Samples'] = str(sampler.samples)
+        return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def request_profile(request, profile_id):
+    collapsed = get_redis_connection('default').get(PROFILE_KEY.format(profile_id))
+    if collapsed is None:
+        return Response({
+            'status':status.HTTP_404_NOT_FOUND,
+            'message':'No profile found, they are kept for an hour.'
+        }, status.HTTP_404_NOT_FOUND)
+    return HttpResponse(collapsed, content_type='text/plain; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def rolling_top_functions(request):
+    stacks, requests = rolling_stacks()
+    limit = request.query_params.get('limit', '30')
+    limit = min(int(limit), 200) if limit.isdigit() else 30
+    return Response({
+        'status':status.HTTP_200_OK,
+        'message':'Hot functions of the sampled requests.',
+        'data':{
+            'sample_rate':settings.PROFILING_SAMPLE_RATE,
+            'requests':requests,
+            'samples':sum(stacks.values()),
+            'functions':top_functions(stacks.items(), limit),
+        }
+    }, status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def rolling_collapsed_stacks(request):
+    stacks, _ = rolling_stacks()
+    return HttpResponse(format_collapsed(stacks.items()), content_type='text/plain; charset=utf-8')
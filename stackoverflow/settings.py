@@ -69,6 +69,34 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+CELERY_BEAT_SCHEDULE = {
+    # move buffered question view hits from redis into postgres
+    'flush-question-views': {
+        'task': 'posts.tasks.flush_question_views',
+        'schedule': 30.0,
+    },
+    # safety net for search index updates whose scheduled flush was lost
+    'flush-search-index': {
+        'task': 'posts.tasks.flush_search_index',
+        'schedule': 60.0,
+    },
+    # fix any drift of Tag.question_count, e.g. after raw SQL or a lost signal
+    'reconcile-question-counts': {
+        'task': 'posts.tasks.reconcile_question_counts',
+        'schedule': 15 * 60.0,
+    },
+    # move queued reputation changes from redis into User.score
+    'apply-reputation': {
+        'task': 'posts.tasks.apply_reputation',
+        'schedule': 30.0,
+    },
+    # rescore the hot questions list
+    'refresh-hot-questions': {
+        'task': 'posts.tasks.refresh_hot_questions',
+        'schedule': 5 * 60.0,
+    },
+}
+
 EMAIL_BACKEND = 'users.backends.email_backend.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 465
@@ -102,11 +130,13 @@ SIMPLE_JWT = {
 
 MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
+    'stackoverflow.instrumentation.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'stackoverflow.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_prometheus.middleware.PrometheusAfterMiddleware',
@@ -132,6 +162,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'stackoverflow.wsgi.application'
 
+# 'asgi' when the site is served by stackoverflow.asgi, which routes the hot read endpoints to
+# posts/async_views.py. runserver and the other WSGI servers keep the sync views.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -225,6 +259,19 @@ ELASTICSEARCH_DSL={
     }
 }
 
+# index updates are queued and pushed in bulk by celery instead of inside the request
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'posts.indexing.QueuedSignalProcessor'
+
+
+# cached values are stored as zlib compressed JSON, see stackoverflow/cache_codecs.py
+CACHE_OPTIONS = {
+    'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+    'SERIALIZER': 'stackoverflow.cache_codecs.OrjsonSerializer',
+    'COMPRESSOR': 'stackoverflow.cache_codecs.FastZlibCompressor',
+}
+# part of every cache key, bump it whenever the stored format changes so old entries are ignored
+CACHE_VERSION = 2
+
 
 def get_redis_cache_config():
 
@@ -233,9 +280,8 @@ def get_redis_cache_config():
             'default': {
                 'BACKEND': 'django_redis.cache.RedisCache',
                 'LOCATION': 'redis://redis:6379/0',  # Redis container name is 'redis' in Docker
-                'OPTIONS': {
-                    'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-                }
+                'OPTIONS': CACHE_OPTIONS,
+                'VERSION': CACHE_VERSION,
             }
         }
     else:
@@ -243,14 +289,26 @@ def get_redis_cache_config():
             'default': {
                 'BACKEND': 'django_redis.cache.RedisCache',
                 'LOCATION': 'redis://127.0.0.1:6379/0',  # Localhost Redis
-                'OPTIONS': {
-                    'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-                }
+                'OPTIONS': CACHE_OPTIONS,
+                'VERSION': CACHE_VERSION,
             }
         }
     
 CACHES = get_redis_cache_config()
 
+
+# stack sampling of requests, see stackoverflow/profiling.py. Staff can always profile a single
+# request, PROFILING_SAMPLE_RATE is the share of all requests sampled for /profiling/top/
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', '0.002'))   # seconds between samples
+PROFILING_WINDOW = 600          # seconds summed into one redis key
+PROFILING_WINDOWS = 6           # windows /profiling/top/ reads, the last hour
+
+# queries of a request slower than this are logged, see stackoverflow/slow_queries.py
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.1'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0.1'))   # share re-run under EXPLAIN ANALYZE
+SLOW_QUERY_LOG_SIZE = 1000
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -264,5 +322,13 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'DEBUG',  # Change this to DEBUG for more verbose output
         },
+        'stackoverflow': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'posts': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
 }
@@ -0,0 +1,76 @@
+"""
+Production settings, used by the gunicorn entrypoint:
+
+    DJANGO_SETTINGS_MODULE=stackoverflow.settings_production gunicorn -c gunicorn.conf.py
+
+Everything not overridden here comes from settings.py.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, CACHES
+
+import os
+
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '127.0.0.1,localhost,web,web-production').split(',')
+
+# 'asgi' serves through uvicorn workers, where the async read views run on the event loop.
+# 'wsgi' serves through threaded sync workers with the sync versions of those views.
+SERVER_MODE = os.getenv('SERVER_MODE', 'asgi')
+
+
+# Database
+# Under asgi every request may run its sync code in a different thread, and a persistent
+# connection belongs to the thread that opened it, so they pile up instead of being reused.
+# A psycopg 3 pool per worker process is shared by all threads instead.
+# Under wsgi the worker threads are long lived and keep their connection for CONN_MAX_AGE.
+# Keep workers * DB_POOL_MAX_SIZE (or workers * threads) below postgres max_connections.
+
+if SERVER_MODE == 'asgi':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # seconds a request waits for a free connection before failing
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', '60'))
+    # a connection dropped by postgres or a failover is replaced instead of failing the request
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Redis
+# One pool per worker process shared by its threads. A blocking pool makes a burst wait
+# for a free connection instead of opening connections past what redis is sized for.
+
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+
+CACHES['default']['OPTIONS'].update({
+    'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
+    'CONNECTION_POOL_KWARGS': {
+        'max_connections': REDIS_MAX_CONNECTIONS,
+        # seconds to wait for a free connection
+        'timeout': 2,
+        'socket_connect_timeout': 2,
+        'socket_timeout': 2,
+        'retry_on_timeout': True,
+        'health_check_interval': 30,
+    },
+})
+
+# the redis.asyncio pool of the async views, one per worker event loop
+ASYNC_REDIS_POOL_CLASS = 'redis.asyncio.BlockingConnectionPool'
+ASYNC_REDIS_POOL_KWARGS = {
+    'max_connections': REDIS_MAX_CONNECTIONS,
+    'timeout': 2,
+    'socket_connect_timeout': 2,
+    'socket_timeout': 2,
+    'retry_on_timeout': True,
+    'health_check_interval': 30,
+}
+
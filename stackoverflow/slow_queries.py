@@ -0,0 +1,114 @@
+import json
+import logging
+import random
+import re
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django_redis import get_redis_connection
+from prometheus_client import Counter
+
+
+# Queries slower than SLOW_QUERY_SECONDS, recorded by QueryMetricsMiddleware with the view
+# and the project frames that ran them. A SLOW_QUERY_EXPLAIN_RATE share of the slow SELECTs
+# is run again under EXPLAIN (ANALYZE, BUFFERS) on postgres and the plan kept alongside.
+# The last SLOW_QUERY_LOG_SIZE entries live in redis, read them with
+# `python manage.py slow_queries`. Query parameters are not kept, they carry password hashes,
+# one time codes and emails, and the string literals of the plans are masked for the same reason.
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERIES_KEY = 'slow_queries'
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+SLOW_QUERIES = Counter(
+    'stackoverflow_slow_queries_total',
+    'Queries slower than SLOW_QUERY_SECONDS, by view.',
+    ['view'],
+)
+
+
+def project_stack():
+    """The frames of this project that led to the query, innermost last."""
+    base_dir = str(settings.BASE_DIR)
+    return [
+        f'{frame.filename[len(base_dir) + 1:]}:{frame.lineno} {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+        and not frame.filename.endswith(('slow_queries.py', 'instrumentation.py'))
+    ]
+
+
+def explain(connection, sql, params):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) plan of a SELECT, None when it cannot be taken. ANALYZE runs the
+    query a second time, the explain itself goes around the execute wrappers and is not counted.
+    """
+    # ANALYZE executes the statement, never run it on writes
+    if connection.vendor != 'postgresql' or sql.lstrip()[:6].upper() != 'SELECT':
+        return None
+    wrappers, connection.execute_wrappers = connection.execute_wrappers, []
+    try:
+        # a failed statement would abort the request's transaction, keep it in a savepoint
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.warning('Could not explain slow query: %s', e)
+        return None
+    finally:
+        connection.execute_wrappers = wrappers
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return redact(plan[0])
+
+
+def redact(plan):
+    """`plan` with its string literals, the parameters in conditions like `email = '...'`, masked."""
+    if isinstance(plan, dict):
+        return {key: redact(value) for key, value in plan.items()}
+    if isinstance(plan, list):
+        return [redact(value) for value in plan]
+    if isinstance(plan, str):
+        return STRING_LITERAL.sub("'?'", plan)
+    return plan
+
+
+def record_slow_query(connection, sql, params, many, duration, view):
+    SLOW_QUERIES.labels(view).inc()
+    logger.warning('Slow query, %.1f ms in %s: %s', duration * 1000, view, sql[:200])
+
+    plan = None
+    if not many and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE:
+        plan = explain(connection, sql, params)
+
+    entry = {
+        'at':time.time(),
+        'duration_ms':round(duration * 1000, 3),
+        'view':view,
+        'database':connection.alias,
+        'sql':sql,
+        'stack':project_stack(),
+        'plan':plan,
+    }
+    try:
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline()
+        pipe.lpush(SLOW_QUERIES_KEY, json.dumps(entry, default=str))
+        pipe.ltrim(SLOW_QUERIES_KEY, 0, settings.SLOW_QUERY_LOG_SIZE - 1)
+        pipe.execute()
+    except Exception as e:
+        # the log is best effort, the request goes on
+        logger.warning('Could not store slow query: %s', e)
+
+
+def slow_queries(limit=None):
+    """Logged slow queries, newest first."""
+    entries = get_redis_connection('default').lrange(SLOW_QUERIES_KEY, 0, -1 if limit is None else limit - 1)
+    return [json.loads(entry) for entry in entries]
+
+
+def clear_slow_queries():
+    get_redis_connection('default').delete(SLOW_QUERIES_KEY)
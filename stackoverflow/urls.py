@@ -12,6 +12,8 @@ from rest_framework_simplejwt.views import (
 
 from django_prometheus import exports
 
+from .profiling import request_profile, rolling_top_functions, rolling_collapsed_stacks
+
 schema_view = get_schema_view(
    openapi.Info(
       title="Stackoverflow clone",
@@ -30,6 +32,10 @@ urlpatterns = [
     path('login/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('login/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
+    path('profiling/top/', rolling_top_functions, name='profiling_top'),
+    path('profiling/stacks/', rolling_collapsed_stacks, name='profiling_stacks'),
+    path('profiling/<str:profile_id>/', request_profile, name='request_profile'),
+
     path('', schema_view.with_ui('swagger'), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc'), name='schema-redoc'),
 
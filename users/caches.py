@@ -0,0 +1,4 @@
+from stackoverflow.caching import CacheFamily
+
+
+users_cache = CacheFamily('all_users')
@@ -2,7 +2,9 @@ from rest_framework import serializers
 from .models import User
 from django.db import transaction
 
-class UserSerializer(serializers.ModelSerializer):
+from stackoverflow.instrumentation import TimedSerializerMixin
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = ['otp', 'password', 'groups', 'user_permissions']
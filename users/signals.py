@@ -3,7 +3,7 @@ from django.dispatch import receiver
 
 from django.utils import timezone
 from .models import User
-from django.core.cache import cache
+from .caches import users_cache
 from django.db import transaction
 
 
@@ -24,9 +24,9 @@ def calculate_age(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def clear_user_cache_on_create(sender, instance, created, **kwargs):
     if created:
-        cache.delete('all_users')
+        users_cache.delete(users_cache.key())
 
 @receiver(post_delete, sender=User)
 def clear_user_cache_on_delete(sender, instance, **kwargs):
-    cache.delete('all_users')
+    users_cache.delete(users_cache.key())
 
@@ -10,7 +10,7 @@ from .serializers import UserSerializer, CreateUpdateSerializer, VerifyEmailSeri
 from .models import User
 from .pagination import CustomPagination
 
-from django.core.cache import cache
+from .caches import users_cache
 
 from django.db import transaction
 
@@ -40,16 +40,12 @@ def current_user(request):
 @permission_classes([IsAdminUser])
 def all_users(request):
 
-    cached_users = cache.get('all_users')
-
-    if not cached_users:
+    def build_users():
         users = User.objects.all().order_by('created_at')
-        serializer = UserSerializer(users, many=True)
-        cache.set('all_users', serializer.data, timeout=600)
-        data = serializer.data
-    else:
-        data = cached_users
-    
+        return UserSerializer(users, many=True).data
+
+    data = users_cache.get_or_build(users_cache.key(), build_users)
+
     paginator = CustomPagination()
     result_page = paginator.paginate_queryset(data, request)
     return paginator.get_paginated_response({